@@ -12,10 +12,40 @@
 #include <esp_now.h>
 #include <WiFi.h>
 
-// REPLACE WITH YOUR RECEIVER MAC Address
-uint8_t broadcastAddress[] = {0x80, 0x7D, 0x3A, 0xF0, 0x8B, 0x88};
-
-byte receivedData[8];
+// REPLACE WITH YOUR RECEIVER MAC Addresses, indexed by the fleet address of the tank
+// (see model/fleet.py). Frames without an address go to the first one.
+uint8_t peerAddresses[][6] = {
+  {0x80, 0x7D, 0x3A, 0xF0, 0x8B, 0x88},
+};
+const int PEER_COUNT = sizeof(peerAddresses) / sizeof(peerAddresses[0]);
+
+// Framing of the serial messages, must match model/protocol.py:
+// 0xAA 0x55 LEN SEQ PAYLOAD[LEN] CRC16_HI CRC16_LO
+const byte SYNC_0 = 0xAA;
+const byte SYNC_1 = 0x55;
+const int MAX_PAYLOAD = 32;
+const int MESSAGE_SIZE = 6;
+const int ADDRESSED_MESSAGE_SIZE = MESSAGE_SIZE + 1;
+
+enum ParserState { WAIT_SYNC_0, WAIT_SYNC_1, READ_LEN, READ_SEQ, READ_PAYLOAD, READ_CRC_HI, READ_CRC_LO };
+
+ParserState parserState = WAIT_SYNC_0;
+byte frameLen = 0;
+byte frameSeq = 0;
+byte framePos = 0;
+uint16_t frameCrc = 0;
+byte framePayload[MAX_PAYLOAD];
+
+// Statistics of the serial link
+byte expectedSeq = 0;
+bool seqKnown = false;
+unsigned long framesLost = 0;
+unsigned long crcErrors = 0;
+unsigned long unknownAddresses = 0;
+
+// Uncomment to also print every successful send. At 9600 baud the prints of every frame
+// exceed what the link carries, so Serial.print blocks the loop and delays the frames.
+// #define DEBUG_SEND
 
 const int ledPin = 32; // LED connected to digital pin 32
 
@@ -33,10 +63,80 @@ struct_message myData;
 
 esp_now_peer_info_t peerInfo;
 
+// CRC-16/CCITT-FALSE, updated one byte at a time
+uint16_t crc16Update(uint16_t crc, byte data) {
+  crc ^= (uint16_t)data << 8;
+  for (int i = 0; i < 8; i++) {
+    crc = (crc & 0x8000) ? (crc << 1) ^ 0x1021 : crc << 1;
+  }
+  return crc;
+}
+
+// Feed one byte into the frame parser, returns true when a valid frame is complete.
+// On a wrong length or checksum the parser starts searching for the next sync header.
+bool parseByte(byte b) {
+  switch (parserState) {
+    case WAIT_SYNC_0:
+      if (b == SYNC_0) parserState = WAIT_SYNC_1;
+      break;
+    case WAIT_SYNC_1:
+      if (b == SYNC_1) parserState = READ_LEN;
+      else if (b != SYNC_0) parserState = WAIT_SYNC_0;
+      break;
+    case READ_LEN:
+      if (b > MAX_PAYLOAD) {
+        crcErrors++;
+        parserState = (b == SYNC_0) ? WAIT_SYNC_1 : WAIT_SYNC_0;
+        break;
+      }
+      frameLen = b;
+      frameCrc = crc16Update(0xFFFF, b);
+      parserState = READ_SEQ;
+      break;
+    case READ_SEQ:
+      frameSeq = b;
+      frameCrc = crc16Update(frameCrc, b);
+      framePos = 0;
+      parserState = frameLen ? READ_PAYLOAD : READ_CRC_HI;
+      break;
+    case READ_PAYLOAD:
+      framePayload[framePos++] = b;
+      frameCrc = crc16Update(frameCrc, b);
+      if (framePos == frameLen) parserState = READ_CRC_HI;
+      break;
+    case READ_CRC_HI:
+      if (b == (frameCrc >> 8)) {
+        parserState = READ_CRC_LO;
+      } else {
+        crcErrors++;
+        parserState = (b == SYNC_0) ? WAIT_SYNC_1 : WAIT_SYNC_0;
+      }
+      break;
+    case READ_CRC_LO:
+      parserState = WAIT_SYNC_0;
+      if (b == (frameCrc & 0xFF)) {
+        if (seqKnown) framesLost += (byte)(frameSeq - expectedSeq);
+        expectedSeq = frameSeq + 1;
+        seqKnown = true;
+        return true;
+      }
+      crcErrors++;
+      if (b == SYNC_0) parserState = WAIT_SYNC_1;
+      break;
+  }
+  return false;
+}
+
 // callback when data is sent
 void OnDataSent(const uint8_t *mac_addr, esp_now_send_status_t status) {
-  Serial.print("\r\nLast Packet Send Status:\t");
-  Serial.println(status == ESP_NOW_SEND_SUCCESS ? "Delivery Success" : "Delivery Fail");
+  if (status != ESP_NOW_SEND_SUCCESS) {
+    Serial.println("Delivery Fail");
+  }
+#ifdef DEBUG_SEND
+  else {
+    Serial.println("Delivery Success");
+  }
+#endif
 }
  
 void setup() {
@@ -59,26 +159,40 @@ void setup() {
   // get the status of Transmitted packet
   esp_now_register_send_cb(OnDataSent);
   
-  // Register peer
-  memcpy(peerInfo.peer_addr, broadcastAddress, 6);
+  // Register peers
   peerInfo.channel = 0;  
   peerInfo.encrypt = false;
-  
-  // Add peer        
-  if (esp_now_add_peer(&peerInfo) != ESP_OK){
-    Serial.println("Failed to add peer");
-    return;
+  for (int i = 0; i < PEER_COUNT; i++) {
+    memcpy(peerInfo.peer_addr, peerAddresses[i], 6);
+
+    // Add peer        
+    if (esp_now_add_peer(&peerInfo) != ESP_OK){
+      Serial.println("Failed to add peer");
+      return;
+    }
   }
 }
  
 void loop() {
-   // Create an array to hold the received bytes
-  if (Serial.available() >= 6) {
-    // Read the 8 bytes into the array
-    for (int i = 0; i < 6; i++) {
-        receivedData[i] = Serial.read();
+  // Read everything that arrived, every complete and valid frame is forwarded to its tank
+  while (Serial.available() > 0) {
+    if (!parseByte(Serial.read())) {
+      continue;
+    }
+    if (frameLen == MESSAGE_SIZE) {
+      forwardMessage(0, framePayload);
+    } else if (frameLen == ADDRESSED_MESSAGE_SIZE) {
+      forwardMessage(framePayload[0], framePayload + 1);
     }
   }
+}
+
+// Send one message of the serial link to the tank with the given address
+void forwardMessage(byte address, const byte *receivedData) {
+  if (address >= PEER_COUNT) {
+    unknownAddresses++;
+    return;
+  }
 
   int left = receivedData[1];
   if (!receivedData[0]) {
@@ -117,12 +231,14 @@ void loop() {
   }
   
   // Send message via ESP-NOW
-  esp_err_t result = esp_now_send(broadcastAddress, (uint8_t *) &myData, sizeof(myData));
+  esp_err_t result = esp_now_send(peerAddresses[address], (uint8_t *) &myData, sizeof(myData));
    
-  if (result == ESP_OK) {
-    Serial.println("Sent with success");
+  if (result != ESP_OK) {
+    Serial.println("Error sending the data");
   }
+#ifdef DEBUG_SEND
   else {
-    Serial.println("Error sending the data");
+    Serial.println("Sent with success");
   }
+#endif
 }
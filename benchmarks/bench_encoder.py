@@ -0,0 +1,68 @@
+"""Microbenchmark of the frame encoding done for every frame sent to the antenna.
+
+Compares the previous path (dictionary from Tank.get_values, list of ints,
+float_to_int_255 and a new bytes object per frame) with TankFrameEncoder,
+which packs the values into a preallocated buffer.
+
+Typical usage:
+
+    python -m benchmarks.bench_encoder
+"""
+
+import timeit
+
+from model.communication import TankFrameEncoder, float_to_int_255
+from model.protocol import encode_frame
+from model.tank import Tank
+
+
+def legacy_frame(tank: Tank, seq: int) -> bytes:
+    """Encode a frame the way print_data did before TankFrameEncoder.
+
+    Args:
+        tank (Tank): The tank whose values are sent.
+        seq (int): The sequence number of the frame.
+
+    Returns:
+        bytes: The complete frame.
+    """
+    tank_values = tank.get_values()
+    byte_msg = []
+
+    left_sign = 0 if tank_values["left_motor"] < 0 else 1
+    right_sign = 0 if tank_values["right_motor"] < 0 else 1
+
+    byte_msg.append(left_sign)
+    byte_msg.append(float_to_int_255(abs(tank_values["left_motor"])))
+
+    byte_msg.append(right_sign)
+    byte_msg.append(float_to_int_255(abs(tank_values["right_motor"])))
+
+    byte_msg.append(tank_values["light"])
+    byte_msg.append(tank_values["water"])
+    return encode_frame(seq, bytes(byte_msg))
+
+
+def main(number: int = 200000) -> None:
+    """Run both encoders and print the time per frame.
+
+    Args:
+        number (int): The number of frames encoded by each encoder.
+    """
+    tank = Tank()
+    tank.update(left=0.73, right=-0.41, light=1)
+
+    encoder = TankFrameEncoder()
+    if bytes(encoder.encode(tank.state, 7)) != legacy_frame(tank, 7):
+        raise RuntimeError("Encoders produce different frames")
+
+    legacy = min(timeit.repeat(lambda: legacy_frame(tank, 7), number=number, repeat=5)) / number
+    current = min(timeit.repeat(lambda: encoder.encode(tank.state, 7), number=number, repeat=5)) / number
+
+    print(f"legacy path:      {legacy * 1e9:8.0f} ns/frame")
+    print(f"TankFrameEncoder: {current * 1e9:8.0f} ns/frame")
+    print(f"speedup:          {legacy / current:8.2f}x")
+
+
+if __name__ == "__main__":
+    main()
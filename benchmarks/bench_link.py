@@ -0,0 +1,64 @@
+"""Benchmark of the serial link against the simulated tank.
+
+Runs SerialMessenger.transmit_on_change against a VirtualTank and measures
+the time from Tank.update() until the simulator decoded the frame, and the
+number of frames per second it receives. A pseudo-terminal ignores the baud
+rate, so the numbers show the cost of the software path only. The messenger
+paces motion frames to the link capacity of its baud rate, which is set high
+enough not to limit the frame rate.
+
+Typical usage:
+
+    python -m benchmarks.bench_link
+"""
+
+import threading
+import time
+
+from model.communication import SerialMessenger
+from model.latency import LatencyHistogram
+from model.simulator import VirtualTank
+
+
+def main(updates: int = 2000, max_rate: float = 1000.0) -> None:
+    """Send the given number of changes and print latency and throughput.
+
+    Args:
+        updates (int): The number of tank changes sent.
+        max_rate (float): The maximum frame rate of the messenger.
+    """
+    histogram = LatencyHistogram()
+    received = threading.Event()
+    sent_at = {}
+
+    def on_frame(now, frame):
+        left = frame.payload[1]
+        if left in sent_at:
+            histogram.record(now - sent_at.pop(left))
+            received.set()
+
+    with VirtualTank(loss=0.0) as tank:
+        tank.on_frame = on_frame
+        comms = SerialMessenger(tank.port, baud_rate=921600, max_rate=max_rate, keepalive=1.0)
+        threading.Thread(target=comms.transmit_on_change, daemon=True).start()
+
+        start = time.monotonic()
+        for i in range(updates):
+            speed = (i % 255 + 1) / 255
+            received.clear()
+            sent_at[round(speed * 255)] = time.monotonic()
+            comms.tank.update(left=speed)
+            received.wait(1.0)
+        elapsed = time.monotonic() - start
+
+        stats = tank.stats()
+        comms.close_serial()
+
+    print(f"frames received:   {stats['frames']} ({stats['frames'] / elapsed:.0f} per second)")
+    print(f"update to decode:  p50 {histogram.percentile(50) * 1e3:.3f} ms, "
+          f"p99 {histogram.percentile(99) * 1e3:.3f} ms, max {histogram.maximum * 1e3:.3f} ms")
+    print(f"crc errors / lost: {stats['crc_errors']} / {stats['lost']}")
+
+
+if __name__ == "__main__":
+    main()
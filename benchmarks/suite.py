@@ -0,0 +1,311 @@
+"""Benchmark suite of the control hot paths with stored baselines.
+
+Every case measures one operation on the way from the gamepad to the serial
+port or the screen and reports the best time per operation out of several
+runs. The results are compared with benchmarks/baseline.json; a case slower
+than its baseline by more than the threshold counts as a regression and makes
+the suite exit with status 1. The Qt cases run on the offscreen platform.
+
+Baselines are machine specific, record them on the machine that runs the
+comparison.
+
+Typical usage:
+
+    python -m benchmarks                     # compare with the baseline
+    python -m benchmarks --update-baseline   # store the current results
+    python -m benchmarks -k tank --threshold 0.5
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import timeit
+from typing import Callable, Dict, List
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+# pylint: disable=wrong-import-position
+from controller.evdev_reader import EvdevEvent
+from controller.gamepad import XboxController
+from controller.roles import RoleMapping
+from controller.session import SessionLog, SessionPlayer
+from controller.shaping import InputShaper, steering
+from model.communication import TankFrameEncoder, float_to_byte, float_to_int_255
+from model.flight_recorder import FlightRecorder
+from model.tank import Tank
+
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), "baseline.json")
+DEFAULT_THRESHOLD = 0.25
+
+CASES: Dict[str, Callable[[], Callable[[], object]]] = {}
+
+
+def benchmark(name: str):
+    """Register a case. The decorated function does the setup and returns the operation to time.
+
+    Args:
+        name (str): The name of the case in the report and the baseline.
+    """
+    def register(setup: Callable[[], Callable[[], object]]):
+        CASES[name] = setup
+        return setup
+    return register
+
+
+def qt_application():
+    """Get the QApplication, created on first use."""
+    from PySide6.QtWidgets import QApplication  # pylint: disable=import-outside-toplevel
+    return QApplication.instance() or QApplication([])
+
+
+@benchmark("steering")
+def _steering():
+    return lambda: steering(0.3, -0.7)
+
+
+@benchmark("input_shaper")
+def _input_shaper():
+    shaper = InputShaper(expo=0.3)
+    return lambda: shaper.motors(9830, -22937)
+
+
+@benchmark("float_to_byte")
+def _float_to_byte():
+    return lambda: float_to_byte(-0.42)
+
+
+@benchmark("float_to_int_255")
+def _float_to_int_255():
+    return lambda: float_to_int_255(0.42)
+
+
+@benchmark("tank_setters")
+def _tank_setters():
+    tank = Tank()
+    flip = [0.25]
+
+    def operation():
+        flip[0] = -flip[0]
+        tank.left = flip[0]
+        tank.right = -flip[0]
+    return operation
+
+
+@benchmark("tank_update")
+def _tank_update():
+    tank = Tank()
+    flip = [0.25]
+
+    def operation():
+        flip[0] = -flip[0]
+        tank.update(left=flip[0], right=-flip[0])
+    return operation
+
+
+@benchmark("tank_get_values")
+def _tank_get_values():
+    tank = Tank()
+    tank.update(left=0.5, right=-0.5, light=1)
+    return tank.get_values
+
+
+@benchmark("frame_encoding")
+def _frame_encoding():
+    tank = Tank()
+    tank.update(left=0.73, right=-0.41, light=1)
+    encoder = TankFrameEncoder()
+    return lambda: encoder.encode(tank.state, 7)
+
+
+@benchmark("flight_recorder_record")
+def _flight_recorder_record():
+    tank = Tank()
+    tank.update(left=0.73, right=-0.41, light=1)
+    frame = TankFrameEncoder().encode(tank.state, 7)
+    recorder = FlightRecorder(os.path.join(tempfile.mkdtemp(), "bench.fkfr"), capacity=4096)
+    return lambda: recorder.record(7, frame)
+
+
+def _gamepad_frames(devices: List[str]) -> List[List[EvdevEvent]]:
+    return [
+        [EvdevEvent("Absolute", "ABS_X", state, 0.0, device),
+         EvdevEvent("Absolute", "ABS_Y", -state, 0.0, device),
+         EvdevEvent("Sync", "SYN_REPORT", 0, 0.0, device)]
+        for state in (4000, 8000, 16000, 32000) for device in devices
+    ]
+
+
+@benchmark("gamepad_dispatch")
+def _gamepad_dispatch():
+    qt_application()
+    gamepad = XboxController(reader=SessionPlayer(SessionLog(), speed=0))
+    gamepad.stop()  # The events are processed by the benchmark instead of the reader thread
+    frames = _gamepad_frames([SessionPlayer.DEVICE])
+    index = [0]
+
+    def operation():
+        index[0] = (index[0] + 1) % len(frames)
+        gamepad._process_events(frames[index[0]])  # pylint: disable=protected-access
+    return operation
+
+
+@benchmark("gamepad_dispatch_two_gamepads")
+def _gamepad_dispatch_two_gamepads():
+    qt_application()
+    # Both gamepads drive, so every frame is merged by priority
+    gamepad = XboxController(reader=SessionPlayer(SessionLog(), speed=0), roles=RoleMapping.parse(["drive", "drive"]))
+    gamepad.stop()
+    frames = _gamepad_frames([SessionPlayer.DEVICE, "second"])
+    index = [0]
+
+    def operation():
+        index[0] = (index[0] + 1) % len(frames)
+        gamepad._process_events(frames[index[0]])  # pylint: disable=protected-access
+    return operation
+
+
+@benchmark("window_show_state")
+def _window_show_state():
+    qt_application()
+    from view.window import Window  # pylint: disable=import-outside-toplevel
+    from view.view_state import ViewState  # pylint: disable=import-outside-toplevel
+    window = Window()
+    window.show()
+    position = [0.5]
+
+    def operation():
+        position[0] = -position[0]
+        window.show_state(ViewState(drive=(position[0], 0.3), tower=(0.3, position[0])))
+    return operation
+
+
+@benchmark("window_refresh")
+def _window_refresh():
+    qt_application()
+    from view.window import Window  # pylint: disable=import-outside-toplevel
+    from view.view_state import ViewState  # pylint: disable=import-outside-toplevel
+    window = Window()
+    window.show()
+    position = [0.5]
+
+    def operation():
+        position[0] = -position[0]
+        window.show_state(ViewState(drive=(position[0], 0.3), tower=(0.3, position[0])))
+        window.refresh()
+    return operation
+
+
+@benchmark("joystick_repaint")
+def _joystick_repaint():
+    application = qt_application()
+    from view.joystick import QJoystick  # pylint: disable=import-outside-toplevel
+    joystick = QJoystick()
+    joystick.resize(150, 150)
+    joystick.show()
+    application.processEvents()  # Expose the widget, otherwise repaint() paints nothing
+    position = [0.5]
+
+    def operation():
+        position[0] = -position[0]
+        joystick.set_joystick_position(position[0], 0.3)
+        joystick.repaint()
+    return operation
+
+
+@benchmark("rotation_widget_repaint")
+def _rotation_widget_repaint():
+    application = qt_application()
+    from view.rotation_widget import RotationWidget  # pylint: disable=import-outside-toplevel
+    widget = RotationWidget()
+    widget.resize(150, 150)
+    widget.show()
+    application.processEvents()  # Expose the widget, otherwise repaint() paints nothing
+    position = [0.5]
+
+    def operation():
+        position[0] = -position[0]
+        widget.set_joystick_position(position[0], 0.3)
+        widget.repaint()
+    return operation
+
+
+def measure(operation: Callable[[], object], repeat: int = 5) -> float:
+    """Time an operation.
+
+    Args:
+        operation (Callable[[], object]): The operation to time.
+        repeat (int): The number of runs of at least 0.2 seconds, the fastest one is reported.
+
+    Returns:
+        float: The time per operation in seconds.
+    """
+    timer = timeit.Timer(operation)
+    number, _ = timer.autorange()
+    return min(timer.repeat(repeat=repeat, number=number)) / number
+
+
+def load_baseline(path: str) -> Dict[str, float]:
+    """Read the stored baseline.
+
+    Args:
+        path (str): The path of the baseline file.
+
+    Returns:
+        Dict[str, float]: The time per operation in seconds of every case, empty if there is none.
+    """
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def main() -> int:
+    """Run the selected cases, print the report and compare with the baseline.
+
+    Returns:
+        int: 1 if a case regressed, otherwise 0.
+    """
+    parser = argparse.ArgumentParser(description="Benchmark the control hot paths.")
+    parser.add_argument("-k", dest="pattern", default="", help="only run cases containing this text")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help="allowed slowdown relative to the baseline (default 0.25)")
+    parser.add_argument("--baseline", default=BASELINE_PATH, help="path of the baseline file")
+    parser.add_argument("--update-baseline", action="store_true", help="store the results as the new baseline")
+    args = parser.parse_args()
+
+    baseline = load_baseline(args.baseline)
+    results = {}
+    regressions = []
+
+    print(f"{'case':<26} {'ns/op':>10} {'baseline':>10} {'change':>8}")
+    for name, setup in CASES.items():
+        if args.pattern not in name:
+            continue
+        results[name] = measure(setup())
+        line = f"{name:<26} {results[name] * 1e9:>10.0f}"
+        if name in baseline:
+            change = results[name] / baseline[name] - 1
+            line += f" {baseline[name] * 1e9:>10.0f} {change:>+8.1%}"
+            if change > args.threshold:
+                regressions.append(name)
+                line += "  REGRESSION"
+        print(line)
+
+    if args.update_baseline:
+        baseline.update(results)
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(baseline, f, indent=2, sort_keys=True)
+        print(f"Baseline written to {args.baseline}")
+        return 0
+
+    if regressions:
+        print(f"Regressions above {args.threshold:.0%}: {', '.join(regressions)}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
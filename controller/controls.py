@@ -12,35 +12,30 @@ Typical usage example:
     controls.window.show()
 """
 
-import json
-import math
 import sys
 import threading
-from datetime import datetime, timedelta
+from typing import Optional
 
 import inputs
 from PySide6 import QtCore
-from PySide6.QtCore import QObject
+from PySide6.QtCore import QObject, QTimer
+from PySide6.QtGui import QKeySequence, QShortcut
+from PySide6.QtWidgets import QApplication
 
 from model.communication import SerialMessenger
+from model.discovery import PortCache, PortDiscovery, StartupTimer
+from model.fleet import Fleet, FleetTransmitter
+from model.flight_recorder import FLIGHT_RECORDER_PATH, open_flight_recorder
+from model.link import LinkSupervisor, PortFingerprint
+from model.latency import InputStamp, LatencyTracker
+from model.profiler import PROFILE_PATH, SamplingProfiler
+from model.watchdog import DEFAULT_RAMP, DEFAULT_TIMEOUT, Watchdog
+from view.view_state import ViewState
 from view.window import Window
 from .gamepad import XboxController
-
-
-def steering(x, y):
-    # Calculate initial motor speeds
-    left_speed = y + x
-    right_speed = y - x
-
-    # Find the maximum absolute value among the speeds
-    max_speed = max(abs(left_speed), abs(right_speed))
-
-    # Normalize the speeds if necessary
-    if max_speed > 1:
-        left_speed /= max_speed
-        right_speed /= max_speed
-
-    return left_speed, right_speed
+from .roles import RoleMapping
+from .session import SessionRecorder
+from .shaping import InputShaper
 
 
 class Controls(QObject):
@@ -51,39 +46,111 @@ class Controls(QObject):
 
     Attributes:
         window: The main application window.
+        fleet: The Fleet of tanks driven over the antenna.
+        tank: The Tank of the fleet driven by the gamepad.
+        transmitter: The FleetTransmitter sharing the link between several tanks, None for a single tank.
+        startup: The StartupTimer measuring the startup up to the first command sent.
         comms: An instance of SerialMessenger for serial communication.
         gamepad: An instance of XboxController for handling gamepad inputs.
+        supervisor: A LinkSupervisor running the transmission and reconnecting the antenna.
         send: A threading.Thread for handling background serial communication.
+        latency: A LatencyTracker shared by the gamepad and the messenger.
+        shaper: The InputShaper turning the left stick into motor values.
+        status_timer: A QTimer refreshing the latency shown in the status bar.
+        view_state: The ViewState last handed to the window.
+        view_updates: The number of ViewStates handed to the window.
+        profiler: The SamplingProfiler of all threads, toggled with PROFILE_SHORTCUT.
+        profile_path: The file the collapsed stacks are written to when profiling stops.
+        PROFILE_SHORTCUT: The key sequence starting and stopping the profiler.
+        heartbeats: The number of heartbeats of the GUI thread, not counted while a modal dialog is open.
+        heartbeat_timer: The QTimer beating every HEARTBEAT_INTERVAL milliseconds.
+        watchdog: The Watchdog stopping the tanks when the gamepad reader or the GUI stalls,
+            None if disabled.
+        HEARTBEAT_INTERVAL: The interval of the heartbeats in milliseconds.
     """
 
+    PROFILE_SHORTCUT = "Ctrl+Shift+P"
+    HEARTBEAT_INTERVAL = 50
+
     _instance = None
 
+    linkChanged = QtCore.Signal(str)
+    failsafeChanged = QtCore.Signal(str)
+
     def __new__(cls, *args, **kwargs):
         if cls._instance is None:
             cls._instance = super().__new__(cls, *args, **kwargs)
         return cls._instance
 
-    def __init__(self) -> None:
+    def __init__(self, reader=None, recorder: Optional[SessionRecorder] = None,
+                 startup: Optional[StartupTimer] = None, tanks: int = 1,
+                 roles: Optional[RoleMapping] = None, flight_recorder: Optional[str] = FLIGHT_RECORDER_PATH,
+                 profile: Optional[str] = None, failsafe_timeout: float = DEFAULT_TIMEOUT,
+                 failsafe_ramp: float = DEFAULT_RAMP, shaper: Optional[InputShaper] = None) -> None:
         """Initializes the Controls class, setting up the window, ports, gamepad, and communication.
         Connects the signals with the according slots.
+
+        Args:
+            reader: An object with the interface of an EvdevReader, e.g. a SessionPlayer,
+                to read the events from instead of the gamepads.
+            recorder (Optional[SessionRecorder]): A recorder all gamepad events are added to.
+            startup (Optional[StartupTimer]): The timer of the startup phases, started now by default.
+            tanks (int): The number of tanks driven over the antenna (default is 1).
+            roles (Optional[RoleMapping]): The roles of the gamepads, the default mapping by default.
+            flight_recorder (Optional[str]): The ring file keeping every frame sent, None to keep none.
+            profile (Optional[str]): The file of the collapsed stacks to profile from the start,
+                by default the profiler only runs when toggled with PROFILE_SHORTCUT.
+            failsafe_timeout (float): The time in seconds the gamepad reader or the GUI may stall
+                before the tanks are stopped, 0 to disable the watchdog.
+            failsafe_ramp (float): The time in seconds the motors are ramped down in.
+            shaper (Optional[InputShaper]): The deadzone, expo and trims of the left stick,
+                by default a linear response with the deadzone of the gamepad.
         """
         super().__init__()
 
+        self.startup = startup or StartupTimer()
+        discovery = PortDiscovery()
+        discovery.start()
+
         self.window = Window()
+        self.startup.mark("window")
 
-        port = self.check_previous_ports() or self.window.handle_port_selection_dialog()
-        if not port:
-            sys.exit()
+        self.fleet = Fleet(tanks)
+        self.tank = self.fleet.active_tank
+        self.latency = LatencyTracker()
 
-        self.save_ports_to_json(port)
+        fingerprint = self.select_port(discovery)
+        self.startup.mark("port_selection")
 
-        if not inputs.devices.gamepads:
+        if reader is None and not inputs.devices.gamepads:
             self.window.critical_dialog("No Gamepad Connected", "You did not connect any Gamepad")
             sys.exit()
 
-        self.comms = SerialMessenger(port, baud_rate=9600)
+        self.comms = SerialMessenger(fingerprint.device, baud_rate=9600, max_rate=50.0, keepalive=1.0,
+                                     latency=self.latency, tank=self.tank,
+                                     recorder=open_flight_recorder(flight_recorder))
+        # A single tank keeps the unaddressed frames understood by every antenna firmware
+        self.transmitter = FleetTransmitter(self.comms, self.fleet) if tanks > 1 else None
+        self.supervisor = LinkSupervisor(self.comms, fingerprint=fingerprint, on_status=self.linkChanged.emit,
+                                         transmit=self.transmitter.run if self.transmitter else None)
+        self.linkChanged.connect(self.link_changed)
+
+        # The tank is stopped until the first input, so the link can start before the gamepad
+        self.send = threading.Thread(target=self.supervisor.run, name="serial", daemon=True)
+        self.send.start()
+        self.startup.mark("serial_open")
 
-        self.gamepad = XboxController()
+        self.shaper = shaper or InputShaper(deadzone=XboxController.DEADZONE)
+        self.startup.mark("input_shaper")
+
+        self.view_updates = 0
+        self.view_state = ViewState(link=self.supervisor.status)
+        self.window.show_state(self.view_state)
+        self.window.set_tanks(self.fleet.names)
+        self.window.tank_selector.currentIndexChanged.connect(self.select_tank)
+
+        self.gamepad = XboxController(latency=self.latency, reader=reader, recorder=recorder, roles=roles,
+                                      deadzone=self.shaper.deadzone)
 
         self.gamepad.leftJoystickPos.connect(self.left_joystick_move_slot)
         self.gamepad.rightJoystickPos.connect(self.right_joystick_move_slot)
@@ -92,91 +159,158 @@ class Controls(QObject):
         self.gamepad.xChanged.connect(self.x_clicked)
         # self.gamepad.l2_pressed.connect(self.l2_pressed)
         self.gamepad.r2_pressed.connect(self.r2_pressed)
+        self.startup.mark("gamepad")
+
+        self.heartbeats = 0
+        self.heartbeat_timer = QTimer(self)
+        self.heartbeat_timer.timeout.connect(self.heartbeat)
+        self.heartbeat_timer.start(self.HEARTBEAT_INTERVAL)
+        self.watchdog = self._create_watchdog(failsafe_timeout, failsafe_ramp) if failsafe_timeout > 0 else None
+        self.failsafeChanged.connect(self.show_latency)
+
+        self.profiler = self._create_profiler()
+        self.profile_path = profile or PROFILE_PATH
+        QShortcut(QKeySequence(self.PROFILE_SHORTCUT), self.window, self.toggle_profiler)
+        if profile:
+            self.profiler.start()
+
+        self._startup_reported = False
+        self.status_timer = QTimer(self)
+        self.status_timer.timeout.connect(self.show_latency)
+        self.status_timer.start(1000)
+
+    def _create_profiler(self) -> SamplingProfiler:
+        profiler = SamplingProfiler()
+        profiler.add_counters("gamepad", self.gamepad.stats)
+        profiler.add_counters("serial", self.comms.stats)
+        profiler.add_counters("gui", lambda: {"view_updates": self.view_updates})
+        if self.watchdog is not None:
+            profiler.add_counters("watchdog", self.watchdog.stats)
+        return profiler
+
+    def _create_watchdog(self, timeout: float, ramp: float) -> Watchdog:
+        watchdog = Watchdog(self.fleet.tanks, ramp=ramp, on_status=self.failsafeChanged.emit)
+        # Only a polling reader makes progress while the sticks are held still
+        watchdog.watch("gamepad", lambda: self.gamepad.loops, timeout, trips=self.gamepad.polling)
+        watchdog.watch("gui", lambda: self.heartbeats, timeout)
+        watchdog.watch("serial", lambda: self.comms.frames_written, self.comms.keepalive + timeout, trips=False)
+        watchdog.start()
+        return watchdog
+
+    def select_port(self, discovery: PortDiscovery) -> PortFingerprint:
+        """Select the antenna used before or let the user choose a port, and remember it.
 
-        self.send = threading.Thread(target=self.comms.print_data, daemon=True)
-        self.send.start()
-
-    @classmethod
-    def load_ports_from_json(cls) -> dict:
-        """Load previously saved port data from JSON file.
+        Args:
+            discovery (PortDiscovery): The running discovery of the serial ports.
 
         Returns:
-            dict: A dictionary containing port data loaded from the JSON file.
-                If the file doesn't exist, an empty dictionary is returned.
+            PortFingerprint: The fingerprint of the selected port.
         """
-        try:
-            with open("../ports.json", "r", encoding="utf-8") as f:
-                data = json.load(f)
-            return data
-        except FileNotFoundError:
-            return {}
-
-    @classmethod
-    def save_ports_to_json(cls, port: str) -> None:
-        """Save the selected port to a JSON file with timestamp.
+        cache = PortCache.load()
+        fingerprint = discovery.select(cache)
+        if fingerprint is None:
+            ports = discovery.fingerprints()
+            port = self.window.handle_port_selection_dialog([found.device for found in ports])
+            if not port:
+                sys.exit()
+            fingerprint = next((found for found in ports if found.device == port),
+                               PortFingerprint(None, None, None, port))
+
+        cache.remember(fingerprint)
+        cache.save()
+        return fingerprint
+
+    def _show(self, **changes) -> None:
+        """Hand a new ViewState with the given fields changed to the window.
 
         Args:
-            port (str): The selected port to be saved to the JSON file.
-        """
-        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-
-        with open("../ports.json", "w", encoding="utf-8") as f:
-            json.dump({"port": port, "timestamp": timestamp}, f)
-
-    def check_previous_ports(self) -> str:
-        """Check if a port was previously selected within a time frame of 5 minutes.
-
-        Returns:
-            str: The previously selected port if it was selected within the
-                specified time frame and is available; otherwise, an empty string.
+            **changes: The changed fields of the ViewState.
         """
-        ports_data = self.load_ports_from_json()
+        self.view_state = self.view_state._replace(**changes)
+        self.view_updates += 1
+        self.window.show_state(self.view_state)
+
+    @QtCore.Slot()
+    def show_latency(self):  # pylint: disable=missing-function-docstring
+        if not self._startup_reported and self.comms.first_sent is not None:
+            self._startup_reported = True
+            self.startup.mark("first_command", self.comms.first_sent)
+            print(self.startup.report())
+        parts = [self.latency.status_line(), self.supervisor.status_line(), self.comms.status_line(),
+                 self.watchdog.status_line() if self.watchdog is not None else "", self.window.monitor.status_line(),
+                 "profiling" if self.profiler.running else ""]
+        self.window.show_status(" | ".join(part for part in parts if part))
+
+    @QtCore.Slot()
+    def heartbeat(self):  # pylint: disable=missing-function-docstring
+        # A modal dialog keeps the event loop running, but the operator busy
+        if QApplication.activeModalWidget() is None:
+            self.heartbeats += 1
+
+    @QtCore.Slot()
+    def toggle_profiler(self):  # pylint: disable=missing-function-docstring
+        if self.profiler.running:
+            self.save_profile()
+        else:
+            self.profiler.start()
+        self.show_latency()
+
+    def save_profile(self) -> None:
+        """Stop the profiler if it runs, write the collapsed stacks and print the report."""
+        if not self.profiler.running:
+            return
+        self.profiler.stop()
+        self.profiler.write_collapsed(self.profile_path)
+        print(self.profiler.report())
+        print(f"Profile written to {self.profile_path}", flush=True)
 
-        if "timestamp" in ports_data and "port" in ports_data:
-            timestamp = datetime.strptime(ports_data["timestamp"], "%Y-%m-%d %H:%M:%S")
-            if datetime.now() - timestamp < timedelta(minutes=5) and ports_data["port"] in SerialMessenger.all_ports():
-                previous_port = ports_data["port"]
-                return previous_port
+    @QtCore.Slot(int)
+    def select_tank(self, address: int):  # pylint: disable=missing-function-docstring
+        self.tank = self.fleet.select(address)
+        state = self.tank.state
+        self._show(vehicle=address, water=state.water, light=state.light)
 
-        return ""
+    @QtCore.Slot(str)
+    def link_changed(self, status: str):  # pylint: disable=missing-function-docstring
+        self._show(link=status)
 
     # @QtCore.Slot(float)
     # def l2_pressed(self, r: float):  # pylint: disable=missing-function-docstring
     #     if r > 0.1:
-    #         self.comms.tank.sound = 1
+    #         self.tank.sound = 1
     #     else:
-    #         self.comms.tank.sound = 0
+    #         self.tank.sound = 0
     #
-    #     self.window.update_gui("button_sound")
-
-    @QtCore.Slot(float)
-    def r2_pressed(self, r: float):  # pylint: disable=missing-function-docstring
-        if r > 0.1:
-            self.comms.tank.water = 1
-        else:
-            self.comms.tank.water = 0
-
-        self.window.update_gui("button_water")
-
-    @QtCore.Slot(float, float)
-    def left_joystick_move_slot(self, x: float, y: float):  # pylint: disable=missing-function-docstring
-        left, right = steering(x, y)
-        self.comms.tank.left = left
-        self.comms.tank.right = right
-        self.window.update_gui("left_joystick", x, y)
-
-    @QtCore.Slot(float, float)
-    def right_joystick_move_slot(self, x: float, y: float):  # pylint: disable=missing-function-docstring
-        self.comms.tank.tower_x = x
-        self.comms.tank.tower_y = y
-        self.window.update_gui("right_joystick", x, y)
+    #     self._show(sound=self.tank.sound)
+
+    @QtCore.Slot(float, object)
+    def r2_pressed(self, r: float, stamp: InputStamp):  # pylint: disable=missing-function-docstring
+        dispatched = self.latency.mark_dispatch(stamp)
+        water = 1 if r > 0.1 else 0
+        self.tank.update(stamp=self.latency.mark_commit(stamp, dispatched), water=water)
+
+        self._show(water=water)
+
+    @QtCore.Slot(float, float, object)
+    def left_joystick_move_slot(self, x: float, y: float, stamp: InputStamp):  # pylint: disable=missing-function-docstring
+        dispatched = self.latency.mark_dispatch(stamp)
+        # The gamepad normalized the raw values by a power of two, so this restores them exactly
+        left, right = self.shaper.motors(int(x * XboxController.MAX_JOY_VAL), int(y * XboxController.MAX_JOY_VAL))
+        self.tank.update(stamp=self.latency.mark_commit(stamp, dispatched), left=left, right=right)
+        self._show(drive=(x, y))
+
+    @QtCore.Slot(float, float, object)
+    def right_joystick_move_slot(self, x: float, y: float, stamp: InputStamp):  # pylint: disable=missing-function-docstring
+        dispatched = self.latency.mark_dispatch(stamp)
+        self.tank.update(stamp=self.latency.mark_commit(stamp, dispatched), tower_x=x, tower_y=y)
+        self._show(tower=(x, y))
 
     # @QtCore.Slot(int)
     # def b_clicked(self, val: int):  # pylint: disable=missing-function-docstring
-    #     self.comms.tank.sth = val
-    #     self.window.update_gui("button_sth")
+    #     self.tank.sth = val
+    #     self._show(sth=val)
 
     @QtCore.Slot(int)
     def x_clicked(self, val: int):  # pylint: disable=missing-function-docstring
-        self.comms.tank.light = val
-        self.window.update_gui("button_light")
+        self.tank.light = val
+        self._show(light=val)
@@ -0,0 +1,230 @@
+""" A module for reading gamepad events directly from Linux evdev devices.
+
+The device files are opened non-blocking and multiplexed with a selector
+(epoll on Linux), so a single thread can wait on several gamepads at once,
+give up after a timeout and be woken up for a clean shutdown. The event
+timestamps are taken from the kernel input_event struct and use the
+monotonic clock, the same clock as time.monotonic().
+
+The events have the same ev_type, code and state attributes as the events
+of the inputs package, so they can be handled by the same code.
+
+Typical usage:
+
+    reader = EvdevReader(find_gamepads())
+    events = reader.read(timeout=0.05)
+    reader.close()
+"""
+
+import errno
+import glob
+import os
+import selectors
+import struct
+from typing import Dict, List, NamedTuple, Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows, where gamepads are read with the inputs package
+    fcntl = None
+
+# struct input_event: struct timeval time, __u16 type, __u16 code, __s32 value
+EVENT_STRUCT = struct.Struct("llHHi")
+
+EV_SYN = 0x00
+EV_KEY = 0x01
+EV_ABS = 0x03
+
+# _IOW('E', 0xa0, int), selects the clock of the event timestamps
+EVIOCSCLOCKID = 0x400445A0
+CLOCK_MONOTONIC = 1
+
+EVENT_TYPES = {
+    EV_SYN: "Sync",
+    EV_KEY: "Key",
+    EV_ABS: "Absolute",
+}
+
+EVENT_CODES = {
+    (EV_SYN, 0x00): "SYN_REPORT",
+    (EV_SYN, 0x03): "SYN_DROPPED",
+    (EV_KEY, 0x130): "BTN_SOUTH",
+    (EV_KEY, 0x131): "BTN_EAST",
+    (EV_KEY, 0x133): "BTN_NORTH",
+    (EV_KEY, 0x134): "BTN_WEST",
+    (EV_KEY, 0x136): "BTN_TL",
+    (EV_KEY, 0x137): "BTN_TR",
+    (EV_KEY, 0x13A): "BTN_SELECT",
+    (EV_KEY, 0x13B): "BTN_START",
+    (EV_KEY, 0x13C): "BTN_MODE",
+    (EV_KEY, 0x13D): "BTN_THUMBL",
+    (EV_KEY, 0x13E): "BTN_THUMBR",
+    (EV_KEY, 0x2C0): "BTN_TRIGGER_HAPPY1",
+    (EV_KEY, 0x2C1): "BTN_TRIGGER_HAPPY2",
+    (EV_KEY, 0x2C2): "BTN_TRIGGER_HAPPY3",
+    (EV_KEY, 0x2C3): "BTN_TRIGGER_HAPPY4",
+    (EV_ABS, 0x00): "ABS_X",
+    (EV_ABS, 0x01): "ABS_Y",
+    (EV_ABS, 0x02): "ABS_Z",
+    (EV_ABS, 0x03): "ABS_RX",
+    (EV_ABS, 0x04): "ABS_RY",
+    (EV_ABS, 0x05): "ABS_RZ",
+    (EV_ABS, 0x10): "ABS_HAT0X",
+    (EV_ABS, 0x11): "ABS_HAT0Y",
+}
+
+
+class EvdevEvent(NamedTuple):
+    """An input event read from an evdev device.
+
+    Attributes:
+        ev_type: The name of the event type, e.g. "Absolute".
+        code: The name of the event code, e.g. "ABS_X".
+        state: The value of the event.
+        timestamp: The time the kernel received the event in seconds of the monotonic clock.
+        device: The path of the device the event was read from.
+    """
+    ev_type: str
+    code: str
+    state: int
+    timestamp: float
+    device: str
+
+
+def find_gamepads() -> List[str]:
+    """Find the evdev device files of all connected gamepads.
+
+    Returns:
+        List[str]: The paths of the event devices classified as joysticks by udev.
+    """
+    return sorted(glob.glob("/dev/input/by-id/*-event-joystick"))
+
+
+class EvdevReader:
+    """Non-blocking reader multiplexing several evdev devices.
+
+    Devices that return an error, e.g. because they were unplugged, are
+    closed and removed from the reader.
+
+    Attributes:
+        devices: The paths of the devices that are currently read.
+    """
+    READ_SIZE = EVENT_STRUCT.size * 64
+
+    def __init__(self, paths: List[str]) -> None:
+        """Opens the given device files.
+
+        Args:
+            paths (List[str]): The paths of the evdev devices, a FIFO with the
+                same event format can be used instead of a device.
+
+        Raises:
+            OSError: If a device cannot be opened.
+        """
+        self._selector = selectors.DefaultSelector()
+        self._pending: Dict[int, bytes] = {}
+        self._closed = False
+
+        self._wakeup_read, self._wakeup_write = os.pipe()
+        os.set_blocking(self._wakeup_read, False)
+        self._selector.register(self._wakeup_read, selectors.EVENT_READ, None)
+
+        try:
+            for path in paths:
+                self._open(path)
+        except OSError:
+            self.close()
+            raise
+
+    @property
+    def devices(self) -> List[str]:
+        """The paths of the devices that are currently read."""
+        return [key.data for key in self._selector.get_map().values() if key.data is not None]
+
+    def _open(self, path: str) -> None:
+        descriptor = os.open(path, os.O_RDONLY | os.O_NONBLOCK)
+        try:
+            if fcntl is not None:
+                fcntl.ioctl(descriptor, EVIOCSCLOCKID, struct.pack("i", CLOCK_MONOTONIC))
+        except OSError:
+            pass  # Not an evdev device, e.g. a FIFO used in tests
+        self._pending[descriptor] = b""
+        self._selector.register(descriptor, selectors.EVENT_READ, path)
+
+    def _remove(self, descriptor: int) -> None:
+        self._selector.unregister(descriptor)
+        del self._pending[descriptor]
+        os.close(descriptor)
+
+    def read(self, timeout: Optional[float] = None) -> List[EvdevEvent]:
+        """Wait for events of any of the devices.
+
+        Args:
+            timeout (Optional[float]): The maximum time to wait in seconds,
+                None waits until an event arrives or stop() is called.
+
+        Returns:
+            List[EvdevEvent]: The events read, empty on timeout or after stop().
+        """
+        if self._closed:
+            return []
+
+        events = []
+        for key, _ in self._selector.select(timeout):
+            if key.data is None:
+                os.read(self._wakeup_read, 64)  # woken up by stop()
+                continue
+            try:
+                data = os.read(key.fd, self.READ_SIZE)
+            except BlockingIOError:
+                continue
+            except OSError as error:
+                if error.errno != errno.ENODEV:
+                    raise
+                self._remove(key.fd)
+                continue
+            if not data:
+                self._remove(key.fd)  # writer of a FIFO closed it
+                continue
+            events.extend(self._parse(key.fd, key.data, data))
+        return events
+
+    def _parse(self, descriptor: int, path: str, data: bytes) -> List[EvdevEvent]:
+        """Convert raw input_event structs to events with names.
+
+        Args:
+            descriptor (int): The file descriptor the data was read from.
+            path (str): The path of the device.
+            data (bytes): The bytes read.
+
+        Returns:
+            List[EvdevEvent]: The events with a known type and code.
+        """
+        data = self._pending[descriptor] + data
+        usable = len(data) - len(data) % EVENT_STRUCT.size
+        self._pending[descriptor] = data[usable:]
+
+        events = []
+        for sec, usec, ev_type, code, value in EVENT_STRUCT.iter_unpack(data[:usable]):
+            name = EVENT_CODES.get((ev_type, code))
+            if name is not None:
+                events.append(EvdevEvent(EVENT_TYPES[ev_type], name, value, sec + usec / 1e6, path))
+        return events
+
+    def stop(self) -> None:
+        """Wake up a read() blocked in another thread."""
+        try:
+            os.write(self._wakeup_write, b"\0")
+        except OSError:
+            pass
+
+    def close(self) -> None:
+        """Close all devices. Must not be called while another thread is in read()."""
+        if self._closed:
+            return
+        self._closed = True
+        for key in list(self._selector.get_map().values()):
+            self._selector.unregister(key.fd)
+            os.close(key.fd)
+        self._selector.close()
+        os.close(self._wakeup_write)
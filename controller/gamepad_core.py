@@ -0,0 +1,535 @@
+""" A module reading Xbox controllers and reporting their inputs without Qt.
+
+The GamepadCore does all the reading and processing of the input events and
+reports the results through attributes with a connect()/emit() interface.
+Used on its own, these are Callbacks that call the connected functions
+directly in the reader thread, so the core runs without PySide6, e.g. on a
+headless relay box. The XboxController of controller.gamepad provides the
+same attributes as Qt signals instead.
+
+On Linux the evdev devices are read directly with an EvdevReader, which
+supports timeouts and a clean shutdown. Elsewhere, or if no evdev gamepad
+can be opened, the blocking get_gamepad() of the inputs package is used,
+which reads the first gamepad only.
+
+All gamepads are read by the same thread. Every gamepad keeps its own
+stick and trigger values and has roles (see controller.roles), and the
+values of the gamepads sharing a role are merged by priority before the
+signals are emitted.
+
+Typical usage:
+
+    gamepad = GamepadCore()
+    gamepad.leftJoystickPos.connect(drive)
+    ...
+    gamepad.stop()
+"""
+
+import math
+import sys
+import threading
+import time
+from typing import Callable, Dict, Hashable, List, Optional, Tuple
+
+from inputs import get_gamepad
+
+from model.latency import LatencyTracker
+from .evdev_reader import EvdevReader, find_gamepads
+from .roles import ROLE_DRIVE, ROLE_EFFECTS, ROLE_TURRET, RoleMapping
+from .session import SessionRecorder
+
+class Callbacks:
+    """Qt-free stand-in for a signal, calling the connected functions directly on emit()."""
+    __slots__ = ("_slots",)
+
+    def __init__(self) -> None:
+        """Initializes the callbacks without any connected function."""
+        self._slots: List[Callable] = []
+
+    def connect(self, slot: Callable) -> None:
+        """Call a function on every emit().
+
+        Args:
+            slot (Callable): The function, called with the emitted arguments.
+        """
+        self._slots.append(slot)
+
+    def emit(self, *args) -> None:
+        """Call the connected functions in the calling thread.
+
+        Args:
+            *args: The arguments passed to the functions.
+        """
+        for slot in self._slots:
+            slot(*args)
+
+
+class CallbackSignal:
+    """Class attribute giving every instance its own Callbacks, declared like a Qt Signal."""
+    def __init__(self, *types) -> None:
+        """Initializes the attribute, the argument types are only documentation."""
+        self.types = types
+        self.name = ""
+
+    def __set_name__(self, owner, name: str) -> None:
+        self.name = name
+
+    def __get__(self, instance, owner):
+        if instance is None:
+            return self
+        # Stored under the same name, so later lookups find it without calling __get__
+        callbacks = instance.__dict__[self.name] = Callbacks()
+        return callbacks
+
+
+class _Pad:
+    """Stick and trigger values of one gamepad, normalized like the signals."""
+    __slots__ = ("roles", "left_x", "left_y", "right_x", "right_y", "left_trigger", "right_trigger")
+
+    def __init__(self, roles) -> None:
+        self.roles = roles
+        self.left_x = 0
+        self.left_y = 0
+        self.right_x = 0
+        self.right_y = 0
+        self.left_trigger = 0
+        self.right_trigger = 0
+
+
+def _merged_left_joystick(pads: List[_Pad], deadzone: float) -> Tuple[float, float]:
+    """Get the raw position of the first left stick of the gamepads that is outside the radial deadzone.
+
+    The position is not scaled to the deadzone, the InputShaper does it. Sticks at rest give (0, 0),
+    so their jitter emits nothing.
+    """
+    for pad in pads:
+        x, y = pad.left_x, pad.left_y
+        if x * x + y * y > deadzone * deadzone:
+            return x, y
+    return 0, 0
+
+
+def _merged_right_joystick(pads: List[_Pad], deadzone: float) -> Tuple[float, float]:
+    """Get the position of the first right stick of the gamepads that is outside the deadzone."""
+    for pad in pads:
+        x, y = pad.right_x, pad.right_y
+        if abs(x) > deadzone or abs(y) > deadzone:
+            return x, y
+    return 0, 0
+
+
+class GamepadCore:
+    """Handles Xbox controller inputs and emits signals for various actions.
+
+    This class monitors the Xbox controller inputs and emits signals for joystick movements,
+    trigger presses, and button clicks.
+    It also handles toggling variables for specific buttons.
+
+    Axis events are collected until the SYN_REPORT event that ends an input frame
+    of the device. Then at most one signal is emitted per joystick and trigger,
+    and only if its value changed since the last emission.
+
+    Each gamepad only controls the inputs of its roles: the left stick needs
+    ROLE_DRIVE, the right stick ROLE_TURRET, the triggers and buttons
+    ROLE_EFFECTS. When several gamepads share a role, the value of the first
+    one in priority order that is not at rest is emitted.
+
+    The signals are Callbacks unless a subclass overrides them, e.g. with Qt signals.
+
+    Attributes:
+        leftJoystickPos: A signal emitted with two floats for the left joystick position.
+        rightJoystickPos: A signal emitted with two floats for the right joystick position.
+        l2_pressed: A signal emitted with a float for the left trigger pressure.
+        r2_pressed: A signal emitted with a float for the right trigger pressure.
+            The joystick and trigger signals also carry the InputStamp of the input frame.
+        buttonAClicked: A signal emitted when the A button is clicked.
+        buttonYClicked: A signal emitted when the Y button is clicked.
+        xChanged: A signal emitted with an integer when the X button toggles variable changes.
+        bChanged: A signal emitted with an integer when the B button toggles variable changes.
+        MAX_TRIG_VAL: The maximum value for trigger inputs.
+        MAX_JOY_VAL: The maximum value for joystick inputs.
+        DEADZONE: The joystick values below which the joystick counts as centred, per axis for the
+            right stick and radially for the left stick unless another deadzone is given.
+        READ_TIMEOUT: The time in seconds after which the evdev reader checks whether to stop.
+        loops: The number of iterations of the reader loop.
+        events_in: The number of input events read from the controller.
+        frames: The number of input frames completed by a SYN_REPORT event.
+        signals_out: The number of signals emitted.
+        latency: The LatencyTracker stamping the input frames.
+        recorder: The SessionRecorder recording all read events, if any.
+        role_mapping: The RoleMapping assigning the roles to the gamepads.
+        assignments: The roles of every gamepad read so far, by device.
+    """
+    leftJoystickPos = CallbackSignal(float, float, object)
+    rightJoystickPos = CallbackSignal(float, float, object)
+    l2_pressed = CallbackSignal(float, object)
+    r2_pressed = CallbackSignal(float, object)
+
+    buttonAClicked = CallbackSignal()
+    buttonYClicked = CallbackSignal()
+
+    xChanged = CallbackSignal(int)
+    bChanged = CallbackSignal(int)
+
+    MAX_TRIG_VAL = math.pow(2, 8)
+    MAX_JOY_VAL = math.pow(2, 15)
+    DEADZONE = 0.1
+    READ_TIMEOUT = 0.05
+
+    def __init__(self, device_paths: Optional[List[str]] = None, latency: Optional[LatencyTracker] = None,
+                 reader=None, recorder: Optional[SessionRecorder] = None,
+                 roles: Optional[RoleMapping] = None, deadzone: Optional[float] = None) -> None:
+        """ Initializes joystick, trigger, and button states, and starts a thread to monitor the controller inputs.
+
+        Args:
+            device_paths (Optional[List[str]]): The evdev devices to read, by default all
+                gamepads found on Linux. If none can be opened, the inputs package is used.
+            latency (Optional[LatencyTracker]): The tracker shared with the messenger, a new one by default.
+            reader: An object with the interface of an EvdevReader to read the events from
+                instead of the gamepads, e.g. a SessionPlayer.
+            recorder (Optional[SessionRecorder]): A recorder all read events are added to.
+            roles (Optional[RoleMapping]): The roles of the gamepads, the default mapping by default.
+            deadzone (Optional[float]): The radial deadzone of the left stick, the one of the
+                InputShaper driving the motors, DEADZONE by default.
+        """
+        self.latency = latency or LatencyTracker()
+        self.recorder = recorder
+        self.role_mapping = roles or RoleMapping()
+        self.assignments: Dict[Hashable, frozenset] = {}
+
+        # Gamepads by device in priority order, and the ones of every role
+        self._pads: Dict[Hashable, _Pad] = {}
+        self._role_pads: Dict[str, List[_Pad]] = {ROLE_DRIVE: [], ROLE_TURRET: [], ROLE_EFFECTS: []}
+        self._device = None
+        self._pad = _Pad(frozenset())
+        self._left_bumper = 0
+        self._right_bumper = 0
+        self._a = 0
+        self._x = 0
+        self._y = 0
+        self._b = 0
+        self._left_thumb = 0
+        self._right_thumb = 0
+        self._back = 0
+        self._start = 0
+        self._left_d_pad = 0
+        self._right_d_pad = 0
+        self._up_d_pad = 0
+        self._down_d_pad = 0
+
+        self._toggle_variable_x = 0
+        self._toggle_variable_b = 0
+
+        # Values of the last emitted signals, used to emit only on changes
+        self._emitted_left_joystick = (0, 0)
+        self._emitted_right_joystick = (0, 0)
+        self._emitted_left_trigger = 0
+        self._emitted_right_trigger = 0
+
+        # Instance copies of the constants, class attributes of a QObject subclass are slow to look up
+        self._max_joy_val = self.MAX_JOY_VAL
+        self._max_trig_val = self.MAX_TRIG_VAL
+        self._deadzone = self.DEADZONE
+        self._left_deadzone = self.DEADZONE if deadzone is None else deadzone
+
+        self._frame_pending = False
+        self._frame_input_time = 0.0
+        self.loops = 0
+        self.events_in = 0
+        self.frames = 0
+        self.signals_out = 0
+
+        self._event_handlers = {
+            'ABS_Y': self._handle_left_joystick_y,
+            'ABS_X': self._handle_left_joystick_x,
+            'ABS_RY': self._handle_right_joystick_y,
+            'ABS_RX': self._handle_right_joystick_x,
+            'ABS_Z': self._handle_left_trigger,
+            'ABS_RZ': self._handle_right_trigger,
+            'BTN_TL': self._handle_left_bumper,
+            'BTN_TR': self._handle_right_bumper,
+            'BTN_SOUTH': self._handle_button_a,
+            'BTN_NORTH': self._handle_button_y,
+            'BTN_WEST': self._handle_button_x,
+            'BTN_EAST': self._handle_button_b,
+            'BTN_THUMBL': self._handle_left_thumb,
+            'BTN_THUMBR': self._handle_right_thumb,
+            'BTN_SELECT': self._handle_back,
+            'BTN_START': self._handle_start,
+            'BTN_TRIGGER_HAPPY1': self._handle_left_d_pad,
+            'BTN_TRIGGER_HAPPY2': self._handle_right_d_pad,
+            'BTN_TRIGGER_HAPPY3': self._handle_up_d_pad,
+            'BTN_TRIGGER_HAPPY4': self._handle_down_d_pad,
+        }
+
+        self._running = True
+        self._reader = reader if reader is not None else self._open_reader(device_paths)
+        if self._reader is not None:
+            self._assign_roles(self._reader.devices)
+
+        self._monitor_thread = threading.Thread(target=self._monitor_controller, args=(), name="gamepad")
+        self._monitor_thread.daemon = True
+        self._monitor_thread.start()
+
+    @staticmethod
+    def _open_reader(device_paths: Optional[List[str]]) -> Optional[EvdevReader]:
+        if device_paths is None:
+            device_paths = find_gamepads() if sys.platform.startswith("linux") else []
+        if not device_paths:
+            return None
+        try:
+            return EvdevReader(device_paths)
+        except OSError:
+            return None
+
+    @property
+    def backend(self) -> str:
+        """The name of the backend the events are read with, e.g. "EvdevReader" or "inputs"."""
+        return type(self._reader).__name__ if self._reader is not None else "inputs"
+
+    @property
+    def polling(self) -> bool:
+        """Whether the reader loop runs every READ_TIMEOUT also without events, unlike with inputs."""
+        return self._reader is not None
+
+    def stop(self, timeout: float = 1.0) -> None:
+        """Stop monitoring the controller and wait for the monitor thread to end.
+
+        The inputs backend cannot be interrupted, its thread ends after the next event.
+
+        Args:
+            timeout (float): The maximum time to wait for the thread in seconds.
+        """
+        self._running = False
+        if self._reader is not None:
+            self._reader.stop()
+        self._monitor_thread.join(timeout)
+
+    def stats(self) -> dict:
+        """Get the counters of the processed events and emitted signals.
+
+        Returns:
+            dict: The number of reader loops, events read, input frames and signals emitted.
+        """
+        return {
+            "loops": self.loops,
+            "events_in": self.events_in,
+            "frames": self.frames,
+            "signals_out": self.signals_out,
+        }
+
+    def _assign_roles(self, devices: List[Hashable]) -> None:
+        """Give the gamepads their roles, e.g. after one was connected or unplugged.
+
+        Gamepads that are no longer read are dropped with their values.
+
+        Args:
+            devices (List[Hashable]): The gamepads in priority order.
+        """
+        self.assignments = self.role_mapping.resolve(devices)
+        self._pads = {device: self._pads.get(device) or _Pad(roles) for device, roles in self.assignments.items()}
+        for device, pad in self._pads.items():
+            pad.roles = self.assignments[device]
+        self._role_pads = {role: [pad for pad in self._pads.values() if role in pad.roles] for role in self._role_pads}
+        self._device = None
+
+    def _select_pad(self, device: Hashable) -> _Pad:
+        """Get the values of the gamepad an event was read from, adding the gamepad if it is new."""
+        pad = self._pads.get(device)
+        if pad is None:
+            self._assign_roles(list(self._pads) + [device])
+            pad = self._pads[device]
+        self._device = device
+        self._pad = pad
+        return pad
+
+    def toggle_variable_x_handler(self):
+        """Toggles handler for button X.
+
+        This method toggles the X variable between zero and one and emits a signal if it changes.
+        """
+        new_value = 1 - self._toggle_variable_x  # Toggle the X variable between 0 and 1 and emit signal if it changes
+        if new_value != self._toggle_variable_x:
+            self._toggle_variable_x = new_value
+            self._emit(self.xChanged, self._toggle_variable_x)
+
+    def toggle_variable_b_handler(self):
+        """Toggles handler for button B.
+
+        This method toggles the B variable between zero and one and emits a signal if it changes.
+        """
+        new_value = 1 - self._toggle_variable_b  # Toggle the B variable between 0 and 1 and emit signal if it changes
+        if new_value != self._toggle_variable_b:
+            self._toggle_variable_b = new_value
+            self._emit(self.bChanged, self._toggle_variable_b)
+
+    def _monitor_controller(self) -> None:
+        """Monitors controller inputs and emit signals accordingly.
+
+        This method continuously monitors the Xbox controller inputs and emits signals
+        based on joystick movements, trigger presses, and button clicks.
+        Runs inside a thread until stop() is called.
+        """
+        while self._running:
+            self.loops += 1
+            if self._reader is not None:
+                # The kernel timestamps of the evdev events are used
+                events = self._reader.read(self.READ_TIMEOUT)
+                read_time = None
+            else:
+                events = get_gamepad()
+                read_time = time.monotonic()
+            if self.recorder is not None:
+                self.recorder.record(events, read_time, self._reader.devices if self._reader is not None else None)
+            if self._reader is not None and len(self._reader.devices) < len(self._pads):
+                self._assign_roles(self._reader.devices)  # A gamepad was unplugged
+                self._frame_pending = True
+            self._process_events(events, read_time)
+
+        if self._reader is not None:
+            self._reader.close()
+
+    def _process_events(self, events, read_time: Optional[float] = None) -> None:
+        """Apply a batch of events to the state and emit the changes.
+
+        Args:
+            events: The events read, with code and state attributes.
+            read_time (Optional[float]): The time the events were read, None to use
+                the monotonic timestamps of the events instead.
+        """
+        # Locals, the attribute lookups on a QObject subclass are slow
+        handlers = self._event_handlers
+        flush_frame = self._flush_frame
+        pending = self._frame_pending
+        count = 0
+        for event in events:
+            count += 1
+            if event.device is not self._device:
+                self._select_pad(event.device)
+            handler = handlers.get(event.code)
+            if handler:
+                if not pending:
+                    self._frame_input_time = event.timestamp if read_time is None else read_time
+                    pending = True
+                handler(event)
+            elif event.code == 'SYN_REPORT':
+                flush_frame()
+                pending = False
+        self.events_in += count
+
+        # Not every backend ends its batch with SYN_REPORT
+        if pending or self._frame_pending:
+            flush_frame()
+
+    def _emit(self, signal, *args) -> None:
+        self.signals_out += 1
+        signal.emit(*args)
+
+    def _flush_frame(self) -> None:
+        """Emit the merged joystick and trigger values that changed in the current input frame."""
+        self._frame_pending = False
+        self.frames += 1
+        role_pads = self._role_pads
+        left_joystick = _merged_left_joystick(role_pads[ROLE_DRIVE], self._left_deadzone)
+        right_joystick = _merged_right_joystick(role_pads[ROLE_TURRET], self._deadzone)
+        effects = role_pads[ROLE_EFFECTS]
+        left_trigger = next((pad.left_trigger for pad in effects if pad.left_trigger), 0)
+        right_trigger = next((pad.right_trigger for pad in effects if pad.right_trigger), 0)
+
+        stamp = None
+        emitted = 0
+        if left_joystick != self._emitted_left_joystick:
+            self._emitted_left_joystick = left_joystick
+            stamp = self.latency.mark_input(self._frame_input_time)
+            self.leftJoystickPos.emit(*left_joystick, stamp)
+            emitted += 1
+
+        if right_joystick != self._emitted_right_joystick:
+            self._emitted_right_joystick = right_joystick
+            stamp = stamp or self.latency.mark_input(self._frame_input_time)
+            self.rightJoystickPos.emit(*right_joystick, stamp)
+            emitted += 1
+
+        if left_trigger != self._emitted_left_trigger:
+            self._emitted_left_trigger = left_trigger
+            stamp = stamp or self.latency.mark_input(self._frame_input_time)
+            self.l2_pressed.emit(left_trigger, stamp)
+            emitted += 1
+
+        if right_trigger != self._emitted_right_trigger:
+            self._emitted_right_trigger = right_trigger
+            stamp = stamp or self.latency.mark_input(self._frame_input_time)
+            self.r2_pressed.emit(right_trigger, stamp)
+            emitted += 1
+        if emitted:
+            self.signals_out += emitted
+
+    def _handle_left_joystick_y(self, event) -> None:
+        self._pad.left_y = event.state / self._max_joy_val  # normalize between -1 and 1
+
+    def _handle_left_joystick_x(self, event) -> None:
+        self._pad.left_x = event.state / self._max_joy_val  # normalize between -1 and 1
+
+    def _handle_right_joystick_y(self, event) -> None:
+        self._pad.right_y = event.state / self._max_joy_val  # normalize between -1 and 1
+
+    def _handle_right_joystick_x(self, event) -> None:
+        self._pad.right_x = event.state / self._max_joy_val  # normalize between -1 and 1
+
+    def _handle_left_trigger(self, event) -> None:
+        self._pad.left_trigger = event.state / self._max_trig_val  # normalize between 0 and 1
+
+    def _handle_right_trigger(self, event) -> None:
+        self._pad.right_trigger = event.state / self._max_trig_val  # normalize between 0 and 1
+
+    def _handle_left_bumper(self, event) -> None:
+        self._left_bumper = event.state
+
+    def _handle_right_bumper(self, event) -> None:
+        self._right_bumper = event.state
+
+    def _handle_button_a(self, event) -> None:
+        self._a = event.state
+        if ROLE_EFFECTS in self._pad.roles:
+            self._emit(self.buttonAClicked)
+
+    def _handle_button_y(self, event) -> None:
+        self._y = event.state  # previously switched with X
+        if ROLE_EFFECTS in self._pad.roles:
+            self._emit(self.buttonYClicked)
+
+    def _handle_button_x(self, event) -> None:
+        self._x = event.state  # previously switched with Y
+        if self._x == 1 and ROLE_EFFECTS in self._pad.roles:  # Only emit when the button is pressed down
+            # self.buttonXClicked.emit()
+            self.toggle_variable_x_handler()
+
+    def _handle_button_b(self, event) -> None:
+        self._b = event.state
+        if self._b == 1 and ROLE_EFFECTS in self._pad.roles:  # Only emit when the button is pressed down
+            # self.buttonBClicked.emit()
+            self.toggle_variable_b_handler()
+
+    def _handle_left_thumb(self, event) -> None:
+        self._left_thumb = event.state
+
+    def _handle_right_thumb(self, event) -> None:
+        self._right_thumb = event.state
+
+    def _handle_back(self, event) -> None:
+        self._back = event.state
+
+    def _handle_start(self, event) -> None:
+        self._start = event.state
+
+    def _handle_left_d_pad(self, event) -> None:
+        self._left_d_pad = event.state
+
+    def _handle_right_d_pad(self, event) -> None:
+        self._right_d_pad = event.state
+
+    def _handle_up_d_pad(self, event) -> None:
+        self._up_d_pad = event.state
+
+    def _handle_down_d_pad(self, event) -> None:
+        self._down_d_pad = event.state
@@ -0,0 +1,442 @@
+""" A module running the tank control without a GUI, e.g. on a relay box without display.
+
+The HeadlessController connects the GamepadCore directly to the Tank and
+the SerialMessenger. It never imports PySide6: the gamepad inputs are
+applied to the tank in the reader thread instead of being dispatched to a
+GUI thread, and the status is printed instead of shown.
+
+The settings are read from an optional JSON file and can be overridden on
+the command line. The file holds an object with any of the keys of
+DEFAULT_CONFIG, e.g.:
+
+    {"port": "/dev/ttyUSB0", "roles": ["drive", "turret,effects"], "expo": 0.3}
+
+Without a port, the antenna used before is selected like in the GUI.
+
+The gamepads and the antenna may also be on different machines, connected
+by the UDP bridge of model.udp_bridge: the operator machine sends its tank
+values with --udp-send to the relay machine next to the tank, which reads
+no gamepad and receives them with --udp-listen. The relay only accepts the
+operator given with --udp-operator, or else the first one it hears from,
+and with a shared udp_secret only signed datagrams.
+
+The Watchdog of model.watchdog stops the tank if the gamepad reader or, on a
+relay, the datagrams of the operator stall for failsafe_timeout seconds.
+
+The SamplingProfiler of model.profiler runs from the start with --profile
+and is started and stopped with SIGUSR1, the hotkey of the GUI.
+
+Typical usage:
+
+    python -m controller.headless --config relay.json
+    python -m controller.headless --port /dev/ttyUSB0 --replay session.fkfs
+
+    python -m controller.headless --udp-listen 47800 --port /dev/ttyUSB0   # relay
+    python -m controller.headless --udp-send relay.local:47800            # operator
+
+    python -m controller.headless --profile relay.folded   # kill -USR1 <pid> stops and restarts it
+"""
+
+import argparse
+import json
+import signal
+import sys
+import threading
+import time
+from typing import List, Optional
+
+import inputs
+
+from model.communication import SerialMessenger
+from model.discovery import PortCache, PortDiscovery, StartupTimer
+from model.flight_recorder import FLIGHT_RECORDER_PATH, open_flight_recorder
+from model.latency import InputStamp, LatencyTracker
+from model.link import LinkSupervisor, PortFingerprint
+from model.profiler import PROFILE_PATH, SamplingProfiler
+from model.tank import Tank
+from model.udp_bridge import UdpStateReceiver, UdpStateSender, parse_address
+from model.watchdog import DEFAULT_RAMP, DEFAULT_TIMEOUT, Watchdog
+from .gamepad_core import GamepadCore
+from .roles import RoleMapping
+from .session import SessionLog, SessionPlayer, SessionRecorder
+from .shaping import InputShaper
+
+# Time in seconds the stop frame may take beyond the keepalive when closing
+STOP_TIMEOUT = 0.5
+
+DEFAULT_CONFIG = {
+    "port": None,
+    "baud_rate": 9600,
+    "max_rate": 50.0,
+    "keepalive": 1.0,
+    "deadzone": GamepadCore.DEADZONE,
+    "expo": 0.0,
+    "left_trim": 1.0,
+    "right_trim": 1.0,
+    "roles": None,
+    "record": None,
+    "replay": None,
+    "speed": 1.0,
+    "status_interval": 5.0,
+    "udp_send": None,
+    "udp_listen": None,
+    "udp_keepalive": 0.1,
+    "udp_operator": None,
+    "udp_secret": None,
+    "flight_recorder": FLIGHT_RECORDER_PATH,
+    "profile": None,
+    "failsafe_timeout": DEFAULT_TIMEOUT,
+    "failsafe_ramp": DEFAULT_RAMP,
+}
+
+
+def load_config(path: Optional[str] = None, **overrides) -> dict:
+    """Read the settings, falling back to DEFAULT_CONFIG.
+
+    Args:
+        path (Optional[str]): The path of a JSON file with settings.
+        **overrides: Settings taking precedence over the file, None values are ignored.
+
+    Returns:
+        dict: The complete settings.
+
+    Raises:
+        ValueError: If the file is not a JSON object or a setting is unknown.
+    """
+    config = dict(DEFAULT_CONFIG)
+    if path is not None:
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        if not isinstance(data, dict):
+            raise ValueError(f"{path} should contain a JSON object")
+        config.update(data)
+    config.update({name: value for name, value in overrides.items() if value is not None})
+
+    unknown = set(config) - set(DEFAULT_CONFIG)
+    if unknown:
+        raise ValueError(f"Unknown settings: {', '.join(sorted(unknown))}")
+    if config["udp_send"] and config["udp_listen"]:
+        raise ValueError("A controller either sends to a relay or is the relay")
+    return config
+
+
+class HeadlessController:
+    """Drives the tank from the gamepad without Qt.
+
+    Attributes:
+        config: The settings, see DEFAULT_CONFIG.
+        startup: The StartupTimer measuring the startup up to the first command sent.
+        tank: The Tank holding the values sent to the antenna.
+        latency: A LatencyTracker shared by the gamepad and the messenger.
+        shaper: The InputShaper turning the left stick into motor values.
+        comms: The SerialMessenger of the antenna, None when sending to a relay.
+        supervisor: A LinkSupervisor running the transmission and reconnecting the antenna,
+            None when sending to a relay.
+        sender: The UdpStateSender sending the tank values to a relay, if any.
+        receiver: The UdpStateReceiver of the relay receiving the tank values, if any.
+        gamepad: The GamepadCore reading the gamepads, None on a relay.
+        recorder: The SessionRecorder of the gamepad events, if any.
+        profiler: The SamplingProfiler of all threads, see toggle_profiler().
+        watchdog: The Watchdog stopping the tank when the inputs stall, None if disabled.
+    """
+    def __init__(self, config: dict, startup: Optional[StartupTimer] = None) -> None:
+        """Selects the antenna or the relay, starts sending and starts reading the gamepads or the operator.
+
+        Args:
+            config (dict): The settings, see load_config().
+            startup (Optional[StartupTimer]): The timer of the startup phases, started now by default.
+
+        Raises:
+            RuntimeError: If no antenna or no gamepad is found.
+            OSError: If the port of the antenna cannot be opened.
+            ValueError: If a setting is invalid.
+        """
+        self.config = config
+        self.startup = startup or StartupTimer()
+        discovery = PortDiscovery()
+        discovery.start()
+
+        self.tank = Tank()
+        self.latency = LatencyTracker()
+        self.shaper = InputShaper(deadzone=config["deadzone"], expo=config["expo"],
+                                  left_trim=config["left_trim"], right_trim=config["right_trim"])
+        roles = RoleMapping.parse(config["roles"])
+
+        self.comms: Optional[SerialMessenger] = None
+        self.supervisor: Optional[LinkSupervisor] = None
+        self.sender: Optional[UdpStateSender] = None
+        self.receiver: Optional[UdpStateReceiver] = None
+        self.gamepad: Optional[GamepadCore] = None
+        self.recorder: Optional[SessionRecorder] = None
+
+        reader = None
+        if not config["udp_listen"]:
+            reader = SessionPlayer(SessionLog.load(config["replay"]), config["speed"]) if config["replay"] else None
+            if reader is None and not inputs.devices.gamepads:
+                raise RuntimeError("No gamepad connected")
+
+        secret = config["udp_secret"].encode("utf-8") if config["udp_secret"] else None
+        if config["udp_send"]:
+            self.sender = UdpStateSender(self.tank, parse_address(config["udp_send"], "127.0.0.1"),
+                                         max_rate=config["max_rate"], keepalive=config["udp_keepalive"],
+                                         latency=self.latency, secret=secret)
+            threading.Thread(target=self.sender.run, name="udp sender", daemon=True).start()
+            self.startup.mark("udp_open")
+        else:
+            fingerprint = self.select_port(discovery)
+            self.startup.mark("port_selection")
+
+            self.comms = SerialMessenger(fingerprint.device, baud_rate=config["baud_rate"],
+                                         max_rate=config["max_rate"], keepalive=config["keepalive"],
+                                         latency=self.latency, tank=self.tank,
+                                         recorder=open_flight_recorder(config["flight_recorder"]))
+            self.supervisor = LinkSupervisor(self.comms, fingerprint=fingerprint,
+                                             on_status=lambda status: print(f"link {status}", flush=True))
+            threading.Thread(target=self.supervisor.run, name="serial", daemon=True).start()
+            self.startup.mark("serial_open")
+
+        if config["udp_listen"]:
+            self.receiver = UdpStateReceiver(self.tank, parse_address(config["udp_listen"]),
+                                             operator=config["udp_operator"], secret=secret)
+            threading.Thread(target=self.receiver.run, name="udp receiver", daemon=True).start()
+            self.startup.mark("udp_listen")
+        else:
+            self.recorder = SessionRecorder() if config["record"] else None
+            self.gamepad = GamepadCore(latency=self.latency, reader=reader, recorder=self.recorder, roles=roles,
+                                       deadzone=self.shaper.deadzone)
+            self.gamepad.leftJoystickPos.connect(self.left_joystick_move)
+            self.gamepad.rightJoystickPos.connect(self.right_joystick_move)
+            self.gamepad.r2_pressed.connect(self.r2_pressed)
+            self.gamepad.xChanged.connect(self.x_clicked)
+            self.startup.mark("gamepad")
+
+        self.watchdog = self._create_watchdog() if config["failsafe_timeout"] > 0 else None
+        self.profiler = self._create_profiler()
+        if config["profile"]:
+            self.profiler.start()
+
+    def _create_watchdog(self) -> Watchdog:
+        timeout = self.config["failsafe_timeout"]
+        watchdog = Watchdog([self.tank], ramp=self.config["failsafe_ramp"],
+                            on_status=lambda status: print(status, flush=True))
+        if self.gamepad is not None:
+            # Only a polling reader makes progress while the sticks are held still
+            watchdog.watch("gamepad", lambda: self.gamepad.loops, timeout, trips=self.gamepad.polling)
+        if self.receiver is not None:
+            # The operator repeats its values every udp_keepalive seconds
+            watchdog.watch("relay", lambda: self.receiver.received, timeout)
+        if self.comms is not None:
+            watchdog.watch("serial", lambda: self.comms.frames_written, self.comms.keepalive + timeout, trips=False)
+        watchdog.start()
+        return watchdog
+
+    def _create_profiler(self) -> SamplingProfiler:
+        profiler = SamplingProfiler()
+        for name, source in (("gamepad", self.gamepad), ("serial", self.comms), ("udp receiver", self.receiver),
+                             ("watchdog", self.watchdog)):
+            if source is not None:
+                profiler.add_counters(name, source.stats)
+        if self.sender is not None:
+            sender = self.sender
+            # The round trip times are no counters
+            profiler.add_counters("udp sender", lambda: {key: value for key, value in sender.stats().items()
+                                                         if key in ("sent", "keyframes", "bytes_sent", "acks")})
+        return profiler
+
+    def select_port(self, discovery: PortDiscovery) -> PortFingerprint:
+        """Use the configured port or the antenna used before, and remember it.
+
+        Args:
+            discovery (PortDiscovery): The running discovery of the serial ports.
+
+        Returns:
+            PortFingerprint: The fingerprint of the selected port.
+
+        Raises:
+            RuntimeError: If no port is configured and no known antenna is connected.
+        """
+        cache = PortCache.load()
+        if self.config["port"] is not None:
+            port = self.config["port"]
+            fingerprint = next((found for found in discovery.fingerprints() if found.device == port),
+                               PortFingerprint(None, None, None, port))
+        else:
+            fingerprint = discovery.select(cache)
+            if fingerprint is None:
+                ports = ", ".join(found.device for found in discovery.fingerprints()) or "none"
+                raise RuntimeError(f"No known antenna connected, set the port (available: {ports})")
+
+        cache.remember(fingerprint)
+        cache.save()
+        return fingerprint
+
+    def left_joystick_move(self, x: float, y: float, stamp: InputStamp) -> None:
+        """Drive the tank with the left stick position, called in the reader thread."""
+        dispatched = self.latency.mark_dispatch(stamp)
+        # The gamepad normalized the raw values by a power of two, so this restores them exactly
+        left, right = self.shaper.motors(int(x * GamepadCore.MAX_JOY_VAL), int(y * GamepadCore.MAX_JOY_VAL))
+        self.tank.update(stamp=self.latency.mark_commit(stamp, dispatched), left=left, right=right)
+
+    def right_joystick_move(self, x: float, y: float, stamp: InputStamp) -> None:
+        """Move the tower with the right stick position, called in the reader thread."""
+        dispatched = self.latency.mark_dispatch(stamp)
+        self.tank.update(stamp=self.latency.mark_commit(stamp, dispatched), tower_x=x, tower_y=y)
+
+    def r2_pressed(self, r: float, stamp: InputStamp) -> None:
+        """Shoot water while the right trigger is pressed, called in the reader thread."""
+        dispatched = self.latency.mark_dispatch(stamp)
+        self.tank.update(stamp=self.latency.mark_commit(stamp, dispatched), water=1 if r > 0.1 else 0)
+
+    def x_clicked(self, val: int) -> None:
+        """Switch the light, called in the reader thread."""
+        self.tank.light = val
+
+    def run(self, stopped: threading.Event) -> None:
+        """Print the status regularly until stopped, then stop the tank and the threads.
+
+        Args:
+            stopped (threading.Event): The event ending the run, e.g. set by a signal handler.
+        """
+        reported = False
+        while not stopped.wait(self.config["status_interval"] if reported else 0.1):
+            first_sent = (self.sender or self.comms).first_sent
+            if not reported and first_sent is not None:
+                reported = True
+                self.startup.mark("first_command", first_sent)
+                print(self.startup.report(), flush=True)
+            if reported:
+                print(self.status_line(), flush=True)
+        self.close()
+
+    def status_line(self) -> str:
+        """Get a one line summary of the latency and the links.
+
+        Returns:
+            str: The status of every part that is running.
+        """
+        parts = [self.latency.status_line()] if self.gamepad is not None else []
+        parts += [part.status_line() for part in (self.receiver, self.sender, self.supervisor, self.comms,
+                                                  self.watchdog) if part is not None]
+        return " | ".join(part for part in parts if part)
+
+    def toggle_profiler(self) -> None:
+        """Start the profiler, or stop it and save the profile if it runs."""
+        if self.profiler.running:
+            self.save_profile()
+        else:
+            self.profiler.start()
+            print("profiling", flush=True)
+
+    def save_profile(self) -> None:
+        """Stop the profiler if it runs, write the collapsed stacks and print the report."""
+        if not self.profiler.running:
+            return
+        self.profiler.stop()
+        path = self.config["profile"] or PROFILE_PATH
+        self.profiler.write_collapsed(path)
+        print(self.profiler.report(), flush=True)
+        print(f"Profile written to {path}", flush=True)
+
+    def close(self) -> None:
+        """Stop reading the gamepads or the operator, stop the tank and close the links."""
+        for source in (self.watchdog, self.gamepad, self.receiver):
+            if source is not None:
+                source.stop()
+        written = self.comms.frames_written if self.comms is not None else 0
+        version = self.tank.stop()
+        if self.sender is not None:
+            time.sleep(self.sender.keepalive)  # Let the stop reach the relay
+        if self.comms is not None:
+            # Let the stop reach the antenna, a keepalive is written at the latest
+            deadline = time.monotonic() + self.comms.keepalive + STOP_TIMEOUT
+            while ((self.comms.frames_written == written or self.comms.sent_version < version)
+                   and time.monotonic() < deadline):
+                time.sleep(0.005)
+        for link in (self.sender, self.supervisor):
+            if link is not None:
+                link.stop()
+        if self.comms is not None and self.comms.recorder is not None:
+            self.comms.recorder.flush()
+        if self.recorder is not None:
+            self.recorder.save(self.config["record"])
+        if self.gamepad is not None:
+            print(self.latency.report(), flush=True)
+        if self.watchdog is not None:
+            print(self.watchdog.report(), flush=True)
+        self.save_profile()
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    """Parse the command line, options left out keep the values of the configuration file.
+
+    Args:
+        argv (Optional[List[str]]): The arguments, sys.argv by default.
+
+    Returns:
+        argparse.Namespace: The options.
+    """
+    parser = argparse.ArgumentParser(description="FKF App without GUI")
+    parser.add_argument("--config", metavar="FILE", help="JSON file with the settings")
+    parser.add_argument("--port", help="serial port of the antenna, the one used before by default")
+    parser.add_argument("--baud-rate", type=int)
+    parser.add_argument("--max-rate", type=float, help="maximum frames per second")
+    parser.add_argument("--keepalive", type=float, help="seconds between frames without changes")
+    parser.add_argument("--deadzone", type=float)
+    parser.add_argument("--expo", type=float, help="stick curve, 0 linear to 1 cubic")
+    parser.add_argument("--left-trim", type=float, help="factor of the left motor, in [0, 1]")
+    parser.add_argument("--right-trim", type=float, help="factor of the right motor, in [0, 1]")
+    parser.add_argument("--roles", nargs="+", metavar="ROLES",
+                        help="comma separated roles (drive, turret, effects) of each gamepad in order")
+    parser.add_argument("--record", metavar="FILE", help="record the gamepad session to FILE")
+    parser.add_argument("--replay", metavar="FILE", help="replay a recorded session instead of the gamepad")
+    parser.add_argument("--speed", type=float, help="replay speed, 1 for real time, 0 for as fast as possible")
+    parser.add_argument("--status-interval", type=float, help="seconds between two status lines")
+    parser.add_argument("--udp-send", metavar="HOST:PORT", help="send the tank values to a relay instead of serial")
+    parser.add_argument("--udp-listen", metavar="[HOST:]PORT",
+                        help="act as relay, receive the tank values instead of reading gamepads")
+    parser.add_argument("--udp-keepalive", type=float, help="seconds between datagrams without changes")
+    parser.add_argument("--udp-operator", metavar="HOST",
+                        help="the only operator host the relay accepts, the first one heard by default")
+    parser.add_argument("--udp-secret", metavar="SECRET",
+                        help="secret shared by the operator and the relay to sign the datagrams, "
+                             "better set in the configuration file")
+    parser.add_argument("--profile", metavar="FILE",
+                        help="profile all threads from the start and write the collapsed stacks to FILE")
+    parser.add_argument("--failsafe-timeout", type=float,
+                        help="seconds the gamepad reader or the operator may stall before the tank stops, "
+                             "0 to disable")
+    parser.add_argument("--failsafe-ramp", type=float, help="seconds in which the motors are ramped down")
+    parser.add_argument("--flight-recorder", metavar="FILE",
+                        help="ring file keeping every frame sent to the antenna, empty to keep none")
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """Run the headless controller until SIGINT or SIGTERM.
+
+    Args:
+        argv (Optional[List[str]]): The arguments, sys.argv by default.
+
+    Returns:
+        int: The exit status.
+    """
+    startup = StartupTimer()
+    options = vars(parse_args(argv))
+    path = options.pop("config")
+    try:
+        controller = HeadlessController(load_config(path, **options), startup=startup)
+    except (RuntimeError, OSError, ValueError) as error:
+        print(f"error: {error}", file=sys.stderr)
+        return 1
+
+    stopped = threading.Event()
+    signal.signal(signal.SIGINT, lambda *_: stopped.set())
+    signal.signal(signal.SIGTERM, lambda *_: stopped.set())
+    if hasattr(signal, "SIGUSR1"):  # Not on Windows
+        signal.signal(signal.SIGUSR1, lambda *_: controller.toggle_profiler())
+    controller.run(stopped)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
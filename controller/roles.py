@@ -0,0 +1,98 @@
+""" A module assigning roles to the connected gamepads.
+
+Every gamepad read by the XboxController gets one or more roles:
+
+    drive    the left stick drives the tank
+    turret   the right stick moves the tower
+    effects  the right trigger shoots water and the buttons switch the light
+
+Several gamepads may share a role. Their inputs are then merged by
+priority: the first gamepad of the mapping that is not at rest wins, so a
+second operator can take over while the first one lets go of the stick.
+
+The roles are given in the order of the gamepads, e.g. "drive" and
+"turret,effects" let the first gamepad drive while the second one controls
+the tower and the water. A single gamepad always gets all roles, and a role
+no connected gamepad has falls back to the first one, so the tank stays
+fully controllable when a gamepad is unplugged.
+
+Typical usage:
+
+    mapping = RoleMapping.parse(["drive", "turret,effects"])
+    roles = mapping.resolve(["/dev/input/js-a", "/dev/input/js-b"])
+"""
+
+from typing import Dict, FrozenSet, Hashable, List, Optional, Sequence
+
+ROLE_DRIVE = "drive"
+ROLE_TURRET = "turret"
+ROLE_EFFECTS = "effects"
+ALL_ROLES = frozenset((ROLE_DRIVE, ROLE_TURRET, ROLE_EFFECTS))
+
+# Roles of the gamepads in their order when several are connected and none are given
+DEFAULT_ROLES = ["drive", "turret,effects"]
+
+
+class RoleMapping:
+    """Roles of the gamepads in their priority order.
+
+    Attributes:
+        roles: The roles of the first, second, ... gamepad.
+    """
+    def __init__(self, roles: Optional[List[FrozenSet[str]]] = None) -> None:
+        """Initializes the mapping.
+
+        Args:
+            roles (Optional[List[FrozenSet[str]]]): The roles by gamepad, DEFAULT_ROLES by default.
+                Gamepads beyond the list get all roles with the lowest priority.
+
+        Raises:
+            ValueError: If a role is unknown.
+        """
+        self.roles = roles if roles is not None else [self._parse_roles(spec) for spec in DEFAULT_ROLES]
+        for roles_of_gamepad in self.roles:
+            unknown = roles_of_gamepad - ALL_ROLES
+            if unknown:
+                raise ValueError(f"Unknown gamepad roles: {', '.join(sorted(unknown))}")
+
+    @classmethod
+    def parse(cls, specs: Optional[Sequence[str]]) -> "RoleMapping":
+        """Create a mapping from one comma separated list of roles per gamepad.
+
+        Args:
+            specs (Optional[Sequence[str]]): The roles of the gamepads in their order,
+                e.g. ["drive", "turret,effects"]. DEFAULT_ROLES if empty or None.
+
+        Returns:
+            RoleMapping: The mapping.
+
+        Raises:
+            ValueError: If a role is unknown.
+        """
+        if not specs:
+            return cls()
+        return cls([cls._parse_roles(spec) for spec in specs])
+
+    @staticmethod
+    def _parse_roles(spec: str) -> FrozenSet[str]:
+        return frozenset(role.strip() for role in spec.split(",") if role.strip())
+
+    def resolve(self, devices: Sequence[Hashable]) -> Dict[Hashable, FrozenSet[str]]:
+        """Assign the roles to the connected gamepads.
+
+        Args:
+            devices (Sequence[Hashable]): The connected gamepads in their order,
+                which is also their priority.
+
+        Returns:
+            Dict[Hashable, FrozenSet[str]]: The roles of every gamepad.
+        """
+        if len(devices) == 1:
+            return {devices[0]: ALL_ROLES}
+
+        assigned = {device: self.roles[index] if index < len(self.roles) else ALL_ROLES
+                    for index, device in enumerate(devices)}
+        if devices:
+            missing = ALL_ROLES.difference(*assigned.values())
+            assigned[devices[0]] = assigned[devices[0]] | missing
+        return assigned
@@ -0,0 +1,281 @@
+""" A module for recording gamepad input sessions and replaying them.
+
+A recorded session keeps every event read by the XboxController as its
+monotonic timestamp, event type, event code, state and gamepad. The values
+are kept in typed arrays and saved column by column, 17 bytes per event:
+
+    magic "FKFS", format version (uint32), event count (uint64)
+    timestamps (float64[count])
+    types (uint16[count])
+    codes (uint16[count])
+    states (int32[count])
+    devices (uint8[count])
+
+All numbers are little-endian. The event types and codes are the numbers
+of the Linux input subsystem, see controller.evdev_reader. The gamepads are
+numbered in priority order, as they were read when recording; files of
+version 1 have no devices column and hold the events of gamepad 0 only.
+
+A SessionPlayer has the same read() interface as an EvdevReader, so it can
+be passed to the XboxController instead of a real gamepad and replays the
+session in real time, N times faster or as fast as possible. Every recorded
+gamepad is replayed as a device of its own, so it gets the same roles.
+
+Typical usage:
+
+    recorder = SessionRecorder()
+    gamepad = XboxController(recorder=recorder)
+    ...
+    recorder.save("session.fkfs")
+
+    gamepad = XboxController(reader=SessionPlayer(SessionLog.load("session.fkfs"), speed=10))
+"""
+
+import struct
+import sys
+import threading
+import time
+from array import array
+from typing import Dict, Hashable, List, Optional
+
+from .evdev_reader import EVENT_CODES, EVENT_TYPES, EvdevEvent
+
+MAGIC = b"FKFS"
+VERSION = 2
+HEADER = struct.Struct("<4sIQ")
+
+# Numbers of the event codes by their names, as used by the event handlers
+EVENT_NUMBERS = {name: number for number, name in EVENT_CODES.items()}
+
+
+class SessionLog:
+    """Events of a gamepad session stored in typed arrays.
+
+    Attributes:
+        timestamps: The monotonic times of the events in seconds.
+        types: The event type numbers.
+        codes: The event code numbers.
+        states: The values of the events.
+        devices: The numbers of the gamepads the events were read from, in priority order.
+    """
+    def __init__(self) -> None:
+        """Initializes an empty log."""
+        self.timestamps = array("d")
+        self.types = array("H")
+        self.codes = array("H")
+        self.states = array("i")
+        self.devices = array("B")
+
+    def __len__(self) -> int:
+        return len(self.timestamps)
+
+    def append(self, timestamp: float, code: str, state: int, device: int = 0) -> bool:
+        """Add an event to the log.
+
+        Args:
+            timestamp (float): The monotonic time of the event in seconds.
+            code (str): The name of the event code, e.g. "ABS_X".
+            state (int): The value of the event.
+            device (int): The number of the gamepad in [0, 255] (default is the first one).
+
+        Returns:
+            bool: False if the code is unknown and the event was skipped.
+        """
+        number = EVENT_NUMBERS.get(code)
+        if number is None:
+            return False
+        self.timestamps.append(timestamp)
+        self.types.append(number[0])
+        self.codes.append(number[1])
+        self.states.append(state)
+        self.devices.append(device)
+        return True
+
+    def save(self, path: str) -> None:
+        """Write the log to a file.
+
+        Args:
+            path (str): The path of the file.
+        """
+        with open(path, "wb") as f:
+            f.write(HEADER.pack(MAGIC, VERSION, len(self)))
+            for column in (self.timestamps, self.types, self.codes, self.states, self.devices):
+                if sys.byteorder == "big":
+                    column = array(column.typecode, column)
+                    column.byteswap()
+                column.tofile(f)
+
+    @classmethod
+    def load(cls, path: str) -> "SessionLog":
+        """Read a log written by save(), also by the versions without the devices column.
+
+        Args:
+            path (str): The path of the file.
+
+        Returns:
+            SessionLog: The loaded log.
+
+        Raises:
+            ValueError: If the file is not a session log of a supported version.
+        """
+        log = cls()
+        with open(path, "rb") as f:
+            magic, version, count = HEADER.unpack(f.read(HEADER.size))
+            if magic != MAGIC or not 1 <= version <= VERSION:
+                raise ValueError(f"{path} is not a session log of version {VERSION} or older")
+            columns = [log.timestamps, log.types, log.codes, log.states]
+            if version >= 2:
+                columns.append(log.devices)
+            for column in columns:
+                column.fromfile(f, count)
+                if sys.byteorder == "big":
+                    column.byteswap()
+        if version < 2:
+            log.devices = array("B", bytes(count))
+        return log
+
+
+class SessionRecorder:
+    """Records the events read by an XboxController into a SessionLog.
+
+    Attributes:
+        log: The SessionLog the events are added to.
+        skipped: The number of events with an unknown code.
+    """
+    def __init__(self) -> None:
+        """Initializes the recorder with an empty log."""
+        self.log = SessionLog()
+        self.skipped = 0
+        self._numbers: Dict[Hashable, int] = {}
+        self._lock = threading.Lock()
+
+    def _number(self, device: Hashable) -> int:
+        number = self._numbers.get(device)
+        if number is None:
+            number = self._numbers[device] = min(len(self._numbers), 255)
+        return number
+
+    def record(self, events, read_time: Optional[float] = None, devices: Optional[List[Hashable]] = None) -> None:
+        """Add a batch of events read from the gamepads.
+
+        Args:
+            events: The events, with code, state and device attributes.
+            read_time (Optional[float]): The time the events were read, None to
+                use the monotonic timestamps of the events instead.
+            devices (Optional[List[Hashable]]): The gamepads read in priority order, numbered
+                in this order. Gamepads first seen in an event are numbered after them.
+        """
+        append = self.log.append
+        number = self._number
+        with self._lock:
+            if devices is not None:
+                for device in devices:
+                    number(device)
+            for event in events:
+                timestamp = event.timestamp if read_time is None else read_time
+                if not append(timestamp, event.code, event.state, number(event.device)):
+                    self.skipped += 1
+
+    def save(self, path: str) -> None:
+        """Write the recorded events to a file.
+
+        Args:
+            path (str): The path of the file.
+        """
+        with self._lock:
+            self.log.save(path)
+
+
+class SessionPlayer:
+    """Replays a SessionLog with the read() interface of an EvdevReader.
+
+    Every read() returns the events up to and including the next SYN_REPORT,
+    after waiting until they are due. The replayed events are stamped with
+    the time they are returned, so the latency measurement covers the replay.
+    The events of every recorded gamepad come from its own device, see device_name().
+
+    Attributes:
+        log: The replayed SessionLog.
+        speed: The replay speed, 1 for real time, 0 for as fast as possible.
+        finished: An Event set when all events were replayed.
+    """
+    DEVICE = "replay"
+
+    def __init__(self, log: SessionLog, speed: float = 1.0) -> None:
+        """Initializes the player at the start of the log.
+
+        Args:
+            log (SessionLog): The session to replay.
+            speed (float): The replay speed, 1 for real time, 0 for as fast as possible.
+        """
+        self.log = log
+        self.speed = speed
+        self.finished = threading.Event()
+        self._position = 0
+        self._start_time: Optional[float] = None
+        self._stopped = threading.Event()
+        self._devices = [self.device_name(number) for number in range(max(log.devices, default=0) + 1)]
+
+    @classmethod
+    def device_name(cls, number: int) -> str:
+        """Get the name of a replayed gamepad.
+
+        Args:
+            number (int): The number of the gamepad in the log.
+
+        Returns:
+            str: DEVICE for the first gamepad, e.g. "replay 2" for the second one.
+        """
+        return cls.DEVICE if number == 0 else f"{cls.DEVICE} {number + 1}"
+
+    @property
+    def devices(self) -> List[str]:
+        """The names of the replayed devices in priority order while events are left."""
+        return [] if self.finished.is_set() else list(self._devices)
+
+    def read(self, timeout: Optional[float] = None) -> List[EvdevEvent]:
+        """Return the next input frame once it is due.
+
+        Args:
+            timeout (Optional[float]): The maximum time to wait in seconds.
+
+        Returns:
+            List[EvdevEvent]: The events of the frame, empty on timeout, at the end or after stop().
+        """
+        log = self.log
+        if self._position >= len(log):
+            self.finished.set()
+            self._stopped.wait(timeout)
+            return []
+
+        if self._start_time is None:
+            self._start_time = time.monotonic()
+        if self.speed > 0:
+            due = self._start_time + (log.timestamps[self._position] - log.timestamps[0]) / self.speed
+            delay = due - time.monotonic()
+            if delay > 0:
+                if timeout is not None and delay > timeout:
+                    self._stopped.wait(timeout)
+                    return []
+                if self._stopped.wait(delay):
+                    return []
+
+        now = time.monotonic()
+        devices = self._devices
+        events = []
+        while self._position < len(log):
+            index = self._position
+            self._position += 1
+            number = (log.types[index], log.codes[index])
+            events.append(EvdevEvent(EVENT_TYPES[number[0]], EVENT_CODES[number], log.states[index], now,
+                                     devices[log.devices[index]]))
+            if events[-1].code == "SYN_REPORT":
+                break
+        return events
+
+    def stop(self) -> None:
+        """Wake up a read() waiting in another thread."""
+        self._stopped.set()
+
+    def close(self) -> None:
+        """Nothing to release, present for the reader interface."""
@@ -0,0 +1,233 @@
+""" A module for shaping the stick input into motor commands with lookup tables.
+
+The InputShaper precomputes the whole way from the raw 16-bit stick axes
+to the bytes sent to the antenna: radial deadzone, expo curve, the
+differential steering of the tank, per-motor trim and the conversion into
+direction and speed bytes. At runtime one stick position costs two list
+lookups instead of several float operations.
+
+Each axis is quantized to its upper 8 bits, so the tables have 256 x 256
+cells. The motor values looked up by motors() are exact multiples of 1/255,
+so the Tank keeps floats that the encoder turns back into the same bytes.
+The message bytes of the motors (direction and speed of the left and right
+motor) are kept in a third table for the batch functions.
+
+The batch functions process whole recorded sessions at once and need
+NumPy, which is an optional dependency.
+
+Typical usage:
+
+    shaper = InputShaper(deadzone=0.1, expo=0.3, left_trim=0.95)
+    left, right = shaper.motors(raw_x, raw_y)
+"""
+
+import math
+from typing import List, Optional, Tuple
+
+from .roles import ROLE_DRIVE, RoleMapping
+
+try:
+    import numpy as np
+except ImportError:  # Only the batch functions need NumPy
+    np = None
+
+AXIS_BITS = 8
+AXIS_CELLS = 1 << AXIS_BITS
+AXIS_SHIFT = 16 - AXIS_BITS
+AXIS_OFFSET = AXIS_CELLS // 2
+MAX_JOY_VAL = 1 << 15
+
+# Motor value in [-1, 1] of every signed speed in [-255, 255], offset by 255
+SIGNED_SPEEDS = [speed / 255 for speed in range(-255, 256)]
+
+
+def steering(x, y):
+    # Calculate initial motor speeds
+    left_speed = y + x
+    right_speed = y - x
+
+    # Find the maximum absolute value among the speeds
+    max_speed = max(abs(left_speed), abs(right_speed))
+
+    # Normalize the speeds if necessary
+    if max_speed > 1:
+        left_speed /= max_speed
+        right_speed /= max_speed
+
+    return left_speed, right_speed
+
+
+def _require_numpy() -> None:
+    if np is None:
+        raise ImportError("NumPy is needed for the batch functions of the InputShaper")
+
+
+def _last_states(states, mask):
+    """Get the state of the last masked event at every position, 0 before the first one."""
+    last = np.maximum.accumulate(np.where(mask, np.arange(len(states)), -1))
+    return np.where(last >= 0, states[np.maximum(last, 0)], 0)
+
+
+def _drive_axes(log, frames, numbers: List[Tuple[int, int]], drive: List[int], deadzone: float):
+    """Merge the sticks of the drive gamepads at every input frame like GamepadCore does."""
+    types = np.asarray(log.types)
+    codes = np.asarray(log.codes)
+    devices = np.asarray(log.devices)
+    states = np.asarray(log.states, dtype=np.int32)
+    merged = np.zeros((2, int(frames.sum())), dtype=np.int32)
+    # The lowest priority first, so the first gamepad outside the deadzone is written last
+    for device in reversed(drive):
+        axes = [_last_states(states, (types == number[0]) & (codes == number[1]) & (devices == device))[frames]
+                for number in numbers]
+        outside = (axes[0] / MAX_JOY_VAL) ** 2 + (axes[1] / MAX_JOY_VAL) ** 2 > deadzone * deadzone
+        merged = np.where(outside, axes, merged)
+    return merged
+
+
+class InputShaper:
+    """Lookup tables from raw stick axes to motor values and message bytes.
+
+    Attributes:
+        deadzone: The radius around the centre in which the motors stay off, in [0, 1).
+        expo: The share of the cubic curve in [0, 1], higher values give finer control at low speed.
+        left_trim: The factor applied to the left motor.
+        right_trim: The factor applied to the right motor.
+    """
+    def __init__(self, deadzone: float = 0.1, expo: float = 0.0, left_trim: float = 1.0,
+                 right_trim: float = 1.0) -> None:
+        """Initializes the shaper and builds its tables.
+
+        Args:
+            deadzone (float): The radial deadzone (default is 0.1).
+            expo (float): The expo factor (default is 0, a linear response).
+            left_trim (float): The factor of the left motor (default is 1).
+            right_trim (float): The factor of the right motor (default is 1).
+
+        Raises:
+            ValueError: If a parameter is out of its range.
+        """
+        if not 0 <= deadzone < 1:
+            raise ValueError("Deadzone should be in the [0; 1) interval")
+        if not 0 <= expo <= 1:
+            raise ValueError("Expo should be in the [0; 1] interval")
+        if not (0 <= left_trim <= 1 and 0 <= right_trim <= 1):
+            raise ValueError("Trim should be in the [0; 1] interval")
+
+        self.deadzone = deadzone
+        self.expo = expo
+        self.left_trim = left_trim
+        self.right_trim = right_trim
+
+        self._wire = bytearray()
+        self._left: List[float] = []
+        self._right: List[float] = []
+        self._build()
+
+    def _shape_axis(self, value: float) -> float:
+        return (1 - self.expo) * value + self.expo * value ** 3
+
+    def _shape(self, x: float, y: float) -> Tuple[int, int]:
+        """Compute the signed motor speeds of one stick position.
+
+        Args:
+            x (float): The normalized x axis in [-1, 1].
+            y (float): The normalized y axis in [-1, 1].
+
+        Returns:
+            Tuple[int, int]: The signed speeds of the left and right motor in [-255, 255].
+        """
+        radius = math.hypot(x, y)
+        if radius <= self.deadzone:
+            return 0, 0
+        scale = min(1.0, (radius - self.deadzone) / (1 - self.deadzone)) / radius
+        left, right = steering(self._shape_axis(x * scale), self._shape_axis(y * scale))
+        return round(left * self.left_trim * 255), round(right * self.right_trim * 255)
+
+    def _build(self) -> None:
+        """Fill the tables for every quantized stick position."""
+        # Centres of the quantization cells, normalized like XboxController does
+        centres = [((cell - AXIS_OFFSET) << AXIS_SHIFT | 1 << (AXIS_SHIFT - 1)) / MAX_JOY_VAL
+                   for cell in range(AXIS_CELLS)]
+        shape = self._shape
+        wire = bytearray()
+        left_speeds = []
+        right_speeds = []
+        for x in centres:
+            for y in centres:
+                left, right = shape(x, y)
+                wire += bytes((left >= 0, abs(left), right >= 0, abs(right)))
+                left_speeds.append(left)
+                right_speeds.append(right)
+        self._wire = wire
+        self._left = [SIGNED_SPEEDS[speed + 255] for speed in left_speeds]
+        self._right = [SIGNED_SPEEDS[speed + 255] for speed in right_speeds]
+
+    @staticmethod
+    def _index(raw_x: int, raw_y: int) -> int:
+        return ((raw_x >> AXIS_SHIFT) + AXIS_OFFSET) << AXIS_BITS | ((raw_y >> AXIS_SHIFT) + AXIS_OFFSET)
+
+    def motors(self, raw_x: int, raw_y: int) -> Tuple[float, float]:
+        """Get the motor values of a stick position.
+
+        Args:
+            raw_x (int): The raw x axis value in [-32768, 32767].
+            raw_y (int): The raw y axis value in [-32768, 32767].
+
+        Returns:
+            Tuple[float, float]: The left and right motor values in [-1, 1], exact multiples
+                of 1/255, so they convert back to the same bytes.
+        """
+        index = self._index(raw_x, raw_y)
+        return self._left[index], self._right[index]
+
+    def wire_batch(self, raw_x, raw_y):
+        """Get the message bytes of the motors for many stick positions at once.
+
+        Args:
+            raw_x: Array-like of raw x axis values.
+            raw_y: Array-like of raw y axis values of the same length.
+
+        Returns:
+            numpy.ndarray: An (N, 4) uint8 array with the bytes of every position.
+
+        Raises:
+            ImportError: If NumPy is not installed.
+        """
+        _require_numpy()
+        cells_x = (np.asarray(raw_x, dtype=np.int32) >> AXIS_SHIFT) + AXIS_OFFSET
+        cells_y = (np.asarray(raw_y, dtype=np.int32) >> AXIS_SHIFT) + AXIS_OFFSET
+        table = np.frombuffer(self._wire, dtype=np.uint8).reshape(-1, 4)
+        return table[cells_x << AXIS_BITS | cells_y]
+
+    def session_batch(self, log, x_code: str = "ABS_X", y_code: str = "ABS_Y",
+                      roles: Optional[RoleMapping] = None):
+        """Compute the message bytes of the motors after every input frame of a recorded session.
+
+        The sticks of the gamepads with the drive role are merged like GamepadCore does: the first
+        one outside the radial deadzone drives, the motors stay off while all of them are at rest.
+
+        Args:
+            log (SessionLog): The recorded session.
+            x_code (str): The name of the x axis event code (default is the left stick).
+            y_code (str): The name of the y axis event code (default is the left stick).
+            roles (Optional[RoleMapping]): The roles of the recorded gamepads, the default mapping by default.
+
+        Returns:
+            Tuple[numpy.ndarray, numpy.ndarray]: The timestamps of the SYN_REPORT events
+                and the (N, 4) uint8 array of the bytes at each of them.
+
+        Raises:
+            ImportError: If NumPy is not installed.
+        """
+        _require_numpy()
+        # pylint: disable=import-outside-toplevel
+        from .session import EVENT_NUMBERS
+
+        types = np.asarray(log.types)
+        codes = np.asarray(log.codes)
+        syn = EVENT_NUMBERS["SYN_REPORT"]
+        frames = (types == syn[0]) & (codes == syn[1])
+        assignments = (roles or RoleMapping()).resolve(range(max(log.devices, default=0) + 1))
+        drive = [device for device, device_roles in assignments.items() if ROLE_DRIVE in device_roles]
+        raw_x, raw_y = _drive_axes(log, frames, [EVENT_NUMBERS[x_code], EVENT_NUMBERS[y_code]], drive, self.deadzone)
+        return np.asarray(log.timestamps)[frames], self.wire_batch(raw_x, raw_y)
@@ -1,13 +1,89 @@
+import time
+LAUNCH_TIME = time.monotonic()
+
+# pylint: disable=wrong-import-position
+import argparse
 import sys
 from PySide6.QtWidgets import QApplication
 from controller.controls import Controls
+from controller.gamepad import XboxController
+from controller.roles import RoleMapping
+from controller.session import SessionLog, SessionPlayer, SessionRecorder
+from controller.shaping import InputShaper
+from model.discovery import StartupTimer
+from model.flight_recorder import FLIGHT_RECORDER_PATH
+from model.watchdog import DEFAULT_RAMP, DEFAULT_TIMEOUT
+from view.video import VideoStream
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="FKF App")
+    parser.add_argument("--record", metavar="FILE", help="record the gamepad session to FILE")
+    parser.add_argument("--replay", metavar="FILE", help="replay a recorded session instead of the gamepad")
+    parser.add_argument("--speed", type=float, default=1.0,
+                        help="replay speed, 1 for real time, 0 for as fast as possible")
+    parser.add_argument("--tanks", type=int, default=1, help="number of tanks driven over the antenna")
+    parser.add_argument("--roles", nargs="+", metavar="ROLES",
+                        help="comma separated roles (drive, turret, effects) of each gamepad in order, "
+                             "e.g. --roles drive turret,effects")
+    parser.add_argument("--video", metavar="SOURCE",
+                        help="camera feed shown in the window, tcp://HOST:PORT, a file, a pipe or - for stdin")
+    parser.add_argument("--video-format", default="mjpeg",
+                        help="mjpeg or raw frames like rgb24:640x480 (rgb24, rgba or gray)")
+    parser.add_argument("--video-rate", type=float, help="maximum frames per second read, e.g. to play a file")
+    parser.add_argument("--flight-recorder", metavar="FILE", default=FLIGHT_RECORDER_PATH,
+                        help="ring file keeping every frame sent to the antenna, empty to keep none")
+    parser.add_argument("--profile", metavar="FILE",
+                        help="profile all threads from the start and write the collapsed stacks to FILE, "
+                             "Ctrl+Shift+P starts and stops the profiler")
+    parser.add_argument("--failsafe-timeout", type=float, default=DEFAULT_TIMEOUT,
+                        help="seconds the gamepad reader or the GUI may stall before the tank stops, 0 to disable")
+    parser.add_argument("--failsafe-ramp", type=float, default=DEFAULT_RAMP,
+                        help="seconds in which the motors are ramped down when the failsafe trips")
+    parser.add_argument("--deadzone", type=float, default=XboxController.DEADZONE,
+                        help="radius around the centre of the left stick in which the motors stay off")
+    parser.add_argument("--expo", type=float, default=0.0, help="left stick curve, 0 linear to 1 cubic")
+    parser.add_argument("--left-trim", type=float, default=1.0, help="factor of the left motor, in [0, 1]")
+    parser.add_argument("--right-trim", type=float, default=1.0, help="factor of the right motor, in [0, 1]")
+    parser.add_argument("--refresh-rate", type=float, default=60.0,
+                        help="maximum GUI refreshes per second, lower it on slow machines")
+    args, _ = parser.parse_known_args()
+    return args
 
 
 def main() -> None:
+    startup = StartupTimer(LAUNCH_TIME)
+    startup.mark("imports")
+    args = parse_args()
+    try:
+        shaper = InputShaper(deadzone=args.deadzone, expo=args.expo, left_trim=args.left_trim,
+                             right_trim=args.right_trim)
+    except ValueError as error:
+        sys.exit(f"error: {error}")
     app = QApplication(sys.argv)
+    startup.mark("qt_application")
+
+    recorder = SessionRecorder() if args.record else None
+    reader = SessionPlayer(SessionLog.load(args.replay), args.speed) if args.replay else None
 
-    controls = Controls()
+    controls = Controls(reader=reader, recorder=recorder, startup=startup, tanks=args.tanks,
+                        roles=RoleMapping.parse(args.roles), flight_recorder=args.flight_recorder,
+                        profile=args.profile, failsafe_timeout=args.failsafe_timeout,
+                        failsafe_ramp=args.failsafe_ramp, shaper=shaper)
+    controls.window.set_refresh_rate(args.refresh_rate)
+    if args.video:
+        video = VideoStream(args.video, args.video_format, args.video_rate)
+        controls.window.monitor.set_stream(video)
+        video.start()
+        app.aboutToQuit.connect(video.stop)
     controls.window.show()
+    startup.mark("window_shown")
+    app.aboutToQuit.connect(lambda: print(controls.latency.report()))
+    app.aboutToQuit.connect(controls.save_profile)
+    if controls.watchdog is not None:
+        app.aboutToQuit.connect(lambda: print(controls.watchdog.report()))
+    if recorder is not None:
+        app.aboutToQuit.connect(lambda: recorder.save(args.record))
 
     sys.exit(app.exec())
 
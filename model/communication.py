@@ -1,21 +1,39 @@
 """ A module for converting program data to the required format and communicating it via serial.
 
 Represent the part of the model in the MVC. Receives the data from
-the controller, converts it to the required byte format and sends
-it to a connected microcontroller via pyserial.
+the controller, converts it to the required byte format, wraps it
+into a frame (see model.protocol) and sends it to a connected
+microcontroller via pyserial.
+
+The frames are scheduled by priority, see SerialMessenger.transmit_on_change:
+a stop, light or water change is written at once, while motion updates are
+merged and only fill the link capacity left.
 
 Typical usage:
 
     communication = SerialMessenger(port, baud_rate=9600)
+    threading.Thread(target=communication.transmit_on_change, daemon=True).start()
 """
 
+import struct
 import time
-from typing import List
+from typing import Dict, List, Optional, Tuple
 
 import serial
 import serial.tools.list_ports
 
-from model.tank import Tank
+from model.flight_recorder import FlightRecorder
+from model.latency import LatencyTracker
+from model.protocol import CRC_SIZE, HEADER_SIZE, SYNC, crc16
+from model.tank import Tank, TankState
+
+# Priority classes of the frames, the lower the more urgent
+PRIORITY_SAFETY = 0
+PRIORITY_EVENT = 1
+PRIORITY_MOTION = 2
+PRIORITY_KEEPALIVE = 3
+PRIORITY_NAMES = ("safety", "event", "motion", "keepalive")
+BITS_PER_BYTE = 10  # 8N1: a start and a stop bit per byte
 
 
 def float_to_byte(value: float) -> int:
@@ -47,6 +65,100 @@ def float_to_int_255(value):
     return int(round(value * 255))
 
 
+def frame_values(state: TankState) -> Tuple[int, int, int, int]:
+    """Get the values of the tank that a frame carries, at the resolution it carries them.
+
+    Args:
+        state (TankState): The values of the tank.
+
+    Returns:
+        Tuple[int, int, int, int]: The signed left and right speed in [-255, 255], light and water.
+    """
+    return round(state.left * 255), round(state.right * 255), state.light, state.water
+
+
+def frame_priority(sent: Optional[Tuple[int, int, int, int]], values: Tuple[int, int, int, int]) -> Optional[int]:
+    """Classify the change between the frame sent last and the next one.
+
+    Args:
+        sent (Optional[Tuple[int, int, int, int]]): The frame_values() sent last, None before the first frame.
+        values (Tuple[int, int, int, int]): The frame_values() to send.
+
+    Returns:
+        Optional[int]: PRIORITY_SAFETY if the running motors stop, PRIORITY_EVENT if the light
+            or water changes (or for the first frame), PRIORITY_MOTION if only the speeds change
+            and None if the frame would not change.
+    """
+    if sent is None:
+        return PRIORITY_EVENT
+    if values == sent:
+        return None
+    if values[:2] == (0, 0) != sent[:2]:
+        return PRIORITY_SAFETY
+    if values[2:] != sent[2:]:
+        return PRIORITY_EVENT
+    return PRIORITY_MOTION
+
+
+class TankFrameEncoder:
+    """Encoder packing the tank values into a preallocated frame.
+
+    The frame is written into the same bytearray every time, so encoding
+    does not create any intermediate objects. The message inside the frame
+    holds the direction and speed of both motors followed by the light and
+    water flags. Subclasses may reserve ADDRESS_SIZE bytes in front of it,
+    which they fill before calling encode().
+
+    Attributes:
+        MESSAGE: The struct of the message.
+        MESSAGE_SIZE: The length of the message in bytes.
+        ADDRESS_SIZE: The length of the address in front of the message in bytes.
+    """
+    MESSAGE = struct.Struct(">6B")
+    MESSAGE_SIZE = 6
+    ADDRESS_SIZE = 0
+    CRC = struct.Struct(">H")
+
+    def __init__(self) -> None:
+        """Initializes the buffer with the constant part of the frame."""
+        payload_size = self.ADDRESS_SIZE + self.MESSAGE_SIZE
+        self._buffer = bytearray(HEADER_SIZE + payload_size + CRC_SIZE)
+        self._buffer[:len(SYNC)] = SYNC
+        self._buffer[len(SYNC)] = payload_size
+        self._view = memoryview(self._buffer)
+        self._body = self._view[len(SYNC):HEADER_SIZE + payload_size]
+        self._seq_offset = len(SYNC) + 1
+        self._message_offset = HEADER_SIZE + self.ADDRESS_SIZE
+        self._crc_offset = HEADER_SIZE + payload_size
+
+        # Bound methods looked up once instead of on every frame
+        self._pack_message = self.MESSAGE.pack_into
+        self._pack_crc = self.CRC.pack_into
+
+    def encode(self, state: TankState, seq: int) -> memoryview:
+        """Pack the tank values into the frame.
+
+        Args:
+            state (TankState): The values of the tank to send.
+            seq (int): The sequence number of the frame, taken modulo 256.
+
+        Returns:
+            memoryview: A view of the frame, valid until the next call.
+        """
+        buffer = self._buffer
+        left = state.left
+        right = state.right
+        buffer[self._seq_offset] = seq & 0xFF
+        self._pack_message(
+            buffer, self._message_offset,
+            left >= 0, round(abs(left) * 255),
+            right >= 0, round(abs(right) * 255),
+            state.light, state.water,
+        )
+        self._pack_crc(buffer, self._crc_offset, crc16(self._body))
+        return self._view
+
+
 class SerialMessenger:
     """Communication point between program and physical tank.
 
@@ -59,19 +171,57 @@ class SerialMessenger:
         baud_rate: An integer representing the speed of data transmission in bits per second.
         ser: A serial.Serial instance representing the serial connection.
         tank: instance of tank class representing the values needed to be sent
+        max_rate: The maximum number of motion frames per second sent in send-on-change mode.
+        keepalive: The interval in seconds after which an unchanged frame is repeated.
+        seq: The sequence number of the next frame.
+        encoder: The TankFrameEncoder reused for every frame.
+        latency: The LatencyTracker recording when the values of an input are written.
+        first_sent: The monotonic time the first frame was written, None before.
+        sent_version: The tank version whose values are on the wire, -1 before the first frame
+            of transmit_on_change.
+        recorder: The FlightRecorder keeping every frame written, None to keep none.
+        loops: The number of iterations of the send loop.
+        frames_written: The number of frames written.
+        write_time: The time in seconds spent blocked in writing to serial.
+        bytes_per_second: The capacity of the link at the baud rate.
+        link_free_at: The monotonic time the bytes written so far are expected to be sent.
+        class_frames: The number of frames written of every priority class.
+        class_bytes: The number of bytes written of every priority class.
     """
-    def __init__(self, port: str, baud_rate: int = 9600) -> None:
+    def __init__(self, port: str, baud_rate: int = 9600, max_rate: float = 50.0, keepalive: float = 1.0,
+                 latency: Optional[LatencyTracker] = None, tank: Optional[Tank] = None,
+                 recorder: Optional[FlightRecorder] = None) -> None:
         """Initializes the SerialMessenger with a given port and baud rate.
 
         Args:
             port (str): The serial port to which the antenna is connected.
             baud_rate (int): The speed of data transmission in bits per second (default is 9600).
+            max_rate (float): The maximum motion frame rate in send-on-change mode (default is 50 per second).
+            keepalive (float): The keepalive interval in send-on-change mode (default is 1 second).
+            latency (Optional[LatencyTracker]): The tracker shared with the controller, a new one by default.
+            tank (Optional[Tank]): The tank whose values are sent, a new one by default.
+            recorder (Optional[FlightRecorder]): The recorder of the frames written, none by default.
         """
         self.port = port
         self.baud_rate = baud_rate
+        self.max_rate = max_rate
+        self.keepalive = keepalive
         self.ser = serial.Serial(port, baud_rate)
+        self.seq = 0
+        self.encoder = TankFrameEncoder()
+        self.latency = latency or LatencyTracker()
+        self.first_sent: Optional[float] = None
+        self.sent_version = -1
+        self.recorder = recorder
+        self.loops = 0
+        self.frames_written = 0
+        self.write_time = 0.0
+        self.bytes_per_second = baud_rate / BITS_PER_BYTE
+        self.link_free_at = 0.0
+        self.class_frames = [0] * len(PRIORITY_NAMES)
+        self.class_bytes = [0] * len(PRIORITY_NAMES)
 
-        self.tank = Tank()
+        self.tank = tank if tank is not None else Tank()
 
     @staticmethod
     def all_ports() -> List[str]:
@@ -87,36 +237,152 @@ class SerialMessenger:
 
         return all_ports
 
+    def reopen(self, port: str) -> None:
+        """Close the serial connection and open the given port instead.
+
+        Args:
+            port (str): The serial port to which the antenna is connected now.
+
+        Raises:
+            serial.SerialException: If the port cannot be opened.
+        """
+        self.close_serial()
+        self.ser = serial.Serial(port, self.baud_rate)
+        self.port = port
+
     def close_serial(self) -> None:
         """Closes the serial connection."""
         if self.ser.is_open:
             self.ser.close()
 
+    def send_state(self, state: TankState, priority: int = PRIORITY_MOTION) -> None:
+        """Encode the tank values into a frame and send it over serial.
+
+        Args:
+            state (TankState): The values of the tank to send.
+            priority (int): The priority class the frame is counted in (default is PRIORITY_MOTION).
+        """
+        self.send_frame(self.encoder.encode(state, self.seq), priority)
+
+    def send_frame(self, frame, priority: int = PRIORITY_MOTION) -> None:
+        """Write a frame encoded with the current sequence number and advance it.
+
+        Args:
+            frame: The bytes-like frame.
+            priority (int): The priority class the frame is counted in (default is PRIORITY_MOTION).
+        """
+        start = time.perf_counter()
+        self.ser.write(frame)
+        self.write_time += time.perf_counter() - start
+        self.frames_written += 1
+        size = len(frame)
+        self.class_frames[priority] += 1
+        self.class_bytes[priority] += size
+        self.link_free_at = max(time.monotonic(), self.link_free_at) + size / self.bytes_per_second
+        if self.recorder is not None:
+            self.recorder.record(self.seq, frame)
+        self.seq = (self.seq + 1) & 0xFF
+        if self.first_sent is None:
+            self.first_sent = time.monotonic()
+
+    def stats(self) -> dict:
+        """Get the counters of the send loop.
+
+        Returns:
+            dict: The loop iterations, frames written, time blocked in writing and
+                the frames and bytes of every priority class.
+        """
+        stats = {"loops": self.loops, "frames_written": self.frames_written, "write_time": self.write_time}
+        for priority, name in enumerate(PRIORITY_NAMES):
+            stats[f"{name}_frames"] = self.class_frames[priority]
+            stats[f"{name}_bytes"] = self.class_bytes[priority]
+        return stats
+
+    def utilisation(self) -> Dict[str, float]:
+        """Get the share of the link capacity used by every priority class since the first frame.
+
+        Returns:
+            Dict[str, float]: The used share in [0, 1] by class name, and the total under "total".
+        """
+        elapsed = time.monotonic() - self.first_sent if self.first_sent is not None else 0.0
+        capacity = max(elapsed, 1 / self.bytes_per_second) * self.bytes_per_second
+        shares = {name: self.class_bytes[priority] / capacity for priority, name in enumerate(PRIORITY_NAMES)}
+        shares["total"] = sum(self.class_bytes) / capacity
+        return shares
+
+    def status_line(self) -> str:
+        """Get a one line summary of the link usage for the status bar.
+
+        Returns:
+            str: The share of the link capacity used in total and by motion frames.
+        """
+        if self.first_sent is None:
+            return ""
+        shares = self.utilisation()
+        return f"link {shares['total'] * 100:.0f} % used, motion {shares['motion'] * 100:.0f} %"
+
     def print_data(self) -> None:
-        """Print tank data and send it over serial.
+        """Send tank data over serial at a fixed rate.
 
         This method retrieves tank data, converts it to the required byte format,
         and sends it over the serial connection.
-        It runs in a loop with a delay of 1 second.
+        It runs in a loop with a delay of 100 milliseconds.
         """
+        last_stamp = None
         while True:
-            tank_values = self.tank.get_values()
-            print(tank_values.values())
-            byte_msg = []
+            self.loops += 1
+            _, state, stamp = self.tank.snapshot()
+            self.send_state(state)
+            if stamp is not None and stamp is not last_stamp:
+                last_stamp = stamp
+                self.latency.mark_sent(stamp)
+            time.sleep(0.1)
 
-            left_sign = 0 if tank_values["left_motor"] < 0 else 1
-            right_sign = 0 if tank_values["right_motor"] < 0 else 1
+    def transmit_on_change(self) -> None:
+        """Send tank data over serial as soon as it changes, the urgent changes first.
 
-            byte_msg.append(left_sign)
-            byte_msg.append(float_to_int_255(abs(tank_values["left_motor"])))
+        Every change is classified by frame_priority(). A stop, light or water
+        change is written at once and waits at most for the frame on the
+        wire. Motion updates are merged: they are written at most max_rate
+        times per second and only once the link is idle, so they fill the
+        remaining capacity without building a queue in front of an urgent
+        frame. Changes the frame does not carry, like the tower, are not
+        sent. If nothing changes, the last frame is repeated every keepalive
+        seconds. Runs inside a thread.
+        """
+        min_interval = 1 / self.max_rate
+        last_motion = -min_interval
+        last_sent = 0.0
+        self.sent_version = -1  # The frame of the current values is due after a reconnection
+        sent_values = None
+        last_stamp = None
 
-            byte_msg.append(right_sign)
-            byte_msg.append(float_to_int_255(abs(tank_values["right_motor"])))
+        while True:
+            self.loops += 1
+            # The version belongs to the sent values, so a change made
+            # while the frame is written triggers another one.
+            version, state, stamp = self.tank.snapshot()
+            now = time.monotonic()
+            values = frame_values(state)
+            priority = frame_priority(sent_values, values) if version != self.sent_version else None
+            if priority is None:
+                self.sent_version = version
+                if now - last_sent < self.keepalive:
+                    self.tank.wait_for_change(version, last_sent + self.keepalive - now)
+                    continue
+                priority = PRIORITY_KEEPALIVE
+            elif priority == PRIORITY_MOTION:
+                ready = max(last_motion + min_interval, self.link_free_at)
+                if now < ready:
+                    # Any change ends the wait early, only an urgent one is written before ready
+                    self.tank.wait_for_change(version, ready - now)
+                    continue
+                last_motion = now
 
-            byte_msg.append(tank_values["light"])
-            byte_msg.append(tank_values["water"])
-            print(byte_msg)
-            byte_data = bytes(byte_msg)
-            # Send the byte data over serial
-            self.ser.write(byte_data)
-            time.sleep(0.1)
+            self.send_state(state, priority)
+            self.sent_version = version
+            sent_values = values
+            if stamp is not None and stamp is not last_stamp:
+                last_stamp = stamp
+                self.latency.mark_sent(stamp)
+            last_sent = time.monotonic()
@@ -0,0 +1,214 @@
+""" A module finding the antenna among the serial ports without blocking the startup.
+
+PortDiscovery lists the serial ports in a background thread while the
+window is being built. The PortCache remembers the fingerprints of the
+antennas used before (see model.link.PortFingerprint), so the antenna is
+selected automatically when it is plugged in again, even under another
+port name. Ports without USB information are only remembered by their
+name and trusted for a few minutes, like before.
+
+StartupTimer measures how long each phase of the startup takes, up to the
+first command sent to the antenna.
+
+Typical usage:
+
+    discovery = PortDiscovery()
+    discovery.start()
+    ...
+    fingerprint = discovery.select(PortCache.load())
+"""
+
+import json
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import List, Optional, Tuple
+
+import serial.tools.list_ports
+
+from model.link import PortFingerprint
+
+PORTS_PATH = "../ports.json"
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+# Ports known by name only are matched again for this long after their last use
+PATH_ONLY_VALIDITY = timedelta(minutes=5)
+
+
+class PortCache:
+    """Fingerprints of the antennas used before, the most recent one first.
+
+    Attributes:
+        path: The path of the JSON file.
+        entries: Pairs of the fingerprint and the time it was last used.
+    """
+    MAX_ENTRIES = 8
+
+    def __init__(self, path: str = PORTS_PATH,
+                 entries: Optional[List[Tuple[PortFingerprint, datetime]]] = None) -> None:
+        """Initializes the cache.
+
+        Args:
+            path (str): The path of the JSON file (default is ../ports.json).
+            entries (Optional[List[Tuple[PortFingerprint, datetime]]]): The known fingerprints.
+        """
+        self.path = path
+        self.entries = entries or []
+
+    @classmethod
+    def load(cls, path: str = PORTS_PATH) -> "PortCache":
+        """Read the cache, empty if the file does not exist or is invalid, without its damaged entries.
+
+        Args:
+            path (str): The path of the JSON file (default is ../ports.json).
+
+        Returns:
+            PortCache: The loaded cache.
+        """
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return cls(path)
+
+        if not isinstance(data, dict):
+            return cls(path)
+        if "port" in data:  # Written by older versions with the port name only
+            try:
+                return cls(path, [(PortFingerprint(None, None, None, data["port"]),
+                                   datetime.strptime(data["timestamp"], TIMESTAMP_FORMAT))])
+            except (KeyError, TypeError, ValueError):
+                return cls(path)
+
+        entries = []
+        devices = data.get("devices", [])
+        for entry in devices if isinstance(devices, list) else []:
+            try:
+                fingerprint = PortFingerprint(entry.get("vid"), entry.get("pid"), entry.get("serial_number"),
+                                              entry.get("device", ""))
+                entries.append((fingerprint, datetime.strptime(entry["timestamp"], TIMESTAMP_FORMAT)))
+            except (AttributeError, KeyError, TypeError, ValueError):
+                continue  # A damaged entry, the others are still used
+        return cls(path, entries)
+
+    def save(self) -> None:
+        """Write the cache to its file."""
+        devices = [dict(fingerprint._asdict(), timestamp=used.strftime(TIMESTAMP_FORMAT))
+                   for fingerprint, used in self.entries]
+        with open(self.path, "w", encoding="utf-8") as f:
+            json.dump({"devices": devices}, f, indent=2)
+
+    def remember(self, fingerprint: PortFingerprint) -> None:
+        """Put a fingerprint in front as the one used now.
+
+        Args:
+            fingerprint (PortFingerprint): The fingerprint of the selected antenna.
+        """
+        self.entries = [(known, used) for known, used in self.entries if not self._same(known, fingerprint)]
+        self.entries.insert(0, (fingerprint, datetime.now()))
+        del self.entries[self.MAX_ENTRIES:]
+
+    @staticmethod
+    def _same(first: PortFingerprint, second: PortFingerprint) -> bool:
+        if first.vid is None or second.vid is None:
+            return first.vid is second.vid and first.device == second.device
+        return first[:3] == second[:3]
+
+
+class PortDiscovery:
+    """Lists the serial ports in a background thread.
+
+    Attributes:
+        duration: The time the listing took in seconds, None while it is running.
+    """
+    def __init__(self) -> None:
+        """Initializes the discovery, the listing is started by start()."""
+        self.duration: Optional[float] = None
+        self._fingerprints: List[PortFingerprint] = []
+        self._done = threading.Event()
+
+    def start(self) -> None:
+        """Start listing the ports in a background thread."""
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def _run(self) -> None:
+        start = time.monotonic()
+        try:
+            self._fingerprints = [PortFingerprint.from_port_info(port_info)
+                                  for port_info in serial.tools.list_ports.comports()]
+        finally:
+            self.duration = time.monotonic() - start
+            self._done.set()
+
+    def fingerprints(self, timeout: Optional[float] = None) -> List[PortFingerprint]:
+        """Wait for the listing and get its result.
+
+        Args:
+            timeout (Optional[float]): The maximum time to wait in seconds.
+
+        Returns:
+            List[PortFingerprint]: The fingerprints of all ports, empty if the listing did not finish.
+        """
+        self._done.wait(timeout)
+        return list(self._fingerprints)
+
+    def select(self, cache: PortCache, timeout: Optional[float] = None) -> Optional[PortFingerprint]:
+        """Choose the most recently used antenna that is connected.
+
+        Args:
+            cache (PortCache): The antennas used before.
+            timeout (Optional[float]): The maximum time to wait for the listing in seconds.
+
+        Returns:
+            Optional[PortFingerprint]: The fingerprint of the connected antenna, None if there is no known one.
+        """
+        ports = self.fingerprints(timeout)
+        now = datetime.now()
+        for known, used in cache.entries:
+            if known.vid is None:
+                # Only the name is known, which may belong to another device by now
+                if now - used < PATH_ONLY_VALIDITY and known.find() is not None:
+                    return known
+                continue
+            for port in ports:
+                if port[:3] == known[:3]:
+                    return port
+        return None
+
+
+class StartupTimer:
+    """Durations of the startup phases.
+
+    Attributes:
+        start: The monotonic time the application was launched.
+        phases: Pairs of a phase name and its end time.
+    """
+    def __init__(self, start: Optional[float] = None) -> None:
+        """Initializes the timer.
+
+        Args:
+            start (Optional[float]): The launch time, now by default.
+        """
+        self.start = time.monotonic() if start is None else start
+        self.phases: List[Tuple[str, float]] = []
+
+    def mark(self, phase: str, end: Optional[float] = None) -> None:
+        """Record the end of a phase, which started at the end of the previous one.
+
+        Args:
+            phase (str): The name of the phase.
+            end (Optional[float]): The end time of the phase, now by default.
+        """
+        self.phases.append((phase, time.monotonic() if end is None else end))
+
+    def report(self) -> str:
+        """Format the phases as a table.
+
+        Returns:
+            str: The duration of each phase and the time since launch in milliseconds.
+        """
+        lines = [f"{'startup phase':<20} {'ms':>8} {'since launch':>13}"]
+        previous = self.start
+        for phase, end in sorted(self.phases, key=lambda item: item[1]):
+            lines.append(f"{phase:<20} {(end - previous) * 1e3:>8.1f} {(end - self.start) * 1e3:>13.1f}")
+            previous = end
+        return "\n".join(lines)
@@ -0,0 +1,237 @@
+""" A module for driving several tanks over one antenna.
+
+Every tank of a Fleet has its own Tank with the values to send and an
+address, its index in the fleet. The frames of a fleet carry the address
+in front of the usual message, so the antenna can forward each one to the
+right tank (see arduino/sender.ino):
+
+    ADDRESS LEFT_DIRECTION LEFT_SPEED RIGHT_DIRECTION RIGHT_SPEED LIGHT WATER
+
+One FleetTransmitter shares the frame rate of the serial link between all
+tanks. A tank is due when its values changed or its keepalive expired.
+Among the due tanks the next frame goes to the one that received the
+least service so far, weighted so the tank driven by the gamepad gets
+ACTIVE_WEIGHT times the share of any other tank (stride scheduling). A
+stop, light or water change of any tank is written before, like in
+SerialMessenger.transmit_on_change.
+
+Typical usage:
+
+    fleet = Fleet(3)
+    comms = SerialMessenger(port, tank=fleet.active_tank)
+    transmitter = FleetTransmitter(comms, fleet)
+    threading.Thread(target=transmitter.run, daemon=True).start()
+    ...
+    tank = fleet.select(1)
+"""
+
+import threading
+import time
+from typing import List, Optional
+
+from model.communication import (PRIORITY_KEEPALIVE, PRIORITY_MOTION, SerialMessenger, TankFrameEncoder,
+                                 frame_priority, frame_values)
+from model.protocol import HEADER_SIZE
+from model.tank import Tank, TankState
+
+MAX_TANKS = 8
+
+
+class AddressedFrameEncoder(TankFrameEncoder):
+    """Encoder packing the address of the tank in front of its values into a preallocated frame."""
+    ADDRESS_SIZE = 1
+
+    def encode(self, state: TankState, seq: int, address: int = 0) -> memoryview:
+        """Pack the address and the tank values into the frame.
+
+        Args:
+            state (TankState): The values of the tank to send.
+            seq (int): The sequence number of the frame, taken modulo 256.
+            address (int): The address of the tank.
+
+        Returns:
+            memoryview: A view of the frame, valid until the next call.
+        """
+        self._buffer[HEADER_SIZE] = address
+        return super().encode(state, seq)
+
+
+class Fleet:
+    """Tanks driven over one antenna, one of them by the gamepad.
+
+    Attributes:
+        tanks: The Tank of every address.
+        names: The names of the tanks shown to the user.
+        active: The address of the tank driven by the gamepad.
+    """
+    def __init__(self, size: int, names: Optional[List[str]] = None) -> None:
+        """Initializes the fleet with stopped tanks, the first one is active.
+
+        Args:
+            size (int): The number of tanks.
+            names (Optional[List[str]]): The names of the tanks, "Tank 1", "Tank 2", ... by default.
+
+        Raises:
+            ValueError: If the size is not between 1 and MAX_TANKS or the names do not match it.
+        """
+        if not 1 <= size <= MAX_TANKS:
+            raise ValueError(f"Number of tanks should be in the [1; {MAX_TANKS}] interval")
+        if names is not None and len(names) != size:
+            raise ValueError("Every tank should have a name")
+
+        # One condition for all tanks, so the transmitter can wait for a change of any of them
+        self._changed = threading.Condition()
+        self.tanks = [Tank(self._changed) for _ in range(size)]
+        self.names = names or [f"Tank {address + 1}" for address in range(size)]
+        self.active = 0
+
+    def __len__(self) -> int:
+        return len(self.tanks)
+
+    @property
+    def active_tank(self) -> Tank:
+        """The Tank driven by the gamepad."""
+        return self.tanks[self.active]
+
+    def select(self, address: int) -> Tank:
+        """Let the gamepad drive another tank. The previous one stops and stops shooting water.
+
+        Args:
+            address (int): The address of the tank to drive.
+
+        Returns:
+            Tank: The newly active tank.
+
+        Raises:
+            IndexError: If there is no tank with the address.
+        """
+        tank = self.tanks[address]
+        if address != self.active:
+            self.active_tank.stop()
+            self.active = address
+        return tank
+
+    def versions(self) -> List[int]:
+        """Get the current version of every tank.
+
+        Returns:
+            List[int]: The versions by address.
+        """
+        return [tank.version for tank in self.tanks]
+
+    def wait_for_change(self, versions: List[int], timeout: float) -> bool:
+        """Block until a tank version differs from the given ones or the timeout expires.
+
+        Args:
+            versions (List[int]): The versions the caller has already seen, by address.
+            timeout (float): The maximum time to wait in seconds.
+
+        Returns:
+            bool: True if a tank changed.
+        """
+        with self._changed:
+            return self._changed.wait_for(lambda: self.versions() != versions, timeout)
+
+
+class FleetTransmitter:
+    """Multiplexes the frames of all tanks of a fleet onto one serial link.
+
+    Attributes:
+        messenger: The SerialMessenger writing the frames.
+        fleet: The Fleet whose tanks are sent.
+        encoder: The AddressedFrameEncoder reused for every frame.
+        frames: The number of frames sent to every address.
+    """
+    ACTIVE_WEIGHT = 4
+
+    def __init__(self, messenger: SerialMessenger, fleet: Fleet) -> None:
+        """Initializes the transmitter, the frame rate and keepalive are those of the messenger.
+
+        Args:
+            messenger (SerialMessenger): The messenger of the antenna.
+            fleet (Fleet): The tanks to send.
+        """
+        self.messenger = messenger
+        self.fleet = fleet
+        self.encoder = AddressedFrameEncoder()
+        self.frames = [0] * len(fleet)
+
+    def stats(self) -> dict:
+        """Get the frames sent to every tank.
+
+        Returns:
+            dict: The number and share of frames by tank name.
+        """
+        total = sum(self.frames) or 1
+        return {name: {"frames": frames, "share": frames / total}
+                for name, frames in zip(self.fleet.names, self.frames)}
+
+    def run(self) -> None:
+        """Send the tanks whenever they change or their keepalive expires. Runs inside a thread.
+
+        A change of a tank made while its frame is written triggers another one,
+        like SerialMessenger.transmit_on_change. An urgent change, see frame_priority(),
+        is written at once, motion frames at most max_rate times per second when the link is idle.
+        """
+        fleet = self.fleet
+        messenger = self.messenger
+        latency = messenger.latency
+        keepalive = messenger.keepalive
+        min_interval = 1 / messenger.max_rate
+        count = len(fleet)
+
+        sent_versions = [-1] * count
+        sent_values: List[Optional[tuple]] = [None] * count
+        sent_at = [-keepalive] * count
+        last_stamps = [None] * count
+        # Virtual time of every tank, the due tank with the lowest one is served next
+        passes = [0.0] * count
+        last_pass = 0.0
+        last_write = -min_interval
+
+        while True:
+            messenger.loops += 1
+            now = time.monotonic()
+            versions = fleet.versions()
+            due = [address for address in range(count)
+                   if versions[address] != sent_versions[address] or now - sent_at[address] >= keepalive]
+            if not due:
+                fleet.wait_for_change(sent_versions, min(sent_at) + keepalive - now)
+                continue
+
+            priorities = {address: frame_priority(sent_values[address], frame_values(fleet.tanks[address].state))
+                          for address in due}
+            for address, priority in list(priorities.items()):
+                if priority is None and now - sent_at[address] < keepalive:
+                    # Unchanged on the wire, e.g. only the tower moved: seen, not sent
+                    sent_versions[address] = versions[address]
+                    del priorities[address]
+            if not priorities:
+                continue
+            due = list(priorities)
+            urgent = [address for address, priority in priorities.items()
+                      if priority is not None and priority < PRIORITY_MOTION]
+            if urgent:
+                address = min(urgent, key=priorities.get)
+            else:
+                delay = max(last_write + min_interval, messenger.link_free_at) - now
+                if delay > 0:
+                    # Changes made meanwhile are merged into the next frame, unless urgent
+                    fleet.wait_for_change(versions, delay)
+                    continue
+                # A tank that was idle starts at the current virtual time instead of catching up in a burst
+                address = min(due, key=lambda candidate: max(passes[candidate], last_pass))
+            last_pass = max(passes[address], last_pass)
+            passes[address] = last_pass + 1 / (self.ACTIVE_WEIGHT if address == fleet.active else 1)
+
+            version, state, stamp = fleet.tanks[address].snapshot()
+            priority = priorities[address]
+            messenger.send_frame(self.encoder.encode(state, messenger.seq, address),
+                                 PRIORITY_KEEPALIVE if priority is None else priority)
+            sent_values[address] = frame_values(state)
+            last_write = sent_at[address] = time.monotonic()
+            sent_versions[address] = version
+            self.frames[address] += 1
+            if stamp is not None and stamp is not last_stamps[address]:
+                last_stamps[address] = stamp
+                latency.mark_sent(stamp)
@@ -0,0 +1,328 @@
+""" A module recording every frame sent to the antenna into a fixed-size ring file.
+
+The FlightRecorder appends each frame written by the SerialMessenger, with
+its monotonic and wall clock time, to a memory-mapped file. When the file
+is full, the oldest records are overwritten, so the disk space stays
+bounded while the last hours are kept. Recording a frame only copies it
+into the mapping; the kernel writes the pages back to disk on its own, also
+if the application crashes, so nothing is synced while sending.
+
+File layout, all numbers little-endian:
+
+    header (64 bytes)  magic "FKFR", version, record size, capacity (uint32),
+                       number of records written so far (uint64)
+    records            capacity records of RECORD_SIZE bytes each
+
+    record             monotonic time, wall clock time (float64),
+                       sequence number, frame length (uint8),
+                       frame (FRAME_SIZE bytes, zero padded)
+
+A FlightLog reads a file offline, slices it by time and exports it to CSV
+or NumPy. It can also be used from the command line:
+
+    python -m model.flight_recorder ../flight.fkfr --last 60 --csv last_minute.csv
+
+Typical usage:
+
+    recorder = FlightRecorder()
+    comms = SerialMessenger(port, recorder=recorder)
+    ...
+    log = FlightLog.load(FLIGHT_RECORDER_PATH)
+    log.to_csv("incident.csv", log.records(start=incident - 10, end=incident + 5, wall=True))
+"""
+
+import argparse
+import csv
+import mmap
+import os
+import struct
+import sys
+import time
+from datetime import datetime
+from typing import List, NamedTuple, Optional, TextIO, Tuple, Union
+
+try:
+    import numpy as np
+except ImportError:  # Only the NumPy export needs it
+    np = None
+
+FLIGHT_RECORDER_PATH = "../flight.fkfr"
+MAGIC = b"FKFR"
+VERSION = 1
+HEADER = struct.Struct("<4sIIIQ")
+HEADER_SIZE = 64
+COUNT = struct.Struct("<Q")
+COUNT_OFFSET = HEADER.size - COUNT.size
+RECORD = struct.Struct("<ddBB")
+FRAME_SIZE = 14
+RECORD_SIZE = RECORD.size + FRAME_SIZE
+# 2^21 records of 32 bytes, 64 MiB or almost 6 hours at 100 frames per second
+DEFAULT_CAPACITY = 1 << 21
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+
+class FlightRecorder:
+    """Ring of the frames sent, in a memory-mapped file.
+
+    Attributes:
+        path: The path of the ring file.
+        capacity: The number of records the file holds.
+        count: The number of records written to the file so far, also by earlier runs.
+    """
+    def __init__(self, path: str = FLIGHT_RECORDER_PATH, capacity: int = DEFAULT_CAPACITY) -> None:
+        """Opens the ring file, continuing it if it has the same layout, or creates it.
+
+        Args:
+            path (str): The path of the file (default is ../flight.fkfr).
+            capacity (int): The number of records (default is DEFAULT_CAPACITY).
+
+        Raises:
+            OSError: If the file cannot be created or mapped.
+            ValueError: If the capacity is not positive.
+        """
+        if capacity <= 0:
+            raise ValueError("Capacity should be positive")
+        self.path = path
+        self.capacity = capacity
+        size = HEADER_SIZE + capacity * RECORD_SIZE
+
+        with open(os.open(path, os.O_RDWR | os.O_CREAT, 0o644), "r+b") as f:
+            header = f.read(HEADER.size)
+            if len(header) < HEADER.size or HEADER.unpack(header)[:4] != (MAGIC, VERSION, RECORD_SIZE, capacity):
+                f.truncate(0)
+                f.truncate(size)  # Sparse, the blocks are allocated as the ring fills
+                f.seek(0)
+                f.write(HEADER.pack(MAGIC, VERSION, RECORD_SIZE, capacity, 0))
+                f.flush()
+            self._map = mmap.mmap(f.fileno(), size)
+        self.count = COUNT.unpack_from(self._map, COUNT_OFFSET)[0]
+
+    def record(self, seq: int, frame) -> None:
+        """Append a frame. Only called by the thread writing to serial.
+
+        Args:
+            seq (int): The sequence number of the frame.
+            frame: The bytes-like frame, longer frames are cut to FRAME_SIZE bytes.
+        """
+        count = self.count
+        offset = HEADER_SIZE + count % self.capacity * RECORD_SIZE
+        length = min(len(frame), FRAME_SIZE)
+        RECORD.pack_into(self._map, offset, time.monotonic(), time.time(), seq, length)
+        start = offset + RECORD.size
+        self._map[start:start + length] = frame[:length]
+        # Counted only when complete, so a torn record is never counted while the ring fills. Once it
+        # is full, the slot being written is the oldest counted one, which FlightLog.load() skips.
+        self.count = count + 1
+        COUNT.pack_into(self._map, COUNT_OFFSET, count + 1)
+
+    def flush(self) -> None:
+        """Write the mapping back to the file now, safe while frames are recorded."""
+        if not self._map.closed:
+            self._map.flush()
+
+    def close(self) -> None:
+        """Write the mapping back to the file and close it, once nothing is recorded anymore."""
+        if not self._map.closed:
+            self._map.flush()
+            self._map.close()
+
+
+def open_flight_recorder(path: Optional[str] = FLIGHT_RECORDER_PATH,
+                         capacity: int = DEFAULT_CAPACITY) -> Optional[FlightRecorder]:
+    """Open the recorder, without stopping the tank control if the file cannot be used.
+
+    Args:
+        path (Optional[str]): The path of the ring file, None or empty to record nothing.
+        capacity (int): The number of records (default is DEFAULT_CAPACITY).
+
+    Returns:
+        Optional[FlightRecorder]: The recorder, None if disabled or the file cannot be used.
+    """
+    if not path:
+        return None
+    try:
+        return FlightRecorder(path, capacity)
+    except (OSError, ValueError) as error:
+        print(f"Flight recorder disabled: {error}", file=sys.stderr)
+        return None
+
+
+class FlightRecord(NamedTuple):
+    """A recorded frame.
+
+    Attributes:
+        monotonic: The monotonic time it was written, comparable within one boot only.
+        wall: The wall clock time it was written, in seconds since the epoch.
+        seq: The sequence number of the frame.
+        frame: The bytes of the frame.
+    """
+    monotonic: float
+    wall: float
+    seq: int
+    frame: bytes
+
+    def decode(self) -> Tuple[int, int, int, int, int]:
+        """Get the values the frame sent, see model.communication.
+
+        Returns:
+            Tuple[int, int, int, int, int]: The tank address (0 for unaddressed frames),
+                the signed left and right speed in [-255, 255], light and water.
+        """
+        payload = self.frame[4:-2]
+        address = 0
+        if len(payload) == 7:
+            address, payload = payload[0], payload[1:]
+        if len(payload) != 6:
+            return address, 0, 0, 0, 0
+        left = payload[1] if payload[0] else -payload[1]
+        right = payload[3] if payload[2] else -payload[3]
+        return address, left, right, payload[4], payload[5]
+
+
+CSV_COLUMNS = ("monotonic", "wall", "time", "seq", "address", "left", "right", "light", "water", "frame")
+
+
+class FlightLog:
+    """The records of a ring file in the order they were written.
+
+    The records still in the file are indexed from the oldest one, records() slices them by time.
+
+    Attributes:
+        path: The path of the file.
+        capacity: The number of records the file holds.
+        written: The number of records written to the file over its lifetime.
+    """
+    def __init__(self, path: str, capacity: int, written: int, records: List[FlightRecord]) -> None:
+        """Initializes the log, see load()."""
+        self.path = path
+        self.capacity = capacity
+        self.written = written
+        self._records = records
+
+    def __len__(self) -> int:
+        return len(self._records)
+
+    def __getitem__(self, index: int) -> FlightRecord:
+        return self._records[index]
+
+    @classmethod
+    def load(cls, path: str = FLIGHT_RECORDER_PATH) -> "FlightLog":
+        """Read a ring file, also while it is being written.
+
+        Once the ring is full, the oldest slot is skipped: it is the next one overwritten,
+        so it may hold a torn record if the writer was interrupted in it.
+
+        Args:
+            path (str): The path of the file (default is ../flight.fkfr).
+
+        Returns:
+            FlightLog: The records of the file.
+
+        Raises:
+            ValueError: If the file is not a flight recorder file of a supported version.
+        """
+        with open(path, "rb") as f:
+            data = f.read()
+        magic, version, record_size, capacity, written = HEADER.unpack_from(data)
+        if magic != MAGIC or version != VERSION or record_size != RECORD_SIZE:
+            raise ValueError(f"{path} is not a flight recorder file of version {VERSION}")
+
+        if written >= capacity:
+            oldest, count = written % capacity + 1, capacity - 1
+        else:
+            oldest, count = 0, written
+        slots = [(oldest + index) % capacity for index in range(count)]
+        return cls(path, capacity, written, [cls._read_record(data, slot) for slot in slots])
+
+    @staticmethod
+    def _read_record(data: bytes, slot: int) -> FlightRecord:
+        offset = HEADER_SIZE + slot * RECORD_SIZE
+        monotonic, wall, seq, length = RECORD.unpack_from(data, offset)
+        start = offset + RECORD.size
+        return FlightRecord(monotonic, wall, seq, data[start:start + length])
+
+    def records(self, start: Optional[float] = None, end: Optional[float] = None,
+                wall: bool = False) -> List[FlightRecord]:
+        """Get the records written in a time interval.
+
+        Args:
+            start (Optional[float]): The first time included, from the beginning by default.
+            end (Optional[float]): The last time included, up to the end by default.
+            wall (bool): Whether the times are wall clock times instead of monotonic ones.
+
+        Returns:
+            List[FlightRecord]: The records in the interval, the oldest first.
+        """
+        column = 1 if wall else 0
+        return [record for record in self._records
+                if (start is None or record[column] >= start) and (end is None or record[column] <= end)]
+
+    @staticmethod
+    def to_csv(output: Union[str, TextIO], records: List[FlightRecord]) -> None:
+        """Write records as CSV with the decoded values, see CSV_COLUMNS.
+
+        Args:
+            output (Union[str, TextIO]): The path of the file or an open text file.
+            records (List[FlightRecord]): The records to write.
+        """
+        if isinstance(output, str):
+            with open(output, "w", newline="", encoding="utf-8") as f:
+                FlightLog.to_csv(f, records)
+            return
+        writer = csv.writer(output)
+        writer.writerow(CSV_COLUMNS)
+        for record in records:
+            writer.writerow((f"{record.monotonic:.6f}", f"{record.wall:.6f}",
+                             datetime.fromtimestamp(record.wall).isoformat(timespec="milliseconds"),
+                             record.seq, *record.decode(), record.frame.hex()))
+
+    @staticmethod
+    def to_numpy(records: List[FlightRecord]):
+        """Convert records to a NumPy structured array with the decoded values.
+
+        Args:
+            records (List[FlightRecord]): The records to convert.
+
+        Returns:
+            numpy.ndarray: One row per record with the fields of CSV_COLUMNS except time and frame.
+
+        Raises:
+            ImportError: If NumPy is not installed.
+        """
+        if np is None:
+            raise ImportError("NumPy is needed to export the flight recorder to NumPy")
+        dtype = [("monotonic", "f8"), ("wall", "f8"), ("seq", "u1"), ("address", "u1"),
+                 ("left", "i2"), ("right", "i2"), ("light", "u1"), ("water", "u1")]
+        return np.array([(record.monotonic, record.wall, record.seq, *record.decode()) for record in records],
+                        dtype=dtype)
+
+
+def main() -> None:
+    """Export a slice of a ring file, by default everything to CSV on stdout."""
+    parser = argparse.ArgumentParser(description="Export the frames recorded by the flight recorder")
+    parser.add_argument("path", nargs="?", default=FLIGHT_RECORDER_PATH, help="the ring file")
+    parser.add_argument("--start", help=f"first wall clock time included, {TIMESTAMP_FORMAT.replace('%', '%%')}")
+    parser.add_argument("--end", help="last wall clock time included")
+    parser.add_argument("--last", type=float, metavar="SECONDS", help="only the last seconds recorded")
+    parser.add_argument("--csv", metavar="FILE", help="write CSV to FILE instead of stdout")
+    parser.add_argument("--npy", metavar="FILE", help="write a NumPy structured array to FILE")
+    args = parser.parse_args()
+
+    log = FlightLog.load(args.path)
+    start = datetime.strptime(args.start, TIMESTAMP_FORMAT).timestamp() if args.start else None
+    end = datetime.strptime(args.end, TIMESTAMP_FORMAT).timestamp() if args.end else None
+    if args.last is not None and len(log):
+        start = log[-1].wall - args.last
+    records = log.records(start, end, wall=True)
+
+    if args.npy:
+        np.save(args.npy, FlightLog.to_numpy(records))
+    if args.csv or not args.npy:
+        if args.csv:
+            FlightLog.to_csv(args.csv, records)
+        else:
+            FlightLog.to_csv(sys.stdout, records)
+
+
+if __name__ == "__main__":
+    main()
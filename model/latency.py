@@ -0,0 +1,199 @@
+""" A module for measuring the latency from a gamepad input to the serial write.
+
+Every input frame of the gamepad gets an InputStamp when it is emitted.
+The stamp is passed along with the signal to the Controls slot, stored in
+the Tank together with the values it produced and checked again when the
+values are written to the serial port. Each step records the time it took
+into a histogram of its stage:
+
+    input_read   kernel event (or read) until the signal is emitted
+    qt_dispatch  signal emitted until the slot runs in the GUI thread
+    steering     slot start until the values are committed to the Tank
+    send_wait    values committed until they are written to serial
+    total        kernel event (or read) until written to serial
+
+All times are taken from time.monotonic().
+
+Typical usage:
+
+    latency = LatencyTracker()
+    stamp = latency.mark_input(event_time)
+    ...
+    print(latency.report())
+"""
+
+import bisect
+import math
+import time
+from typing import Dict, List, NamedTuple
+
+
+class InputStamp(NamedTuple):
+    """Times of one gamepad input on its way to the serial port.
+
+    Attributes:
+        input: The time the input event was created by the kernel or read.
+        emitted: The time the signal of the input was emitted.
+        committed: The time the values were committed to the Tank.
+    """
+    input: float
+    emitted: float
+    committed: float = 0.0
+
+
+class LatencyHistogram:
+    """Histogram of durations with logarithmic buckets.
+
+    The buckets grow by 10 percent from 1 microsecond to 10 seconds, so the
+    percentiles have a relative error of at most 10 percent. Recording is
+    cheap enough for every input event, but not synchronized, so each
+    histogram should be written by one thread only.
+
+    Attributes:
+        count: The number of recorded durations.
+        maximum: The longest recorded duration in seconds.
+    """
+    BOUNDS: List[float] = [1e-6 * 1.1 ** i for i in range(int(math.log(1e7, 1.1)) + 2)]
+
+    def __init__(self) -> None:
+        """Initializes an empty histogram."""
+        self._counts = [0] * (len(self.BOUNDS) + 1)
+        self.count = 0
+        self.maximum = 0.0
+
+    def record(self, duration: float) -> None:
+        """Add a duration to the histogram.
+
+        Args:
+            duration (float): The duration in seconds.
+        """
+        self._counts[bisect.bisect_left(self.BOUNDS, duration)] += 1
+        self.count += 1
+        if duration > self.maximum:
+            self.maximum = duration
+
+    def percentile(self, percent: float) -> float:
+        """Get the duration below which the given percentage of durations lie.
+
+        Args:
+            percent (float): The percentage between 0 and 100.
+
+        Returns:
+            float: The upper bound of the bucket containing the percentile in seconds,
+                0 if nothing was recorded.
+        """
+        if not self.count:
+            return 0.0
+        rank = max(1.0, self.count * percent / 100)
+        seen = 0
+        for bound, bucket_count in zip(self.BOUNDS, self._counts):
+            seen += bucket_count
+            if seen >= rank:
+                return min(bound, self.maximum)
+        return self.maximum
+
+
+class LatencyTracker:
+    """Latency histograms of all stages between the gamepad and the serial port.
+
+    Attributes:
+        STAGES: The names of the measured stages in pipeline order.
+        histograms: The LatencyHistogram of every stage.
+    """
+    STAGES = ("input_read", "qt_dispatch", "steering", "send_wait", "total")
+
+    def __init__(self) -> None:
+        """Initializes empty histograms for all stages."""
+        self.histograms: Dict[str, LatencyHistogram] = {stage: LatencyHistogram() for stage in self.STAGES}
+
+    def mark_input(self, input_time: float) -> InputStamp:
+        """Create the stamp of an input frame when its signal is emitted.
+
+        Args:
+            input_time (float): The time the input event was created or read.
+
+        Returns:
+            InputStamp: The stamp to emit together with the signal.
+        """
+        now = time.monotonic()
+        self.histograms["input_read"].record(now - input_time)
+        return InputStamp(input_time, now)
+
+    def mark_dispatch(self, stamp: InputStamp) -> float:
+        """Record the start of the slot handling the input.
+
+        Args:
+            stamp (InputStamp): The stamp emitted with the signal.
+
+        Returns:
+            float: The start time of the slot.
+        """
+        now = time.monotonic()
+        self.histograms["qt_dispatch"].record(now - stamp.emitted)
+        return now
+
+    def mark_commit(self, stamp: InputStamp, dispatched: float) -> InputStamp:
+        """Record that the values produced from the input are committed to the Tank.
+
+        Args:
+            stamp (InputStamp): The stamp emitted with the signal.
+            dispatched (float): The start time of the slot returned by mark_dispatch().
+
+        Returns:
+            InputStamp: The stamp to store in the Tank together with the values.
+        """
+        now = time.monotonic()
+        self.histograms["steering"].record(now - dispatched)
+        return stamp._replace(committed=now)
+
+    def mark_sent(self, stamp: InputStamp) -> None:
+        """Record that the values belonging to the stamp are written to serial.
+
+        Args:
+            stamp (InputStamp): The stamp stored in the Tank.
+        """
+        now = time.monotonic()
+        self.histograms["send_wait"].record(now - stamp.committed)
+        self.histograms["total"].record(now - stamp.input)
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        """Get the count and percentiles of all stages.
+
+        Returns:
+            Dict[str, Dict[str, float]]: The count and the p50, p95, p99 and max
+                durations in seconds of every stage.
+        """
+        return {
+            stage: {
+                "count": histogram.count,
+                "p50": histogram.percentile(50),
+                "p95": histogram.percentile(95),
+                "p99": histogram.percentile(99),
+                "max": histogram.maximum,
+            }
+            for stage, histogram in self.histograms.items()
+        }
+
+    def report(self) -> str:
+        """Format the summary as a table in milliseconds.
+
+        Returns:
+            str: One line per stage.
+        """
+        lines = [f"{'stage':<12} {'count':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'max ms':>8}"]
+        for stage, values in self.summary().items():
+            lines.append(
+                f"{stage:<12} {values['count']:>8} {values['p50'] * 1e3:>8.2f} {values['p95'] * 1e3:>8.2f} "
+                f"{values['p99'] * 1e3:>8.2f} {values['max'] * 1e3:>8.2f}"
+            )
+        return "\n".join(lines)
+
+    def status_line(self) -> str:
+        """Format the total latency for a status bar.
+
+        Returns:
+            str: The p50, p95 and p99 of the total latency in milliseconds.
+        """
+        total = self.histograms["total"]
+        return (f"Input to serial: p50 {total.percentile(50) * 1e3:.1f} ms, "
+                f"p95 {total.percentile(95) * 1e3:.1f} ms, p99 {total.percentile(99) * 1e3:.1f} ms")
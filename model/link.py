@@ -0,0 +1,296 @@
+""" A module keeping the serial link to the antenna alive across USB glitches.
+
+The LinkSupervisor runs the transmit loop of a SerialMessenger. When a
+write fails because the antenna disappeared, it closes the port, waits for
+the antenna to be enumerated again and reopens it, then resumes sending
+the current tank values immediately.
+
+The antenna is recognized by its USB fingerprint (vendor id, product id and
+serial number), so it is found again even if it comes back under another
+path. Ports without USB information, e.g. the pseudo-terminal of the
+simulator, are matched by their path.
+
+On Linux the supervisor listens to the kernel hot-plug events, so it looks
+for the antenna as soon as a device appears. Elsewhere, or if the events
+are not available, it polls with an exponential backoff.
+
+Typical usage:
+
+    supervisor = LinkSupervisor(comms, on_status=print)
+    threading.Thread(target=supervisor.run, daemon=True).start()
+    ...
+    print(supervisor.status_line())
+"""
+
+import os
+import select
+import socket
+import threading
+import time
+from typing import Callable, NamedTuple, Optional
+
+import serial.tools.list_ports
+
+from model.communication import SerialMessenger
+
+LINK_CONNECTED = "connected"
+LINK_DISCONNECTED = "disconnected"
+
+# Kernel hot-plug events, see netlink(7)
+NETLINK_KOBJECT_UEVENT = 15
+UEVENT_GROUP = 1
+
+
+class PortFingerprint(NamedTuple):
+    """Identity of a serial device independent of its path.
+
+    Attributes:
+        vid: The USB vendor id, None for devices without USB information.
+        pid: The USB product id.
+        serial_number: The USB serial number.
+        device: The path of the port, used when there is no USB information.
+    """
+    vid: Optional[int]
+    pid: Optional[int]
+    serial_number: Optional[str]
+    device: str
+
+    @classmethod
+    def from_port_info(cls, port_info) -> "PortFingerprint":
+        """Take the fingerprint of a port listed by serial.tools.list_ports.
+
+        Args:
+            port_info: A ListPortInfo of pyserial.
+
+        Returns:
+            PortFingerprint: The fingerprint of the port.
+        """
+        return cls(port_info.vid, port_info.pid, port_info.serial_number, port_info.device)
+
+    @classmethod
+    def from_device(cls, device: str) -> "PortFingerprint":
+        """Take the fingerprint of a port by its path.
+
+        Args:
+            device (str): The path of the port.
+
+        Returns:
+            PortFingerprint: The fingerprint, with the path only if the port is not listed.
+        """
+        for port_info in serial.tools.list_ports.comports():
+            if port_info.device == device:
+                return cls.from_port_info(port_info)
+        return cls(None, None, None, device)
+
+    def matches(self, port_info) -> bool:
+        """Check whether a listed port is the fingerprinted device.
+
+        Args:
+            port_info: A ListPortInfo of pyserial.
+
+        Returns:
+            bool: True if the USB identity, or the path without one, is the same.
+        """
+        if self.vid is None:
+            return port_info.device == self.device
+        return (port_info.vid, port_info.pid, port_info.serial_number) == (self.vid, self.pid, self.serial_number)
+
+    def find(self) -> Optional[str]:
+        """Look for the device among the current ports.
+
+        Returns:
+            Optional[str]: The path of the device, None if it is not connected.
+        """
+        if self.vid is None:
+            # Not every port is listed, e.g. pseudo-terminals, so its path is checked directly
+            return self.device if os.path.exists(self.device) else None
+        for port_info in serial.tools.list_ports.comports():
+            if self.matches(port_info):
+                return port_info.device
+        return None
+
+
+class HotplugMonitor:
+    """Waits for the kernel to announce a device change, with a polling fallback.
+
+    Without hot-plug events, e.g. outside Linux, wait() only sleeps.
+    """
+    def __init__(self) -> None:
+        """Subscribes to the kernel hot-plug events if the platform supports them."""
+        self._socket: Optional[socket.socket] = None
+        try:
+            self._socket = socket.socket(socket.AF_NETLINK, socket.SOCK_DGRAM, NETLINK_KOBJECT_UEVENT)
+            self._socket.bind((0, UEVENT_GROUP))
+            self._socket.setblocking(False)
+        except (AttributeError, OSError):  # No netlink outside Linux or without permission
+            self.close()
+
+    @property
+    def available(self) -> bool:
+        """Whether the hot-plug events are received."""
+        return self._socket is not None
+
+    def wait(self, timeout: float) -> bool:
+        """Wait for device changes.
+
+        Args:
+            timeout (float): The maximum time to wait in seconds.
+
+        Returns:
+            bool: True if the kernel announced a change, False on timeout.
+        """
+        if self._socket is None:
+            time.sleep(timeout)
+            return False
+        readable, _, _ = select.select([self._socket], [], [], timeout)
+        if not readable:
+            return False
+        try:
+            while self._socket.recv(65536):  # Drain all pending events
+                pass
+        except BlockingIOError:
+            pass
+        return True
+
+    def close(self) -> None:
+        """Unsubscribe from the hot-plug events."""
+        if self._socket is not None:
+            self._socket.close()
+            self._socket = None
+
+
+class LinkSupervisor:
+    """Runs the transmit loop of a SerialMessenger and reconnects it after a failure.
+
+    Attributes:
+        messenger: The supervised SerialMessenger.
+        transmit: The transmit loop writing through the messenger, restarted after every reconnection.
+        fingerprint: The PortFingerprint of the antenna.
+        min_backoff: The first delay in seconds between two searches for the antenna.
+        max_backoff: The longest delay in seconds between two searches.
+        on_status: Optional callback called from the supervisor thread with the new link status.
+        status: LINK_CONNECTED or LINK_DISCONNECTED.
+        disconnects: The number of times the link failed.
+        downtime: The total time in seconds the link was down.
+        last_downtime: The duration of the last outage in seconds.
+        longest_downtime: The duration of the longest outage in seconds.
+    """
+    def __init__(self, messenger: SerialMessenger, fingerprint: Optional[PortFingerprint] = None,
+                 min_backoff: float = 0.005, max_backoff: float = 0.5,
+                 on_status: Optional[Callable[[str], None]] = None,
+                 transmit: Optional[Callable[[], None]] = None) -> None:
+        """Initializes the supervisor of a connected messenger.
+
+        Args:
+            messenger (SerialMessenger): The messenger whose port is open.
+            fingerprint (Optional[PortFingerprint]): The antenna, taken from the port of the messenger by default.
+            min_backoff (float): The first delay between two searches (default is 5 ms).
+            max_backoff (float): The longest delay between two searches (default is 0.5 s).
+            on_status (Optional[Callable[[str], None]]): The callback of status changes.
+            transmit (Optional[Callable[[], None]]): The transmit loop, transmit_on_change of the messenger by default.
+        """
+        self.messenger = messenger
+        self.transmit = transmit or messenger.transmit_on_change
+        self.fingerprint = fingerprint or PortFingerprint.from_device(messenger.port)
+        self.min_backoff = min_backoff
+        self.max_backoff = max_backoff
+        self.on_status = on_status
+
+        self.status = LINK_CONNECTED
+        self.disconnects = 0
+        self.downtime = 0.0
+        self.last_downtime = 0.0
+        self.longest_downtime = 0.0
+        self._down_since: Optional[float] = None
+
+        self._hotplug = HotplugMonitor()
+        self._stopped = threading.Event()
+
+    def run(self) -> None:
+        """Transmit until stop(), reconnecting whenever the port fails. Runs inside a thread."""
+        while not self._stopped.is_set():
+            try:
+                self.transmit()
+            except OSError:  # serial.SerialException is an OSError as well
+                if self._stopped.is_set():
+                    break
+                self._disconnected()
+                self._reconnect()
+        self._hotplug.close()
+
+    def stop(self) -> None:
+        """Stop the supervisor; the transmit loop ends with the next failing write."""
+        self._stopped.set()
+        self.messenger.close_serial()
+
+    def current_downtime(self) -> float:
+        """Get the duration of the ongoing outage.
+
+        Returns:
+            float: The time in seconds since the link failed, 0 if it is up.
+        """
+        down_since = self._down_since
+        return 0.0 if down_since is None else time.monotonic() - down_since
+
+    def stats(self) -> dict:
+        """Get the link counters.
+
+        Returns:
+            dict: The status, the number of disconnects and the total, last, longest and current downtime.
+        """
+        return {
+            "status": self.status,
+            "disconnects": self.disconnects,
+            "downtime": self.downtime,
+            "last_downtime": self.last_downtime,
+            "longest_downtime": self.longest_downtime,
+            "current_downtime": self.current_downtime(),
+        }
+
+    def status_line(self) -> str:
+        """Get a one line summary of the link for the status bar.
+
+        Returns:
+            str: The status and the outages so far.
+        """
+        if self.status != LINK_CONNECTED:
+            return f"link down for {self.current_downtime():.1f} s"
+        if not self.disconnects:
+            return "link up"
+        return f"link up, {self.disconnects} outages, last {self.last_downtime * 1e3:.0f} ms"
+
+    def _set_status(self, status: str) -> None:
+        self.status = status
+        if self.on_status is not None:
+            self.on_status(status)
+
+    def _disconnected(self) -> None:
+        self._down_since = time.monotonic()
+        self.disconnects += 1
+        self.messenger.close_serial()
+        self._set_status(LINK_DISCONNECTED)
+
+    def _reconnect(self) -> None:
+        """Search for the antenna until it is opened again or the supervisor is stopped."""
+        backoff = self.min_backoff
+        while not self._stopped.is_set():
+            port = self.fingerprint.find()
+            if port is not None:
+                try:
+                    self.messenger.reopen(port)
+                except OSError:
+                    pass  # Enumerated but not ready yet, try again after the backoff
+                else:
+                    down = time.monotonic() - self._down_since
+                    self._down_since = None
+                    self.last_downtime = down
+                    self.longest_downtime = max(self.longest_downtime, down)
+                    self.downtime += down
+                    self._set_status(LINK_CONNECTED)
+                    return
+
+            # A hot-plug event restarts the search right away with a short backoff
+            if self._hotplug.wait(backoff):
+                backoff = self.min_backoff
+            else:
+                backoff = min(backoff * 2, self.max_backoff)
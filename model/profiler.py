@@ -0,0 +1,224 @@
+""" A module sampling the stacks of all threads to see where the time goes.
+
+The SamplingProfiler runs in its own thread and takes the stack of every
+other thread at a fixed interval from sys._current_frames(). Each stack is
+counted under the name of its thread, e.g. MainThread for the GUI, gamepad
+for the reader and serial for the sender, so the threads show up as
+separate roots of a flame graph. The result is written in the collapsed
+stack format of flamegraph.pl, speedscope and inferno:
+
+    serial;link.py:LinkSupervisor.run;communication.py:SerialMessenger.transmit_on_change 42
+
+Samples are taken whether a thread runs or waits, so a blocked thread shows
+where it waits. The report adds the CPU time of every thread (Linux only)
+and the counters of the registered components, e.g. the loop iterations of
+the gamepad reader and the time blocked in writing to serial, measured over
+the profiled time.
+
+Typical usage:
+
+    profiler = SamplingProfiler()
+    profiler.add_counters("serial", comms.stats)
+    profiler.start()
+    ...
+    profiler.stop()
+    profiler.write_collapsed("profile.folded")
+    print(profiler.report())
+"""
+
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Callable, Dict, List, Optional
+
+PROFILE_PATH = "../profile.folded"
+DEFAULT_INTERVAL = 0.005
+
+
+def _frame_label(name: str) -> str:
+    # Semicolons separate the frames of a collapsed stack and a space its count
+    return name.replace(";", ":").replace(" ", "_")
+
+
+def thread_cpu_time(native_id: int) -> Optional[float]:
+    """Get the CPU time a thread of this process used so far.
+
+    Args:
+        native_id (int): The native id of the thread, see threading.Thread.native_id.
+
+    Returns:
+        Optional[float]: The user and system time in seconds, None if unknown (not Linux).
+    """
+    try:
+        with open(f"/proc/self/task/{native_id}/stat", "r", encoding="ascii") as f:
+            fields = f.read().rsplit(")", 1)[1].split()
+    except (OSError, IndexError):
+        return None
+    # utime and stime are the 14th and 15th fields, the first two are cut off
+    return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+
+
+class SamplingProfiler:
+    """Collapsed stacks of all threads, sampled in a background thread.
+
+    Attributes:
+        interval: The time in seconds between two samples.
+        stacks: The number of samples of every collapsed stack.
+        samples: The number of times the threads were sampled.
+        duration: The time in seconds profiled by the finished runs.
+        running: Whether samples are taken.
+    """
+    def __init__(self, interval: float = DEFAULT_INTERVAL) -> None:
+        """Initializes the profiler, it samples once started.
+
+        Args:
+            interval (float): The time between two samples (default is 5 ms).
+        """
+        self.interval = interval
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self.duration = 0.0
+        self.running = False
+        self._labels: Dict[object, str] = {}
+        self._sources: Dict[str, Callable[[], Dict[str, float]]] = {}
+        self._counters: Dict[str, Dict[str, float]] = {}
+        self._started_counters: Dict[str, Dict[str, float]] = {}
+        self._cpu: Dict[str, float] = {}
+        self._started_cpu: Dict[str, float] = {}
+        self._started = 0.0
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def add_counters(self, name: str, source: Callable[[], Dict[str, float]]) -> None:
+        """Report the changes of a component's counters over the profiled time.
+
+        Args:
+            name (str): The name of the component in the report.
+            source (Callable[[], Dict[str, float]]): A function returning the current counters,
+                called when profiling starts and stops.
+        """
+        self._sources[name] = source
+
+    def start(self) -> None:
+        """Start sampling, adding to the samples of earlier runs."""
+        if self.running:
+            return
+        self.running = True
+        self._started_counters = {name: source() for name, source in self._sources.items()}
+        self._started_cpu = self._thread_cpu()
+        self._started = time.monotonic()
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Stop sampling and add the counter changes of this run."""
+        if not self.running:
+            return
+        self._stopped.set()
+        self._thread.join()
+        self.running = False
+        self.duration += time.monotonic() - self._started
+        for name, source in self._sources.items():
+            started = self._started_counters.get(name, {})
+            totals = self._counters.setdefault(name, {})
+            for key, value in source().items():
+                totals[key] = totals.get(key, 0) + value - started.get(key, 0)
+        for name, cpu in self._thread_cpu().items():
+            self._cpu[name] = self._cpu.get(name, 0.0) + cpu - self._started_cpu.get(name, 0.0)
+
+    def toggle(self) -> bool:
+        """Start or stop sampling.
+
+        Returns:
+            bool: Whether the profiler runs now.
+        """
+        if self.running:
+            self.stop()
+        else:
+            self.start()
+        return self.running
+
+    def _run(self) -> None:
+        own = threading.get_ident()
+        while not self._stopped.wait(self.interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():  # pylint: disable=protected-access
+                if ident != own:
+                    self.stacks[self._collapse(names.get(ident, str(ident)), frame)] += 1
+            self.samples += 1
+
+    def _collapse(self, thread: str, frame) -> str:
+        labels = self._labels
+        stack = []
+        while frame is not None:
+            code = frame.f_code
+            label = labels.get(code)
+            if label is None:
+                label = _frame_label(f"{os.path.basename(code.co_filename)}:{code.co_qualname}")
+                labels[code] = label
+            stack.append(label)
+            frame = frame.f_back
+        stack.append(_frame_label(thread))
+        stack.reverse()
+        return ";".join(stack)
+
+    @staticmethod
+    def _thread_cpu() -> Dict[str, float]:
+        cpu = {}
+        for thread in threading.enumerate():
+            used = thread_cpu_time(thread.native_id)
+            if used is not None:
+                cpu[_frame_label(thread.name)] = used
+        return cpu
+
+    def write_collapsed(self, path: str = PROFILE_PATH) -> None:
+        """Write the samples so far in the collapsed stack format.
+
+        Args:
+            path (str): The path of the file (default is ../profile.folded).
+        """
+        with open(path, "w", encoding="utf-8") as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+    def thread_samples(self) -> Dict[str, int]:
+        """Get the number of samples of every thread.
+
+        Returns:
+            Dict[str, int]: The samples by thread name.
+        """
+        threads: Counter = Counter()
+        for stack, count in self.stacks.items():
+            threads[stack.split(";", 1)[0]] += count
+        return dict(threads)
+
+    def counters(self) -> Dict[str, Dict[str, float]]:
+        """Get the counter changes over the profiled time.
+
+        Returns:
+            Dict[str, Dict[str, float]]: The changes by component and counter.
+        """
+        return {name: dict(values) for name, values in self._counters.items()}
+
+    def report(self) -> str:
+        """Get a summary of the threads and counters over the profiled time.
+
+        Returns:
+            str: One line per thread and component.
+        """
+        duration = self.duration + (time.monotonic() - self._started if self.running else 0.0)
+        lines = [f"profile: {self.samples} samples over {duration:.1f} s"]
+        for name, count in sorted(self.thread_samples().items()):
+            cpu = self._cpu.get(name)
+            usage = f", cpu {cpu:.2f} s ({cpu / duration * 100:.1f} %)" if cpu is not None and duration else ""
+            lines.append(f"  thread {name}: {count} samples{usage}")
+        for name, values in sorted(self._counters.items()):
+            parts: List[str] = []
+            for key, value in values.items():
+                rate = f" ({value / duration:.1f}/s)" if duration and isinstance(value, int) else ""
+                parts.append(f"{key} {value:.3f}{rate}" if isinstance(value, float) else f"{key} {value}{rate}")
+            lines.append(f"  {name}: {', '.join(parts)}")
+        return "\n".join(lines)
@@ -0,0 +1,160 @@
+""" A module for framing the messages sent to the antenna over serial.
+
+Represent the part of the model in the MVC. Wraps every message in a
+frame with a sync header, the payload length, a sequence number and
+a checksum, so the receiver can find the start of the next frame after
+a dropped or extra byte and detect lost frames.
+
+Frame layout:
+
+    +------+------+-----+-----+-------------+----------+
+    | 0xAA | 0x55 | LEN | SEQ | PAYLOAD ... | CRC16 BE |
+    +------+------+-----+-----+-------------+----------+
+
+The CRC is CRC-16/CCITT-FALSE computed over LEN, SEQ and the payload.
+The same format is parsed by arduino/sender.ino.
+
+Typical usage:
+
+    frame = encode_frame(seq, payload)
+
+    decoder = FrameDecoder()
+    for frame in decoder.feed(data):
+        print(frame.seq, frame.payload)
+"""
+
+import binascii
+from typing import List, NamedTuple
+
+SYNC = b"\xaa\x55"
+HEADER_SIZE = 4
+CRC_SIZE = 2
+MAX_PAYLOAD = 32
+
+
+def crc16(data, crc: int = 0xFFFF) -> int:
+    """Calculate the CRC-16/CCITT-FALSE checksum of the given data.
+
+    Args:
+        data: The bytes-like object to calculate the checksum of.
+        crc (int): The initial value (default is 0xFFFF).
+
+    Returns:
+        int: The 16-bit checksum.
+    """
+    return binascii.crc_hqx(data, crc)
+
+
+def encode_frame(seq: int, payload: bytes) -> bytes:
+    """Wrap the payload into a frame.
+
+    Args:
+        seq (int): The sequence number of the frame, taken modulo 256.
+        payload (bytes): The message to send.
+
+    Returns:
+        bytes: The complete frame ready to be written to the serial port.
+
+    Raises:
+        ValueError: If the payload is longer than MAX_PAYLOAD bytes.
+    """
+    if len(payload) > MAX_PAYLOAD:
+        raise ValueError(f"Payload should be at most {MAX_PAYLOAD} bytes long")
+    body = bytes((len(payload), seq & 0xFF)) + payload
+    return SYNC + body + crc16(body).to_bytes(CRC_SIZE, "big")
+
+
+class Frame(NamedTuple):
+    """A frame received by the FrameDecoder."""
+    seq: int
+    payload: bytes
+
+
+class FrameDecoder:
+    """Streaming decoder that splits a byte stream into frames.
+
+    Bytes can be fed in chunks of any size. Bytes that do not belong to a
+    valid frame are skipped, so the decoder resynchronises on the next sync
+    header at the latest one frame after a corruption.
+
+    Attributes:
+        frames: The number of valid frames decoded.
+        crc_errors: The number of frames dropped because of a wrong checksum or length.
+        dropped_bytes: The number of bytes skipped while searching for a sync header.
+        lost: The number of frames missing according to the sequence numbers.
+    """
+    def __init__(self) -> None:
+        """Initializes the decoder with an empty buffer."""
+        self._buffer = bytearray()
+        self._expected_seq = None
+
+        self.frames = 0
+        self.crc_errors = 0
+        self.dropped_bytes = 0
+        self.lost = 0
+
+    def feed(self, data: bytes) -> List[Frame]:
+        """Add received bytes and return the frames completed by them.
+
+        Args:
+            data (bytes): The bytes read from the serial port.
+
+        Returns:
+            List[Frame]: The valid frames in the order they were received.
+        """
+        buffer = self._buffer
+        buffer += data
+        frames = []
+
+        while True:
+            start = buffer.find(SYNC)
+            if start < 0:
+                # Keep a trailing first sync byte, the second one may still come
+                keep = 1 if buffer[-1:] == SYNC[:1] else 0
+                self.dropped_bytes += len(buffer) - keep
+                del buffer[:len(buffer) - keep]
+                break
+            if start:
+                self.dropped_bytes += start
+                del buffer[:start]
+
+            if len(buffer) < HEADER_SIZE:
+                break
+            length = buffer[2]
+            if length > MAX_PAYLOAD:
+                self._skip_header()
+                continue
+
+            end = HEADER_SIZE + length
+            if len(buffer) < end + CRC_SIZE:
+                break
+            if crc16(buffer[2:end]) != int.from_bytes(buffer[end:end + CRC_SIZE], "big"):
+                self._skip_header()
+                continue
+
+            frames.append(self._accept(buffer[3], bytes(buffer[HEADER_SIZE:end])))
+            del buffer[:end + CRC_SIZE]
+
+        return frames
+
+    def _skip_header(self) -> None:
+        """Drop a sync header that does not start a valid frame."""
+        self.crc_errors += 1
+        self.dropped_bytes += 1
+        del self._buffer[:1]
+
+    def _accept(self, seq: int, payload: bytes) -> Frame:
+        """Count a valid frame and the frames lost before it.
+
+        Args:
+            seq (int): The sequence number of the frame.
+            payload (bytes): The payload of the frame.
+
+        Returns:
+            Frame: The decoded frame.
+        """
+        if self._expected_seq is not None:
+            self.lost += (seq - self._expected_seq) & 0xFF
+        self._expected_seq = (seq + 1) & 0xFF
+        self.frames += 1
+        return Frame(seq, payload)
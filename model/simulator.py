@@ -0,0 +1,248 @@
+""" A module simulating the antenna and the tank for testing without hardware.
+
+VirtualTank opens a pseudo-terminal and acts as the ESP32 on its master
+side. The path of the slave side can be used as the port of a
+SerialMessenger like any real serial port. The received bytes are decoded
+exactly like arduino/sender.ino does: only valid frames with a six byte
+message, or a seven byte message addressed to the simulated tank (see
+model.fleet), are used, and the motor values are the speed signed by the
+direction byte, as received by arduino/receiver.ino.
+
+The link can optionally delay, drop and corrupt the received bytes, and
+the motors follow their commanded speed with a first-order lag.
+
+Typical usage:
+
+    with VirtualTank(loss=0.01) as tank:
+        comms = SerialMessenger(tank.port)
+        ...
+        print(tank.stats())
+
+or from the command line:
+
+    python -m model.simulator --latency 0.005 --loss 0.01
+"""
+
+import argparse
+import collections
+import math
+import os
+import random
+import select
+import threading
+import time
+import tty
+from typing import Callable, Deque, NamedTuple, Optional, Tuple
+
+from model.protocol import Frame, FrameDecoder
+
+MESSAGE_SIZE = 6
+ADDRESSED_MESSAGE_SIZE = MESSAGE_SIZE + 1
+
+
+class SimulatedState(NamedTuple):
+    """State of the simulated tank.
+
+    Attributes:
+        left_target: The commanded speed of the left motor in [-255, 255].
+        right_target: The commanded speed of the right motor in [-255, 255].
+        left_speed: The current speed of the left motor.
+        right_speed: The current speed of the right motor.
+        light: Whether the light is on.
+        water: Whether water is being shot.
+    """
+    left_target: int = 0
+    right_target: int = 0
+    left_speed: float = 0.0
+    right_speed: float = 0.0
+    light: int = 0
+    water: int = 0
+
+
+def decode_message(payload: bytes) -> Tuple[int, int, int, int]:
+    """Convert a message to motor values the way sender.ino does.
+
+    Args:
+        payload (bytes): The six byte message of a frame.
+
+    Returns:
+        Tuple[int, int, int, int]: The signed left and right speed, light and water.
+    """
+    left = payload[1] if payload[0] else -payload[1]
+    right = payload[3] if payload[2] else -payload[3]
+    return left, right, payload[4], payload[5]
+
+
+class VirtualTank:
+    """Tank simulator connected through a pseudo-terminal.
+
+    Attributes:
+        port: The path of the serial port to connect the SerialMessenger to.
+        time_constant: The time in seconds the motors need for 63 percent of a speed change.
+        latency: The delay in seconds added to every received byte.
+        loss: The probability of a received byte being dropped.
+        corruption: The probability of a received byte getting a flipped bit.
+        decoder: The FrameDecoder, its counters show the link quality.
+        on_frame: Optional callback called with the receive time and every valid frame.
+        address: The fleet address of the simulated tank.
+    """
+    TICK = 0.005
+
+    def __init__(self, time_constant: float = 0.2, latency: float = 0.0, loss: float = 0.0,
+                 corruption: float = 0.0, seed: Optional[int] = None, address: int = 0) -> None:
+        """Opens the pseudo-terminal, the simulation is started by start().
+
+        Args:
+            time_constant (float): The time constant of the motors in seconds (default is 0.2).
+            latency (float): The delay of the link in seconds (default is 0).
+            loss (float): The probability of losing a byte (default is 0).
+            corruption (float): The probability of corrupting a byte (default is 0).
+            seed (Optional[int]): The seed of the random link errors.
+            address (int): The fleet address of the tank, unaddressed frames are always used (default is 0).
+        """
+        self.time_constant = time_constant
+        self.latency = latency
+        self.loss = loss
+        self.corruption = corruption
+        self.decoder = FrameDecoder()
+        self.on_frame: Optional[Callable[[float, Frame], None]] = None
+        self.address = address
+
+        self._random = random.Random(seed)
+        self._master, self._slave = os.openpty()
+        tty.setraw(self._slave)
+        self.port = os.ttyname(self._slave)
+
+        self._in_flight: Deque[Tuple[float, bytes]] = collections.deque()
+        self._state = SimulatedState()
+        self._bytes_received = 0
+        self._last_frame_time = 0.0
+
+        self._running = False
+        self._thread: Optional[threading.Thread] = None
+
+    def __enter__(self) -> "VirtualTank":
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.stop()
+
+    def start(self) -> None:
+        """Start simulating in a background thread."""
+        self._running = True
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Stop the simulation and close the pseudo-terminal."""
+        self._running = False
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        os.close(self._master)
+        os.close(self._slave)
+
+    @property
+    def state(self) -> SimulatedState:
+        """The current state of the simulated tank."""
+        return self._state
+
+    def stats(self) -> dict:
+        """Get the counters of the link.
+
+        Returns:
+            dict: The received bytes, valid frames, checksum errors, skipped bytes,
+                lost frames and the time of the last valid frame.
+        """
+        return {
+            "bytes_received": self._bytes_received,
+            "frames": self.decoder.frames,
+            "crc_errors": self.decoder.crc_errors,
+            "dropped_bytes": self.decoder.dropped_bytes,
+            "lost": self.decoder.lost,
+            "last_frame_time": self._last_frame_time,
+        }
+
+    def _run(self) -> None:
+        """Receive bytes, apply the link errors and move the motors. Runs inside a thread."""
+        last_tick = time.monotonic()
+        while self._running:
+            readable, _, _ = select.select([self._master], [], [], self.TICK)
+            now = time.monotonic()
+            if readable:
+                data = os.read(self._master, 4096)
+                self._bytes_received += len(data)
+                self._in_flight.append((now + self.latency, self._impair(data)))
+
+            while self._in_flight and self._in_flight[0][0] <= now:
+                _, data = self._in_flight.popleft()
+                for frame in self.decoder.feed(data):
+                    self._receive(now, frame)
+
+            self._move_motors(now - last_tick)
+            last_tick = now
+
+    def _impair(self, data: bytes) -> bytes:
+        """Drop and corrupt bytes according to the loss and corruption probabilities.
+
+        Args:
+            data (bytes): The bytes written by the SerialMessenger.
+
+        Returns:
+            bytes: The bytes arriving at the tank.
+        """
+        if not self.loss and not self.corruption:
+            return data
+        result = bytearray()
+        for byte in data:
+            if self._random.random() < self.loss:
+                continue
+            if self._random.random() < self.corruption:
+                byte ^= 1 << self._random.randrange(8)
+            result.append(byte)
+        return bytes(result)
+
+    def _receive(self, now: float, frame: Frame) -> None:
+        payload = frame.payload
+        if len(payload) == ADDRESSED_MESSAGE_SIZE and payload[0] == self.address:
+            payload = payload[1:]
+        if len(payload) != MESSAGE_SIZE:
+            return
+        left, right, light, water = decode_message(payload)
+        self._state = self._state._replace(left_target=left, right_target=right, light=light, water=water)
+        self._last_frame_time = now
+        if self.on_frame is not None:
+            self.on_frame(now, frame)
+
+    def _move_motors(self, elapsed: float) -> None:
+        state = self._state
+        factor = 1 - math.exp(-elapsed / self.time_constant) if self.time_constant > 0 else 1
+        self._state = state._replace(
+            left_speed=state.left_speed + (state.left_target - state.left_speed) * factor,
+            right_speed=state.right_speed + (state.right_target - state.right_speed) * factor,
+        )
+
+
+def main() -> None:
+    """Run the simulator until interrupted and print its state every second."""
+    parser = argparse.ArgumentParser(description="Simulate the tank on a pseudo-terminal.")
+    parser.add_argument("--time-constant", type=float, default=0.2, help="motor time constant in seconds")
+    parser.add_argument("--latency", type=float, default=0.0, help="link delay in seconds")
+    parser.add_argument("--loss", type=float, default=0.0, help="probability of losing a byte")
+    parser.add_argument("--corruption", type=float, default=0.0, help="probability of corrupting a byte")
+    parser.add_argument("--address", type=int, default=0, help="fleet address of the simulated tank")
+    args = parser.parse_args()
+
+    with VirtualTank(args.time_constant, args.latency, args.loss, args.corruption, address=args.address) as tank:
+        print(f"Simulated tank listening on {tank.port}")
+        try:
+            while True:
+                time.sleep(1)
+                print(tank.state, tank.stats())
+        except KeyboardInterrupt:
+            pass
+
+
+if __name__ == "__main__":
+    main()
@@ -3,74 +3,199 @@
 Represent the part of the model in the MVC. Contains the
 current values needed for the tank to operate.
 
+The values are kept in one immutable TankState that is replaced as a
+whole on every change, together with a version number. The sender
+thread can therefore read all values at once without locking and never
+sees a mix of old and new values written by the GUI thread.
+
 Typical usage:
 
     tank = Tank()
-    tank.get_values()
+    tank.update(left=0.5, right=0.25)
+    version, state, stamp = tank.snapshot()
 """
 
-from typing import List
+import threading
+from typing import NamedTuple, Optional, Tuple
+
+from model.latency import InputStamp
+
+
+class TankState(NamedTuple):
+    """Immutable copy of all the values of the tank."""
+    left: float = 0
+    right: float = 0
+    tower_x: float = 0
+    tower_y: float = 0
+    light: int = 0
+    water: int = 0
+
+
+def _in_unit_range(value: float) -> bool:
+    return -1 <= value <= 1
+
+
+def _is_flag(value: int) -> bool:
+    return value in (0, 1)
+
+
+# Check and error message of every value in TankState
+_VALIDATORS = {
+    "left": (_in_unit_range, "Value of the speed should be in the [-1; 1] interval"),
+    "right": (_in_unit_range, "Value of the speed should be in the [-1; 1] interval"),
+    "tower_x": (_in_unit_range, "Value of the tower x should be in the [-1; 1] interval"),
+    "tower_y": (_in_unit_range, "Value of the tower y should be in the [-1; 1] interval"),
+    "light": (_is_flag, "Value should be 0 or 1"),
+    "water": (_is_flag, "Value should be 0 or 1"),
+}
 
 
 class Tank:
     """Values of the tank that are needed to operate it.
 
     All the values that are going to be communicated to
-    the tank are stored here.
+    the tank are stored here. Every change of a value increments
+    the version, so a sender can wait for changes instead of polling.
+
+    Writers are serialized by a lock, readers only read the reference
+    to the current (version, TankState, InputStamp) tuple, which is swapped
+    atomically. The stamp belongs to the input that caused the last change
+    and is used to measure the latency up to the serial port.
     """
-    def __init__(self) -> None:
-        """Initializes the instance."""
-        self._left = 0
-        self._right = 0
-        self._tower_x = 0
-        self._tower_y = 0
-        self._light = 0
-        self._water = 0
+    __slots__ = ("_snapshot", "_changed")
+
+    def __init__(self, changed: Optional[threading.Condition] = None) -> None:
+        """Initializes the instance.
+
+        Args:
+            changed (Optional[threading.Condition]): The condition notified on every change,
+                shared by several tanks to wait for a change of any of them. A new one by default.
+        """
+        self._snapshot = (0, TankState(), None)
+        self._changed = changed if changed is not None else threading.Condition()
+
+    @property
+    def version(self) -> int:
+        """Counter incremented every time one of the values changes."""
+        return self._snapshot[0]
+
+    @property
+    def state(self) -> TankState:
+        """Consistent copy of all the current values."""
+        return self._snapshot[1]
+
+    def snapshot(self) -> Tuple[int, TankState, Optional[InputStamp]]:
+        """Get the current values together with their version.
+
+        Returns:
+            Tuple[int, TankState, Optional[InputStamp]]: The version, the values belonging
+                to it and the stamp of the input that caused the change, if known.
+        """
+        return self._snapshot
+
+    def update(self, stamp: Optional[InputStamp] = None, **values) -> int:
+        """Change several values at once.
+
+        Readers see either all or none of the given values. The version is
+        only incremented if at least one value actually changes.
+
+        Args:
+            stamp (Optional[InputStamp]): The stamp of the input causing the change.
+            **values: The new values, named like the fields of TankState.
+
+        Returns:
+            int: The version after the update.
+
+        Raises:
+            ValueError: If a value is out of its range.
+            KeyError: If a value name is unknown.
+        """
+        for name, value in values.items():
+            check, message = _VALIDATORS[name]
+            if not check(value):
+                raise ValueError(message)
+
+        with self._changed:
+            version, state, _ = self._snapshot
+            new_state = state._replace(**values)
+            if new_state != state:
+                version += 1
+                self._snapshot = (version, new_state, stamp)
+                self._changed.notify_all()
+            return version
+
+    def stop(self, stamp: Optional[InputStamp] = None) -> int:
+        """Stop the motors and the water at once, e.g. on an emergency or when the controls end.
+
+        The sender writes the stop before any pending motion, see SerialMessenger.transmit_on_change.
+
+        Args:
+            stamp (Optional[InputStamp]): The stamp of the input causing the stop.
+
+        Returns:
+            int: The version after the stop.
+        """
+        return self.update(stamp, left=0, right=0, water=0)
+
+    def wait_for_change(self, version: int, timeout: float) -> int:
+        """Block until the version differs from the given one or the timeout expires.
+
+        Args:
+            version (int): The version the caller has already seen.
+            timeout (float): The maximum time to wait in seconds.
+
+        Returns:
+            int: The current version, equal to the given one if the wait timed out.
+        """
+        with self._changed:
+            self._changed.wait_for(lambda: self._snapshot[0] != version, timeout)
+            return self._snapshot[0]
 
     def get_values(self) -> dict:
         """Get the current values of the tank.
 
         Returns:
-            A list of integers representing the current values of the tank.
+            A dictionary with a consistent copy of the current values of the tank.
         """
+        state = self.state
         return {
-            "left_motor": self._left,
-            "right_motor": self._right,
-            "tower_x": self.tower_x,
-            "tower_y": self._tower_y,
-            "light": self._light,
-            "water": self._water
+            "left_motor": state.left,
+            "right_motor": state.right,
+            "tower_x": state.tower_x,
+            "tower_y": state.tower_y,
+            "light": state.light,
+            "water": state.water
         }
 
     @property
-    def left(self) -> int:
+    def left(self) -> float:
         """X coordinate of the joystick representing speed and direction."""
-        return self._left
+        return self._snapshot[1].left
 
     @property
-    def right(self) -> int:
+    def right(self) -> float:
         """Y coordinate of the joystick representing speed and direction."""
-        return self._right
+        return self._snapshot[1].right
 
     @property
-    def tower_x(self) -> int:
+    def tower_x(self) -> float:
         """X coordinate of the joystick representing the position of the tank tower."""
-        return self._tower_x
+        return self._snapshot[1].tower_x
 
     @property
-    def tower_y(self) -> int:
+    def tower_y(self) -> float:
         """Y coordinate of the joystick representing the position of the tank tower."""
-        return self._tower_y
+        return self._snapshot[1].tower_y
 
     @property
     def light(self) -> int:
         """Whether the light are turned on or off."""
-        return self._light
+        return self._snapshot[1].light
 
     @property
     def water(self) -> int:
         """Whether the water is being shot or not."""
-        return self._water
+        return self._snapshot[1].water
 
     @left.setter
     def left(self, value: float) -> None:
@@ -82,10 +207,7 @@ class Tank:
         Raises:
             ValueError: If the value is not in the range [-1, 1].
         """
-        if -1 <= value <= 1:
-            self._left = value
-        else:
-            raise ValueError("Value of the speed should be in the [-1; 1] interval")
+        self.update(left=value)
 
     @right.setter
     def right(self, value: float) -> None:
@@ -97,10 +219,7 @@ class Tank:
         Raises:
             ValueError: If the value is not in the range [-1, 1].
         """
-        if -1 <= value <= 1:
-            self._right = value
-        else:
-            raise ValueError("Value of the speed should be in the [-1; 1] interval")
+        self.update(right=value)
 
     @tower_x.setter
     def tower_x(self, value: float) -> None:
@@ -112,10 +231,7 @@ class Tank:
         Raises:
             ValueError: If the value is not in the range [-1, 1].
         """
-        if -1 <= value <= 1:
-            self._tower_x = value
-        else:
-            raise ValueError("Value of the tower x should be in the [-1; 1] interval")
+        self.update(tower_x=value)
 
     @tower_y.setter
     def tower_y(self, value: float) -> None:
@@ -127,10 +243,7 @@ class Tank:
         Raises:
             ValueError: If the value is not in the range [-1, 1].
         """
-        if -1 <= value <= 1:
-            self._tower_y = value
-        else:
-            raise ValueError("Value of the tower y should be in the [-1; 1] interval")
+        self.update(tower_y=value)
 
     @light.setter
     def light(self, value: int) -> None:
@@ -142,10 +255,7 @@ class Tank:
         Raises:
             ValueError: If the value is not 0 or 1.
         """
-        if value in (0, 1):
-            self._light = value
-        else:
-            raise ValueError("Value should be 0 or 1")
+        self.update(light=value)
 
     @water.setter
     def water(self, value: int) -> None:
@@ -157,7 +267,4 @@ class Tank:
         Raises:
             ValueError: If the value is not 0 or 1.
         """
-        if value in (0, 1):
-            self._water = value
-        else:
-            raise ValueError("Value should be 0 or 1")
+        self.update(water=value)
@@ -0,0 +1,496 @@
+""" A module carrying the tank values over UDP from the operator to a relay near the tank.
+
+The operator side runs a UdpStateSender, which sends a datagram whenever
+the Tank changes and repeats it every keepalive. The relay side runs a
+UdpStateReceiver, which applies the datagrams to its local Tank, sent on
+by a SerialMessenger as usual. Every datagram stands on its own, so a lost
+one is simply replaced by the next one instead of blocking the stream like
+a retransmission of TCP would.
+
+A datagram only holds the values that differ from a base state the
+receiver is known to have, the last one it acknowledged:
+
+    DATA      KIND SESSION SEQ BASE TIME MASK VALUES...
+    ACK       KIND SESSION SEQ TIME
+    RESYNC    KIND SESSION
+
+All numbers are big-endian. SEQ numbers the datagrams of a session (uint16,
+wrapping), BASE is the SEQ of the base state and MASK has one bit per
+TankState field in the datagram, in field order. A datagram with the
+KEYFRAME bit is based on the default TankState instead. The sticks are
+sent as int16 scaled by 32767, the flags as uint8. TIME is the send time
+of the sender in microseconds, echoed by the ACK to measure the round trip
+time. SESSION is chosen randomly by each sender, so a restarted sender is
+not taken for a stale one.
+
+The receiver keeps the states of the recent datagrams to apply the ones
+based on them, drops datagrams older than the newest applied one and asks
+for a keyframe with RESYNC when it does not know the base.
+
+The receiver only accepts the datagrams of one operator host: the one it
+is configured with, or else the first one whose datagram it applied. With a
+shared secret, every datagram in both directions ends with a truncated
+HMAC-SHA256 of its bytes (MAC_SIZE bytes), and datagrams without a valid one
+are dropped, so only holders of the secret can drive the tank.
+
+Typical usage:
+
+    receiver = UdpStateReceiver(tank, ("0.0.0.0", 47800), operator="192.168.1.20", secret=b"...")
+    threading.Thread(target=receiver.run, daemon=True).start()
+
+    sender = UdpStateSender(tank, ("relay.local", 47800), secret=b"...")
+    threading.Thread(target=sender.run, daemon=True).start()
+"""
+
+import hashlib
+import hmac
+import random
+import socket
+import struct
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+from model.latency import LatencyHistogram, LatencyTracker
+from model.tank import Tank, TankState
+
+DEFAULT_PORT = 47800
+
+KIND_DATA = 1
+KIND_ACK = 2
+KIND_RESYNC = 3
+
+DATA_HEADER = struct.Struct(">BHHHIB")
+ACK = struct.Struct(">BHHI")
+RESYNC = struct.Struct(">BH")
+
+KEYFRAME = 0x80
+STICK_SCALE = 32767
+# Format of every TankState field, the bit of a field in MASK is its index
+FIELD_FORMATS = ("h", "h", "h", "h", "B", "B")
+FLOAT_FIELDS = 4
+# Number of recent states kept by both sides to resolve the base of a datagram
+HISTORY = 64
+MAX_DATAGRAM = 512
+# Interval in seconds at which blocked receives check whether to stop
+POLL_INTERVAL = 0.1
+MAC_SIZE = 16
+
+
+def parse_address(text: str, default_host: str = "0.0.0.0") -> Tuple[str, int]:
+    """Split a "HOST:PORT", "PORT" or "HOST" address.
+
+    Args:
+        text (str): The address.
+        default_host (str): The host used when only a port is given.
+
+    Returns:
+        Tuple[str, int]: The host and port, DEFAULT_PORT if none is given.
+
+    Raises:
+        ValueError: If the port is not a number.
+    """
+    host, separator, port = text.rpartition(":")
+    if not separator:
+        return (default_host, int(text)) if text.isdigit() else (text, DEFAULT_PORT)
+    return host or default_host, int(port)
+
+
+def _newer(seq: int, other: int) -> bool:
+    """Compare two wrapping sequence numbers."""
+    return 0 < (seq - other) & 0xFFFF < 0x8000
+
+
+def _micros() -> int:
+    return int(time.monotonic() * 1e6) & 0xFFFFFFFF
+
+
+def sign(secret: Optional[bytes], datagram: bytes) -> bytes:
+    """Append the MAC of a datagram.
+
+    Args:
+        secret (Optional[bytes]): The shared secret, None to send the datagram unsigned.
+        datagram (bytes): The datagram.
+
+    Returns:
+        bytes: The datagram followed by its MAC, the datagram itself without a secret.
+    """
+    if secret is None:
+        return datagram
+    return datagram + hmac.new(secret, datagram, hashlib.sha256).digest()[:MAC_SIZE]
+
+
+def verify(secret: Optional[bytes], datagram: bytes) -> Optional[bytes]:
+    """Check and strip the MAC of a datagram.
+
+    Args:
+        secret (Optional[bytes]): The shared secret, None if the datagrams are unsigned.
+        datagram (bytes): The datagram received.
+
+    Returns:
+        Optional[bytes]: The datagram without its MAC, None if the MAC is missing or wrong.
+    """
+    if secret is None:
+        return datagram
+    if len(datagram) < MAC_SIZE:
+        return None
+    body = datagram[:-MAC_SIZE]
+    if not hmac.compare_digest(hmac.new(secret, body, hashlib.sha256).digest()[:MAC_SIZE], datagram[-MAC_SIZE:]):
+        return None
+    return body
+
+
+def encode_delta(session: int, seq: int, base_seq: int, base: Optional[TankState], state: TankState) -> bytes:
+    """Build a DATA datagram with the fields of the state that differ from the base.
+
+    Args:
+        session (int): The session of the sender.
+        seq (int): The sequence number of the datagram.
+        base_seq (int): The sequence number of the base state, ignored for a keyframe.
+        base (Optional[TankState]): The state the receiver has, None for a keyframe.
+        state (TankState): The state to send.
+
+    Returns:
+        bytes: The datagram.
+    """
+    mask = 0 if base is not None else KEYFRAME
+    reference = base if base is not None else TankState()
+    formats = ">"
+    values = []
+    for index, (value, known) in enumerate(zip(state, reference)):
+        if value != known:
+            mask |= 1 << index
+            formats += FIELD_FORMATS[index]
+            values.append(round(value * STICK_SCALE) if index < FLOAT_FIELDS else value)
+    header = DATA_HEADER.pack(KIND_DATA, session, seq, base_seq, _micros(), mask)
+    return header + struct.pack(formats, *values)
+
+
+def decode_delta(mask: int, body: bytes, base: TankState) -> TankState:
+    """Apply the fields of a DATA datagram to its base state.
+
+    Args:
+        mask (int): The MASK of the datagram.
+        body (bytes): The bytes following the header.
+        base (TankState): The base state, the default TankState for a keyframe.
+
+    Returns:
+        TankState: The state sent.
+
+    Raises:
+        struct.error: If the body does not match the mask.
+    """
+    indices = [index for index in range(len(FIELD_FORMATS)) if mask & (1 << index)]
+    values = struct.unpack(">" + "".join(FIELD_FORMATS[index] for index in indices), body)
+    fields = list(base)
+    for index, value in zip(indices, values):
+        fields[index] = value / STICK_SCALE if index < FLOAT_FIELDS else value
+    return TankState(*fields)
+
+
+class UdpStateSender:
+    """Sends the changes of a Tank to a UdpStateReceiver.
+
+    Attributes:
+        tank: The Tank whose values are sent.
+        address: The host and port of the receiver.
+        max_rate: The maximum number of datagrams per second.
+        keepalive: The interval in seconds after which an unchanged state is sent again.
+        latency: The LatencyTracker recording when the values of an input are sent.
+        session: The random session of the sender.
+        rtt: The LatencyHistogram of the round trip times.
+        last_rtt: The last round trip time in seconds, None before the first ACK.
+        sent: The number of DATA datagrams sent.
+        keyframes: The number of keyframes among them.
+        bytes_sent: The number of bytes of the DATA datagrams.
+        acks: The number of ACKs received.
+        first_sent: The monotonic time the first datagram was sent, None before.
+    """
+    def __init__(self, tank: Tank, address: Tuple[str, int], max_rate: float = 50.0, keepalive: float = 0.1,
+                 latency: Optional[LatencyTracker] = None, secret: Optional[bytes] = None) -> None:
+        """Initializes the sender with its socket.
+
+        Args:
+            tank (Tank): The tank whose values are sent.
+            address (Tuple[str, int]): The host and port of the receiver.
+            max_rate (float): The maximum datagram rate (default is 50 per second).
+            keepalive (float): The keepalive interval (default is 0.1 seconds), which also
+                bounds how long a lost datagram goes unnoticed.
+            latency (Optional[LatencyTracker]): The tracker shared with the controller, a new one by default.
+            secret (Optional[bytes]): The secret shared with the receiver to sign the datagrams, none by default.
+        """
+        self.tank = tank
+        self.address = address
+        self.max_rate = max_rate
+        self.keepalive = keepalive
+        self.latency = latency or LatencyTracker()
+        self.session = random.getrandbits(16)
+        self.rtt = LatencyHistogram()
+        self.last_rtt: Optional[float] = None
+        self.sent = 0
+        self.keyframes = 0
+        self.bytes_sent = 0
+        self.acks = 0
+        self.first_sent: Optional[float] = None
+
+        self._secret = secret
+        self._socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self._socket.connect(address)
+        self._socket.settimeout(POLL_INTERVAL)
+        self._seq = 0
+        # States of the datagrams not acknowledged yet, by sequence number
+        self._history: Dict[int, TankState] = OrderedDict()
+        self._acked: Optional[Tuple[int, TankState]] = None
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+
+    def run(self) -> None:
+        """Send the tank values whenever they change. Runs inside a thread until stop()."""
+        threading.Thread(target=self._receive, name="udp acks", daemon=True).start()
+        min_interval = 1 / self.max_rate
+        last_sent = -min_interval
+        version = -1
+        last_stamp = None
+
+        while not self._stopped.is_set():
+            self.tank.wait_for_change(version, self.keepalive)
+
+            delay = last_sent + min_interval - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+
+            version, state, stamp = self.tank.snapshot()
+            try:
+                self._send(state)
+            except OSError:
+                if self._stopped.is_set():
+                    break
+                continue  # E.g. ICMP port unreachable while the relay starts, the keepalive tries again
+            last_sent = time.monotonic()
+            if stamp is not None and stamp is not last_stamp:
+                last_stamp = stamp
+                self.latency.mark_sent(stamp)
+
+    def _send(self, state: TankState) -> None:
+        with self._lock:
+            seq = self._seq
+            self._seq = (seq + 1) & 0xFFFF
+            acked = self._acked
+            if acked is not None and (seq - acked[0]) & 0xFFFF > HISTORY:
+                acked = self._acked = None  # The receiver may have dropped the base from its history
+            datagram = sign(self._secret,
+                            encode_delta(self.session, seq, acked[0], acked[1], state) if acked is not None
+                            else encode_delta(self.session, seq, 0, None, state))
+            self._history[seq] = state
+            while len(self._history) > HISTORY:
+                self._history.popitem(last=False)
+
+        self._socket.send(datagram)
+        self.sent += 1
+        self.keyframes += acked is None
+        self.bytes_sent += len(datagram)
+        if self.first_sent is None:
+            self.first_sent = time.monotonic()
+
+    def _receive(self) -> None:
+        """Handle the ACK and RESYNC datagrams of the receiver. Runs inside a thread."""
+        while not self._stopped.is_set():
+            try:
+                datagram = self._socket.recv(MAX_DATAGRAM)
+            except TimeoutError:
+                continue
+            except OSError:
+                if self._stopped.is_set():
+                    return
+                time.sleep(self.keepalive)  # E.g. refused while the relay is not running
+                continue
+            now = _micros()
+            datagram = verify(self._secret, datagram)
+            if datagram is None:
+                continue
+            if len(datagram) == ACK.size and datagram[0] == KIND_ACK:
+                _, session, seq, echoed = ACK.unpack(datagram)
+                if session != self.session:
+                    continue
+                self.acks += 1
+                self.last_rtt = ((now - echoed) & 0xFFFFFFFF) / 1e6
+                self.rtt.record(self.last_rtt)
+                with self._lock:
+                    state = self._history.get(seq)
+                    if state is not None and (self._acked is None or _newer(seq, self._acked[0])):
+                        self._acked = (seq, state)
+            elif len(datagram) == RESYNC.size and datagram[0] == KIND_RESYNC:
+                if RESYNC.unpack(datagram)[1] == self.session:
+                    with self._lock:
+                        self._acked = None
+
+    def stop(self) -> None:
+        """Stop sending and close the socket."""
+        self._stopped.set()
+        self._socket.close()
+
+    def stats(self) -> dict:
+        """Get the counters of the sender.
+
+        Returns:
+            dict: The datagrams, keyframes, bytes and ACKs so far and the round trip times in seconds.
+        """
+        return {
+            "sent": self.sent,
+            "keyframes": self.keyframes,
+            "bytes_sent": self.bytes_sent,
+            "acks": self.acks,
+            "rtt_last": self.last_rtt,
+            "rtt_p50": self.rtt.percentile(50),
+            "rtt_p99": self.rtt.percentile(99),
+        }
+
+    def status_line(self) -> str:
+        """Get a one line summary of the link to the relay.
+
+        Returns:
+            str: The round trip time and the share of acknowledged datagrams.
+        """
+        if self.last_rtt is None:
+            return f"relay not answering, {self.sent} sent"
+        return (f"relay RTT {self.last_rtt * 1e3:.1f} ms (p99 {self.rtt.percentile(99) * 1e3:.1f} ms), "
+                f"{self.acks}/{self.sent} acknowledged")
+
+
+class UdpStateReceiver:
+    """Applies the datagrams of a UdpStateSender to a local Tank.
+
+    Attributes:
+        tank: The Tank the received values are written to.
+        received: The number of DATA datagrams received.
+        applied: The number of datagrams applied to the tank.
+        stale: The number of datagrams dropped because a newer one was applied.
+        missing_base: The number of datagrams dropped because their base was unknown.
+        invalid: The number of malformed datagrams, also those with a wrong MAC.
+        rejected: The number of datagrams dropped because they came from another host than the operator.
+        operator: The IP address of the operator host, None until the first datagram is applied
+            if it was not configured.
+        last_received: The monotonic time of the last applied datagram, None before.
+    """
+    def __init__(self, tank: Tank, address: Tuple[str, int] = ("0.0.0.0", DEFAULT_PORT),
+                 operator: Optional[str] = None, secret: Optional[bytes] = None) -> None:
+        """Initializes the receiver and binds its socket.
+
+        Args:
+            tank (Tank): The tank the values are written to.
+            address (Tuple[str, int]): The host and port to listen on.
+            operator (Optional[str]): The name or address of the only host accepted,
+                by default the host of the first datagram applied.
+            secret (Optional[bytes]): The secret shared with the sender, whose datagrams are then
+                only accepted with a valid MAC, none by default.
+
+        Raises:
+            OSError: If the address cannot be bound or the operator cannot be resolved.
+        """
+        self.tank = tank
+        self.received = 0
+        self.applied = 0
+        self.stale = 0
+        self.missing_base = 0
+        self.invalid = 0
+        self.rejected = 0
+        self.operator = socket.gethostbyname(operator) if operator else None
+        self.last_received: Optional[float] = None
+
+        self._secret = secret
+        self._socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self._socket.bind(address)
+        self._socket.settimeout(POLL_INTERVAL)
+        self._session: Optional[int] = None
+        self._newest = 0
+        self._history: Dict[int, TankState] = OrderedDict()
+        self._stopped = threading.Event()
+
+    @property
+    def address(self) -> Tuple[str, int]:
+        """The host and port the receiver listens on."""
+        return self._socket.getsockname()
+
+    def run(self) -> None:
+        """Receive and apply the datagrams. Runs inside a thread until stop()."""
+        while not self._stopped.is_set():
+            try:
+                datagram, sender = self._socket.recvfrom(MAX_DATAGRAM)
+            except OSError:
+                if self._stopped.is_set():
+                    return
+                continue
+            if self.operator is not None and sender[0] != self.operator:
+                self.rejected += 1  # Not even answered, so the relay cannot be used to reflect traffic
+                continue
+            datagram = verify(self._secret, datagram)
+            if datagram is None or len(datagram) < DATA_HEADER.size or datagram[0] != KIND_DATA:
+                self.invalid += 1
+                continue
+            self.received += 1
+            self._handle(datagram, sender)
+
+    def _handle(self, datagram: bytes, sender) -> None:
+        _, session, seq, base_seq, sent_time, mask = DATA_HEADER.unpack_from(datagram)
+        if session != self._session and mask & KEYFRAME:
+            # A new or restarted sender, its sequence numbers start over
+            self._session = session
+            self._history.clear()
+        elif session == self._session and not _newer(seq, self._newest):
+            self.stale += 1
+            return
+
+        base = TankState() if mask & KEYFRAME else self._history.get(base_seq)
+        if base is None or session != self._session:
+            # E.g. the receiver restarted, the sender starts over with a keyframe
+            self.missing_base += 1
+            self._socket.sendto(sign(self._secret, RESYNC.pack(KIND_RESYNC, session)), sender)
+            return
+        try:
+            state = decode_delta(mask, datagram[DATA_HEADER.size:], base)
+            self.tank.update(**state._asdict())
+        except (struct.error, ValueError):
+            self.invalid += 1
+            return
+
+        self._newest = seq
+        self._history[seq] = state
+        while len(self._history) > HISTORY:
+            self._history.popitem(last=False)
+        self.applied += 1
+        self.last_received = time.monotonic()
+        if self.operator is None:
+            self.operator = sender[0]  # Only this host drives from now on
+        self._socket.sendto(sign(self._secret, ACK.pack(KIND_ACK, session, seq, sent_time)), sender)
+
+    def stop(self) -> None:
+        """Stop receiving and close the socket."""
+        self._stopped.set()
+        self._socket.close()
+
+    def stats(self) -> dict:
+        """Get the counters of the receiver.
+
+        Returns:
+            dict: The datagrams received, applied and dropped by reason.
+        """
+        return {
+            "received": self.received,
+            "applied": self.applied,
+            "stale": self.stale,
+            "missing_base": self.missing_base,
+            "invalid": self.invalid,
+            "rejected": self.rejected,
+        }
+
+    def status_line(self) -> str:
+        """Get a one line summary of the link to the operator.
+
+        Returns:
+            str: The time since the last datagram and the dropped ones.
+        """
+        if self.last_received is None:
+            return "waiting for the operator"
+        return (f"operator {(time.monotonic() - self.last_received) * 1e3:.0f} ms ago, "
+                f"{self.stale} stale, {self.missing_base} unknown base")
@@ -0,0 +1,211 @@
+""" A module stopping the tank when the control pipeline stalls.
+
+The sender repeats the last values of the Tank until they change. If the
+thread reading the gamepads blocks, or the GUI thread hangs, nothing
+changes them anymore and the tank keeps driving on a stale command. The
+Watchdog watches the progress of every stage through a counter the stage
+increments anyway, e.g. the loop iterations of the gamepad reader, so the
+stages pay nothing for being watched. It polls the counters every few
+milliseconds; once a tripping stage made no progress for its timeout, the
+motors are ramped down to zero within the ramp time and the water is
+turned off. The tank is therefore stopped at most timeout + ramp + interval
+seconds after the stage stalled. The ramp is completed even if the stage
+recovers meanwhile, then the next input drives again.
+
+The time between two progresses of every stage is recorded in a
+LatencyHistogram, at the resolution of the check interval, so the report
+shows how long the stages stalled.
+
+Typical usage:
+
+    watchdog = Watchdog([tank], on_status=print)
+    watchdog.watch("gamepad", lambda: gamepad.loops, timeout=0.3)
+    watchdog.watch("serial", lambda: comms.frames_written, timeout=1.5, trips=False)
+    watchdog.start()
+"""
+
+import threading
+import time
+from typing import Callable, List, Optional
+
+from model.latency import LatencyHistogram
+from model.tank import Tank
+
+DEFAULT_TIMEOUT = 0.3
+DEFAULT_RAMP = 0.2
+DEFAULT_INTERVAL = 0.01
+
+
+class _Stage:
+    """The progress of a watched stage, only written by the watchdog thread."""
+    __slots__ = ("name", "counter", "timeout", "trips", "value", "progressed", "gaps", "stalls")
+
+    def __init__(self, name: str, counter: Callable[[], int], timeout: float, trips: bool, now: float) -> None:
+        self.name = name
+        self.counter = counter
+        self.timeout = timeout
+        self.trips = trips
+        self.value = counter()
+        self.progressed = now
+        self.gaps = LatencyHistogram()
+        self.stalls = 0
+
+
+class Watchdog:
+    """Ramps the motors down when a stage of the control pipeline makes no progress.
+
+    Attributes:
+        tanks: The tanks stopped when tripping, e.g. all tanks of a fleet.
+        ramp: The time in seconds in which the motors are ramped down to zero.
+        interval: The time in seconds between two checks.
+        on_status: The function called with the status_line() when the watchdog trips or releases.
+        tripped: The name of the stage that tripped the watchdog, None while it is released.
+        trips: The number of times the watchdog tripped.
+    """
+    def __init__(self, tanks: List[Tank], ramp: float = DEFAULT_RAMP, interval: float = DEFAULT_INTERVAL,
+                 on_status: Optional[Callable[[str], None]] = None) -> None:
+        """Initializes the watchdog, it checks once started.
+
+        Args:
+            tanks (List[Tank]): The tanks to stop.
+            ramp (float): The time to ramp the motors down (default is 0.2 seconds).
+            interval (float): The time between two checks (default is 10 ms).
+            on_status (Optional[Callable[[str], None]]): Called on every trip and release,
+                from the watchdog thread.
+        """
+        self.tanks = tanks
+        self.ramp = ramp
+        self.interval = interval
+        self.on_status = on_status
+        self.tripped: Optional[str] = None
+        self.trips = 0
+        self._stages: List[_Stage] = []
+        self._tripped_at = 0.0
+        self._ramp_from: List[tuple] = []
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def watch(self, name: str, counter: Callable[[], int], timeout: float = DEFAULT_TIMEOUT,
+              trips: bool = True) -> None:
+        """Watch the progress of a stage.
+
+        Args:
+            name (str): The name of the stage in the report.
+            counter (Callable[[], int]): A function returning a number the stage changes
+                at least every timeout seconds while it works, e.g. its loop iterations.
+            timeout (float): The time without progress after which the stage counts as stalled
+                (default is DEFAULT_TIMEOUT).
+            trips (bool): Whether a stall stops the tank, or is only recorded.
+        """
+        self._stages.append(_Stage(name, counter, timeout, trips, time.monotonic()))
+
+    def start(self) -> None:
+        """Start checking in a thread, the stages count as fresh from now on."""
+        now = time.monotonic()
+        for stage in self._stages:
+            stage.progressed = now
+        self._thread = threading.Thread(target=self.run, name="watchdog", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Stop checking."""
+        self._stopped.set()
+
+    def run(self) -> None:
+        """Check the stages every interval until stop(). Runs inside a thread."""
+        while not self._stopped.wait(self.interval):
+            self.check()
+
+    def check(self, now: Optional[float] = None) -> None:
+        """Record the progress of all stages, then trip, ramp down or release.
+
+        Args:
+            now (Optional[float]): The monotonic time of the check, the current time by default.
+        """
+        if now is None:
+            now = time.monotonic()
+        stalled = None
+        for stage in self._stages:
+            value = stage.counter()
+            if value != stage.value:
+                gap = now - stage.progressed
+                stage.gaps.record(gap)
+                if gap > stage.timeout:
+                    stage.stalls += 1
+                stage.value = value
+                stage.progressed = now
+            elif stalled is None and stage.trips and now - stage.progressed > stage.timeout:
+                stalled = stage.name
+
+        if stalled is not None and self.tripped is None:
+            self._trip(stalled, now)
+        elif stalled is None and self.tripped is not None:
+            self.tripped = None
+            self._report_status()
+        if self._ramp_from:
+            self._ramp_down(now)
+
+    def _trip(self, stage: str, now: float) -> None:
+        self.tripped = stage
+        self.trips += 1
+        self._tripped_at = now
+        self._ramp_from = [(tank, tank.left, tank.right) for tank in self.tanks]
+        for tank in self.tanks:
+            tank.update(water=0)
+        self._report_status()
+
+    def _ramp_down(self, now: float) -> None:
+        factor = max(0.0, 1 - (now - self._tripped_at) / self.ramp) if self.ramp > 0 else 0.0
+        for tank, left, right in self._ramp_from:
+            tank.update(left=left * factor, right=right * factor)
+        if not factor:
+            self._ramp_from = []  # Stopped, the tank is left to the controls again
+
+    def _report_status(self) -> None:
+        if self.on_status is not None:
+            self.on_status(self.status_line())
+
+    def ages(self) -> dict:
+        """Get the time since every stage made progress, as seen by the last check.
+
+        Returns:
+            dict: The age in seconds by stage name.
+        """
+        now = time.monotonic()
+        return {stage.name: now - stage.progressed for stage in self._stages}
+
+    def stats(self) -> dict:
+        """Get the counters of the watchdog.
+
+        Returns:
+            dict: The number of trips and the stalls of every stage.
+        """
+        stats = {"trips": self.trips}
+        for stage in self._stages:
+            stats[f"{stage.name}_stalls"] = stage.stalls
+        return stats
+
+    def status_line(self) -> str:
+        """Get a one line summary for the status bar.
+
+        Returns:
+            str: The stalled stage while tripped, else the number of trips so far.
+        """
+        if self.tripped is not None:
+            return f"failsafe: {self.tripped} stalled, stopping"
+        return f"failsafe ok, {self.trips} trip{'s' if self.trips > 1 else ''}" if self.trips else ""
+
+    def report(self) -> str:
+        """Format the time between two progresses of every stage as a table in milliseconds.
+
+        Returns:
+            str: One line per stage.
+        """
+        lines = [f"{'stage':<12} {'gaps':>8} {'p50 ms':>8} {'p99 ms':>8} {'max ms':>8} {'stalls':>8}"]
+        for stage in self._stages:
+            gaps = stage.gaps
+            lines.append(
+                f"{stage.name:<12} {gaps.count:>8} {gaps.percentile(50) * 1e3:>8.1f} "
+                f"{gaps.percentile(99) * 1e3:>8.1f} {gaps.maximum * 1e3:>8.1f} {stage.stalls:>8}"
+            )
+        return "\n".join(lines)
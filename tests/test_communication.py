@@ -0,0 +1,96 @@
+"""Tests of the frame priorities and the send-on-change scheduler of model.communication, over a pty."""
+
+import os
+import select
+import threading
+import time
+
+import pytest
+
+from model.communication import (PRIORITY_EVENT, PRIORITY_MOTION, PRIORITY_SAFETY, SerialMessenger,
+                                  frame_priority)
+from model.protocol import CRC_SIZE, HEADER_SIZE
+from model.tank import Tank
+
+FRAME_SIZE = HEADER_SIZE + 6 + CRC_SIZE
+# A frame keeps the link busy for 0.4 seconds at 300 baud
+BAUD_RATE = 300
+
+
+def test_first_frame_is_an_event():
+    assert frame_priority(None, (0, 0, 0, 0)) == PRIORITY_EVENT
+
+
+def test_unchanged_frame_is_not_sent():
+    assert frame_priority((10, -10, 1, 0), (10, -10, 1, 0)) is None
+
+
+def test_stopping_motors_is_safety():
+    assert frame_priority((10, 0, 0, 0), (0, 0, 0, 0)) == PRIORITY_SAFETY
+    assert frame_priority((10, 0, 0, 1), (0, 0, 0, 0)) == PRIORITY_SAFETY
+
+
+def test_flags_of_a_stopped_tank_are_events():
+    assert frame_priority((0, 0, 0, 0), (0, 0, 1, 0)) == PRIORITY_EVENT
+    assert frame_priority((0, 0, 0, 1), (0, 0, 0, 0)) == PRIORITY_EVENT
+    assert frame_priority((10, 5, 0, 0), (10, 5, 1, 0)) == PRIORITY_EVENT
+
+
+def test_speed_changes_are_motion():
+    assert frame_priority((10, 5, 0, 0), (20, -5, 0, 0)) == PRIORITY_MOTION
+    assert frame_priority((0, 0, 0, 0), (1, 0, 0, 0)) == PRIORITY_MOTION
+
+
+@pytest.fixture(name="link")
+def fixture_link():
+    """A messenger sending on change into a pty, and the master side of the pty to read the frames from."""
+    master, slave = os.openpty()
+    tank = Tank()
+    tank.update(left=0.2, right=0.2)
+    # No keepalive during the tests, so the thread stays blocked afterwards
+    messenger = SerialMessenger(os.ttyname(slave), baud_rate=BAUD_RATE, keepalive=1e6, tank=tank)
+    threading.Thread(target=messenger.transmit_on_change, daemon=True).start()
+    yield messenger, master
+    os.close(master)
+    os.close(slave)
+
+
+def read_frame(master: int, timeout: float = 2.0) -> bytes:
+    """Read the next frame written to the pty, empty if none arrives in time."""
+    data = b""
+    deadline = time.monotonic() + timeout
+    while len(data) < FRAME_SIZE:
+        if not select.select([master], [], [], max(0.0, deadline - time.monotonic()))[0]:
+            return b""
+        data += os.read(master, FRAME_SIZE - len(data))
+    return data
+
+
+def speeds(frame: bytes):
+    message = frame[HEADER_SIZE:HEADER_SIZE + 6]
+    return (message[1] if message[0] else -message[1]), (message[3] if message[2] else -message[3])
+
+
+def test_motion_waits_until_the_link_is_free(link):
+    messenger, master = link
+    assert speeds(read_frame(master)) == (51, 51)
+
+    messenger.tank.update(left=0.5)
+    start = time.monotonic()
+    assert speeds(read_frame(master)) == (128, 51)
+    assert time.monotonic() - start > 0.25
+    assert messenger.stats()["motion_frames"] == 1
+
+
+def test_stop_is_written_before_the_queued_motion(link):
+    messenger, master = link
+    read_frame(master)
+
+    messenger.tank.update(left=0.5)
+    assert read_frame(master, timeout=0.1) == b""  # Held back until the first frame is on the wire
+    start = time.monotonic()
+    messenger.tank.update(left=0.0, right=0.0)
+    assert speeds(read_frame(master)) == (0, 0)
+    assert time.monotonic() - start < 0.2
+    stats = messenger.stats()
+    assert (stats["safety_frames"], stats["motion_frames"]) == (1, 0)
@@ -0,0 +1,79 @@
+"""Tests of controller.evdev_reader reading input_event structs from a FIFO instead of a device."""
+
+import os
+import threading
+import time
+
+import pytest
+
+from controller.evdev_reader import EV_ABS, EV_KEY, EV_SYN, EVENT_STRUCT, EvdevReader
+
+
+def event(ev_type: int, code: int, value: int, sec: int = 12, usec: int = 500000) -> bytes:
+    return EVENT_STRUCT.pack(sec, usec, ev_type, code, value)
+
+
+@pytest.fixture
+def fifo(tmp_path):
+    path = str(tmp_path / "event0")
+    os.mkfifo(path)
+    reader = EvdevReader([path])
+    writer = os.open(path, os.O_WRONLY)
+    yield path, reader, writer
+    try:
+        os.close(writer)
+    except OSError:
+        pass
+    reader.close()
+
+
+def test_events_are_named_and_stamped(fifo):
+    path, reader, writer = fifo
+    os.write(writer, event(EV_ABS, 0x00, -1200) + event(EV_KEY, 0x130, 1) + event(EV_SYN, 0x00, 0))
+
+    events = reader.read(1.0)
+    assert [(e.ev_type, e.code, e.state) for e in events] == [
+        ("Absolute", "ABS_X", -1200), ("Key", "BTN_SOUTH", 1), ("Sync", "SYN_REPORT", 0)]
+    assert events[0].timestamp == 12.5
+    assert events[0].device == path
+
+
+def test_unknown_codes_are_skipped(fifo):
+    _, reader, writer = fifo
+    os.write(writer, event(EV_ABS, 0x28, 5) + event(0x04, 0x04, 9) + event(EV_ABS, 0x01, 7))
+
+    assert [e.code for e in reader.read(1.0)] == ["ABS_Y"]
+
+
+def test_partial_struct_is_kept_for_the_next_read(fifo):
+    _, reader, writer = fifo
+    data = event(EV_ABS, 0x03, 300) + event(EV_SYN, 0x00, 0)
+    os.write(writer, data[:EVENT_STRUCT.size + 5])
+    assert [e.code for e in reader.read(1.0)] == ["ABS_RX"]
+
+    os.write(writer, data[EVENT_STRUCT.size + 5:])
+    assert [e.code for e in reader.read(1.0)] == ["SYN_REPORT"]
+
+
+def test_read_times_out_without_events(fifo):
+    _, reader, _ = fifo
+    started = time.monotonic()
+    assert reader.read(0.05) == []
+    assert time.monotonic() - started >= 0.04
+
+
+def test_stop_wakes_up_a_blocked_read(fifo):
+    _, reader, _ = fifo
+    threading.Timer(0.05, reader.stop).start()
+    started = time.monotonic()
+    assert reader.read(None) == []
+    assert time.monotonic() - started < 1.0
+
+
+def test_closed_writer_removes_the_device(fifo):
+    path, reader, writer = fifo
+    assert reader.devices == [path]
+    os.close(writer)
+
+    assert reader.read(1.0) == []
+    assert reader.devices == []
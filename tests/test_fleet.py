@@ -0,0 +1,125 @@
+"""Tests of the scheduling of model.fleet, with the frames of several tanks written into a pty."""
+
+import os
+import select
+import threading
+import time
+
+import pytest
+
+from model.communication import SerialMessenger
+from model.fleet import Fleet, FleetTransmitter
+from model.protocol import CRC_SIZE, HEADER_SIZE
+
+FRAME_SIZE = HEADER_SIZE + 7 + CRC_SIZE
+
+
+@pytest.fixture(name="pty")
+def fixture_pty():
+    master, slave = os.openpty()
+    yield os.ttyname(slave), master
+    os.close(master)
+    os.close(slave)
+
+
+def start(port: str, fleet: Fleet, baud_rate: int, max_rate: float = 50.0) -> FleetTransmitter:
+    # No keepalive during the tests, so the thread stays blocked afterwards
+    transmitter = FleetTransmitter(SerialMessenger(port, baud_rate=baud_rate, max_rate=max_rate, keepalive=1e6),
+                                   fleet)
+    threading.Thread(target=transmitter.run, daemon=True).start()
+    return transmitter
+
+
+def wait_until(predicate, timeout: float = 2.0) -> bool:
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.005)
+    return True
+
+
+def read_frame(master: int, timeout: float = 2.0) -> bytes:
+    """Read the next frame written to the pty, empty if none arrives in time."""
+    data = b""
+    deadline = time.monotonic() + timeout
+    while len(data) < FRAME_SIZE:
+        if not select.select([master], [], [], max(0.0, deadline - time.monotonic()))[0]:
+            return b""
+        data += os.read(master, FRAME_SIZE - len(data))
+    return data
+
+
+def address_and_speeds(frame: bytes):
+    address, *message = frame[HEADER_SIZE:HEADER_SIZE + 7]
+    return address, (message[1] if message[0] else -message[1]), (message[3] if message[2] else -message[3])
+
+
+def test_active_tank_gets_its_weight(pty):
+    port, master = pty
+    fleet = Fleet(2)
+    fleet.select(1)
+    transmitter = start(port, fleet, baud_rate=115200, max_rate=1000)
+
+    stop = threading.Event()
+
+    def drain():
+        while not stop.is_set():
+            if select.select([master], [], [], 0.05)[0]:
+                os.read(master, 4096)
+
+    drainer = threading.Thread(target=drain, daemon=True)
+    drainer.start()
+    # Both tanks change their speed all the time, so both are always due
+    deadline = time.monotonic() + 0.5
+    speed = 0
+    while time.monotonic() < deadline:
+        speed = (speed + 1) % 256
+        for tank in fleet.tanks:
+            tank.update(left=speed / 255)
+        time.sleep(0.0002)
+    frames = list(transmitter.frames)
+    # Drained until the last changes are written, then the transmitter waits
+    written = None
+    while written != transmitter.frames:
+        written = list(transmitter.frames)
+        time.sleep(0.05)
+    stop.set()
+    drainer.join()
+
+    assert frames[0] > 20
+    # Not every tank changed again before every frame, so the share is close to the weight only
+    assert 3 < frames[1] / frames[0] <= FleetTransmitter.ACTIVE_WEIGHT + 0.5
+
+
+def test_stop_of_any_tank_goes_before_queued_motion(pty):
+    port, master = pty
+    fleet = Fleet(2)
+    for tank in fleet.tanks:
+        tank.update(left=0.2, right=0.2)
+    # A frame keeps the link busy for 0.43 seconds at 300 baud
+    transmitter = start(port, fleet, baud_rate=300)
+    assert sorted(address_and_speeds(read_frame(master)) for _ in range(2)) == [(0, 51, 51), (1, 51, 51)]
+
+    fleet.tanks[0].update(left=0.5)
+    assert read_frame(master, timeout=0.1) == b""  # Held back until the link is free
+    started = time.monotonic()
+    fleet.tanks[1].stop()
+    assert address_and_speeds(read_frame(master)) == (1, 0, 0)
+    assert time.monotonic() - started < 0.2
+    assert address_and_speeds(read_frame(master)) == (0, 128, 51)
+    assert wait_until(lambda: transmitter.frames == [2, 2])
+
+
+def test_changes_the_frame_does_not_carry_are_not_sent(pty):
+    port, master = pty
+    fleet = Fleet(2)
+    transmitter = start(port, fleet, baud_rate=115200)
+    assert len([read_frame(master) for _ in range(2)]) == 2
+
+    fleet.tanks[0].update(tower_x=0.5)
+    fleet.tanks[1].update(tower_y=-0.5)
+    assert read_frame(master, timeout=0.2) == b""
+    fleet.tanks[1].update(right=-0.2)
+    assert address_and_speeds(read_frame(master)) == (1, 0, -51)
+    assert wait_until(lambda: transmitter.frames == [1, 2])
@@ -0,0 +1,108 @@
+"""Tests of the ring file of model.flight_recorder, written and read back from a temporary file."""
+
+import io
+import itertools
+from types import SimpleNamespace
+
+import pytest
+
+from model import flight_recorder
+from model.flight_recorder import FRAME_SIZE, FlightLog, FlightRecorder
+
+
+@pytest.fixture(name="clock")
+def fixture_clock(monkeypatch):
+    """Stamp the records with 1, 2, 3... seconds, and the wall clock 1000 seconds later."""
+    ticks = itertools.count(1)
+    clock = SimpleNamespace(now=0.0)
+
+    def monotonic():
+        clock.now = float(next(ticks))
+        return clock.now
+
+    monkeypatch.setattr(flight_recorder, "time", SimpleNamespace(monotonic=monotonic,
+                                                                 time=lambda: clock.now + 1000))
+    return clock
+
+
+def record(path, seqs, capacity=4):
+    recorder = FlightRecorder(str(path), capacity)
+    for seq in seqs:
+        recorder.record(seq, bytes([seq]) * 3)
+    recorder.close()
+
+
+@pytest.mark.usefixtures("clock")
+def test_records_before_the_ring_is_full(tmp_path):
+    path = tmp_path / "flight.fkfr"
+    record(path, [1, 2, 3])
+
+    log = FlightLog.load(str(path))
+    assert (log.capacity, log.written) == (4, 3)
+    assert [r.seq for r in log.records()] == [1, 2, 3]
+    assert log[1] == (2.0, 1002.0, 2, b"\x02\x02\x02")
+
+
+@pytest.mark.usefixtures("clock")
+def test_wraparound_skips_the_slot_overwritten_next(tmp_path):
+    path = tmp_path / "flight.fkfr"
+    record(path, [1, 2, 3, 4])
+    assert [r.seq for r in FlightLog.load(str(path)).records()] == [2, 3, 4]
+
+    record(path, [5, 6, 7])  # The ring continues where the last run stopped
+    log = FlightLog.load(str(path))
+    assert log.written == 7
+    assert [r.seq for r in log.records()] == [5, 6, 7]
+
+
+@pytest.mark.usefixtures("clock")
+def test_other_capacity_starts_a_new_ring(tmp_path):
+    path = tmp_path / "flight.fkfr"
+    record(path, [1, 2, 3])
+    record(path, [4], capacity=8)
+    log = FlightLog.load(str(path))
+    assert (log.capacity, [r.seq for r in log.records()]) == (8, [4])
+
+
+@pytest.mark.usefixtures("clock")
+def test_long_frames_are_cut(tmp_path):
+    path = tmp_path / "flight.fkfr"
+    recorder = FlightRecorder(str(path), 4)
+    recorder.record(1, bytes(range(FRAME_SIZE + 5)))
+    recorder.close()
+    assert FlightLog.load(str(path))[0].frame == bytes(range(FRAME_SIZE))
+
+
+@pytest.mark.usefixtures("clock")
+def test_records_in_a_time_interval(tmp_path):
+    path = tmp_path / "flight.fkfr"
+    record(path, range(1, 9), capacity=16)
+    log = FlightLog.load(str(path))
+
+    assert [r.seq for r in log.records(3, 5)] == [3, 4, 5]
+    assert [r.seq for r in log.records(start=7)] == [7, 8]
+    assert [r.seq for r in log.records(end=2)] == [1, 2]
+    assert [r.seq for r in log.records(1003, 1004, wall=True)] == [3, 4]
+    assert log.records(20) == []
+
+
+@pytest.mark.usefixtures("clock")
+def test_csv_decodes_the_frames(tmp_path):
+    path = tmp_path / "flight.fkfr"
+    recorder = FlightRecorder(str(path), 4)
+    # SYNC, length and seq, then an addressed message and the CRC, see model.fleet
+    recorder.record(9, b"\xaa\x55\x07\x09" + bytes([2, 1, 255, 0, 128, 1, 0]) + b"\x00\x00")
+    recorder.close()
+
+    output = io.StringIO()
+    FlightLog.to_csv(output, FlightLog.load(str(path)).records())
+    header, row = output.getvalue().splitlines()
+    assert header.split(",")[3:9] == ["seq", "address", "left", "right", "light", "water"]
+    assert row.split(",")[3:9] == ["9", "2", "255", "-128", "1", "0"]
+
+
+def test_other_files_are_rejected(tmp_path):
+    path = tmp_path / "other.bin"
+    path.write_bytes(bytes(64))
+    with pytest.raises(ValueError):
+        FlightLog.load(str(path))
@@ -0,0 +1,75 @@
+"""Tests of controller.gamepad_core, fed with input frames from a queue instead of a gamepad."""
+
+import queue
+import time
+
+import pytest
+
+from controller.evdev_reader import EvdevEvent
+from controller.gamepad_core import GamepadCore
+
+
+class QueueReader:
+    """A reader with the interface of an EvdevReader returning the frames put into its queue."""
+    devices = ["pad"]
+
+    def __init__(self) -> None:
+        self.frames = queue.Queue()
+
+    def read(self, timeout=None):
+        try:
+            return self.frames.get(timeout=timeout)
+        except queue.Empty:
+            return []
+
+    def stop(self) -> None:
+        pass
+
+    def close(self) -> None:
+        pass
+
+
+@pytest.fixture(name="gamepad")
+def fixture_gamepad(request):
+    reader = QueueReader()
+    gamepad = GamepadCore(reader=reader, deadzone=getattr(request, "param", None))
+    moves = []
+    gamepad.leftJoystickPos.connect(lambda x, y, stamp: moves.append((x, y)))
+    yield gamepad, reader, moves
+    gamepad.stop()
+
+
+def send(gamepad, reader, x: int, y: int) -> None:
+    """Feed one input frame with the left stick at the raw position and wait until it is processed."""
+    frames = gamepad.frames
+    now = time.monotonic()
+    reader.frames.put([EvdevEvent("Absolute", "ABS_X", x, now, "pad"),
+                       EvdevEvent("Absolute", "ABS_Y", y, now, "pad"),
+                       EvdevEvent("Sync", "SYN_REPORT", 0, now, "pad")])
+    deadline = now + 2
+    while gamepad.frames == frames and time.monotonic() < deadline:
+        time.sleep(0.001)
+    assert gamepad.frames > frames
+
+
+def test_centred_jitter_emits_nothing(gamepad):
+    gamepad, reader, moves = gamepad
+    for x, y in [(300, -200), (-250, 120), (0, 310), (-310, -40)] * 5:
+        send(gamepad, reader, x, y)
+    assert moves == []
+
+
+def test_stick_is_emitted_raw_outside_the_deadzone(gamepad):
+    gamepad, reader, moves = gamepad
+    send(gamepad, reader, 3277, 3277)  # About 0.1 on both axes, 0.14 from the centre
+    send(gamepad, reader, 16384, 0)
+    send(gamepad, reader, 300, -200)
+    send(gamepad, reader, -250, 120)
+    assert moves == [(3277 / 32768, 3277 / 32768), (0.5, 0.0), (0, 0)]
+
+
+@pytest.mark.parametrize("gamepad", [0.05], indirect=True)
+def test_deadzone_of_the_shaper(gamepad):
+    gamepad, reader, moves = gamepad
+    send(gamepad, reader, 2300, 0)  # 0.07, inside the default deadzone
+    assert moves == [(2300 / 32768, 0.0)]
@@ -0,0 +1,83 @@
+"""Tests of the batch functions of controller.shaping against a replay through the GamepadCore."""
+
+import threading
+
+import pytest
+
+from controller.gamepad_core import GamepadCore
+from controller.roles import RoleMapping
+from controller.session import SessionLog, SessionPlayer
+from controller.shaping import InputShaper
+
+np = pytest.importorskip("numpy")
+
+# Input frames of two gamepads: (device, ABS_X, ABS_Y), None for an axis without an event. Both sticks
+# are at rest in the end, like the replay once it finished and the gamepads are gone.
+FRAMES = [(1, 20000, 0), (0, None, 16000), (1, -20000, None), (0, 300, 200), (1, None, 30000),
+          (0, -16000, None), (1, 0, -25000), (0, 0, 0), (1, 5000, 5000), (1, 0, 0)]
+
+
+class GatedReader:
+    """Passes the reads on to a reader once the gate is opened, so the slots can be connected first."""
+    def __init__(self, reader) -> None:
+        self.reader = reader
+        self.gate = threading.Event()
+
+    @property
+    def devices(self):
+        return self.reader.devices
+
+    def read(self, timeout=None):
+        if not self.gate.wait(timeout):
+            return []
+        return self.reader.read(timeout)
+
+    def stop(self) -> None:
+        self.gate.set()
+        self.reader.stop()
+
+    def close(self) -> None:
+        self.reader.close()
+
+
+def two_gamepad_log() -> SessionLog:
+    log = SessionLog()
+    for index, (device, x, y) in enumerate(FRAMES):
+        timestamp = index * 0.01
+        if x is not None:
+            log.append(timestamp, "ABS_X", x, device)
+        if y is not None:
+            log.append(timestamp, "ABS_Y", y, device)
+        log.append(timestamp, "SYN_REPORT", 0, device)
+    return log
+
+
+def changes(rows):
+    """Drop the rows equal to the one before."""
+    return [row for index, row in enumerate(rows) if index == 0 or row != rows[index - 1]]
+
+
+@pytest.mark.parametrize("roles", [None, ["drive", "drive,turret,effects"]])
+def test_session_batch_matches_the_replay(roles):
+    log = two_gamepad_log()
+    shaper = InputShaper()
+    mapping = RoleMapping.parse(roles)
+
+    player = SessionPlayer(log, speed=0)
+    reader = GatedReader(player)
+    gamepad = GamepadCore(reader=reader, roles=mapping, deadzone=shaper.deadzone)
+    moves = []
+    gamepad.leftJoystickPos.connect(lambda x, y, stamp: moves.append((x, y)))
+    reader.gate.set()
+    assert player.finished.wait(2)
+    gamepad.stop()
+
+    # Both start from the stopped motors, the replay only emits the changes
+    raw = np.array([(0, 0)] + [(int(x * GamepadCore.MAX_JOY_VAL), int(y * GamepadCore.MAX_JOY_VAL))
+                               for x, y in moves])
+    replayed = changes([tuple(row) for row in shaper.wire_batch(raw[:, 0], raw[:, 1]).tolist()])
+
+    timestamps, wire = shaper.session_batch(log, roles=mapping)
+    assert len(timestamps) == len(FRAMES)
+    assert changes([replayed[0]] + [tuple(row) for row in wire.tolist()]) == replayed
+    assert len(replayed) > 3
@@ -0,0 +1,145 @@
+"""Tests of the delta datagrams and the ACK/RESYNC exchange of model.udp_bridge over loopback."""
+
+import socket
+import threading
+import time
+
+import pytest
+
+from model.tank import Tank, TankState
+from model.udp_bridge import (ACK, DATA_HEADER, KEYFRAME, KIND_ACK, KIND_DATA, KIND_RESYNC, RESYNC, UdpStateReceiver,
+                              UdpStateSender, decode_delta, encode_delta, sign, verify)
+
+
+def wait_until(predicate, timeout: float = 2.0) -> bool:
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.005)
+    return True
+
+
+def unpack(datagram: bytes):
+    _, session, seq, base_seq, _, mask = DATA_HEADER.unpack_from(datagram)
+    return session, seq, base_seq, mask
+
+
+def test_delta_only_carries_changed_fields():
+    base = TankState(left=0.5, right=-0.25, light=1)
+    state = base._replace(right=0.75, water=1)
+    datagram = encode_delta(7, 3, 2, base, state)
+
+    session, seq, base_seq, mask = unpack(datagram)
+    assert (session, seq, base_seq) == (7, 3, 2)
+    assert mask == (1 << 1) | (1 << 5)
+    assert len(datagram) == DATA_HEADER.size + 2 + 1
+    decoded = decode_delta(mask, datagram[DATA_HEADER.size:], base)
+    assert decoded.right == pytest.approx(0.75, abs=1 / 32767)
+    assert decoded._replace(right=0.75) == state
+
+
+def test_keyframe_is_based_on_the_default_state():
+    state = TankState(left=-1, right=1, tower_x=0.5, light=1)
+    datagram = encode_delta(7, 0, 0, None, state)
+
+    mask = unpack(datagram)[3]
+    assert mask & KEYFRAME
+    decoded = decode_delta(mask & ~KEYFRAME, datagram[DATA_HEADER.size:], TankState())
+    assert decoded == pytest.approx(state, abs=1 / 32767)
+
+
+def test_mac_is_checked():
+    datagram = encode_delta(7, 0, 0, None, TankState(left=1))
+    signed = sign(b"secret", datagram)
+    assert verify(b"secret", signed) == datagram
+    assert verify(b"other", signed) is None
+    assert verify(b"secret", signed[:-1] + bytes([signed[-1] ^ 1])) is None
+
+
+@pytest.fixture
+def relay():
+    tank = Tank()
+    receiver = UdpStateReceiver(tank, ("127.0.0.1", 0))
+    threading.Thread(target=receiver.run, daemon=True).start()
+    yield tank, receiver
+    receiver.stop()
+
+
+def test_values_reach_the_relay(relay):
+    relay_tank, receiver = relay
+    tank = Tank()
+    sender = UdpStateSender(tank, receiver.address, keepalive=0.05)
+    threading.Thread(target=sender.run, daemon=True).start()
+    try:
+        tank.update(left=0.5, water=1)
+        assert wait_until(lambda: relay_tank.state.water == 1)
+        assert relay_tank.state.left == pytest.approx(0.5, abs=1 / 32767)
+        assert wait_until(lambda: sender.acks > 0)
+
+        # Once acknowledged, the changes are sent as deltas
+        tank.update(right=-0.5)
+        assert wait_until(lambda: relay_tank.state.right == pytest.approx(-0.5, abs=1 / 32767))
+        assert sender.keyframes < sender.sent
+        assert receiver.missing_base == 0
+    finally:
+        sender.stop()
+
+
+def test_unknown_base_is_answered_with_resync(relay):
+    _, receiver = relay
+    operator = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    operator.settimeout(2.0)
+    try:
+        operator.sendto(encode_delta(42, 5, 4, TankState(), TankState(left=1)), receiver.address)
+        answer = operator.recv(64)
+        assert answer == RESYNC.pack(KIND_RESYNC, 42)
+        assert receiver.missing_base == 1
+
+        operator.sendto(encode_delta(42, 6, 0, None, TankState(left=1)), receiver.address)
+        kind, session, seq, _ = ACK.unpack(operator.recv(64))
+        assert (kind, session, seq) == (KIND_ACK, 42, 6)
+    finally:
+        operator.close()
+
+
+def test_sender_bases_on_ack_and_restarts_on_resync():
+    relay_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    relay_socket.bind(("127.0.0.1", 0))
+    relay_socket.settimeout(2.0)
+    tank = Tank()
+    sender = UdpStateSender(tank, relay_socket.getsockname(), keepalive=0.05)
+    threading.Thread(target=sender.run, daemon=True).start()
+    try:
+        datagram, address = relay_socket.recvfrom(512)
+        session, seq, _, mask = unpack(datagram)
+        assert datagram[0] == KIND_DATA and mask & KEYFRAME
+
+        relay_socket.sendto(ACK.pack(KIND_ACK, session, seq, 0), address)
+        assert wait_until(lambda: sender.acks == 1)
+        datagram = relay_socket.recv(512)
+        assert not unpack(datagram)[3] & KEYFRAME
+        assert unpack(datagram)[2] == seq
+
+        relay_socket.sendto(RESYNC.pack(KIND_RESYNC, session), address)
+        while True:  # Skip the deltas sent before the RESYNC arrived
+            mask = unpack(relay_socket.recv(512))[3]
+            if mask & KEYFRAME:
+                break
+    finally:
+        sender.stop()
+        relay_socket.close()
+
+
+def test_other_hosts_are_rejected():
+    tank = Tank()
+    receiver = UdpStateReceiver(tank, ("127.0.0.1", 0), operator="127.0.0.2")
+    threading.Thread(target=receiver.run, daemon=True).start()
+    intruder = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    try:
+        intruder.sendto(encode_delta(1, 0, 0, None, TankState(left=1)), receiver.address)
+        assert wait_until(lambda: receiver.rejected == 1)
+        assert tank.state.left == 0
+    finally:
+        intruder.close()
+        receiver.stop()
@@ -0,0 +1,92 @@
+"""Tests of the FrameSlot and the decoders of view.video, reading from files instead of a camera."""
+
+import os
+
+import pytest
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+# pylint: disable=wrong-import-position
+from PySide6.QtCore import QBuffer, QByteArray, QIODevice
+from PySide6.QtGui import QColor, QGuiApplication, QImage
+
+from view.video import Frame, FrameSlot, MjpegDecoder, RawDecoder
+
+
+@pytest.fixture(scope="module", autouse=True)
+def application():
+    return QGuiApplication.instance() or QGuiApplication([])
+
+
+def jpeg(color: str, width: int = 16, height: int = 8) -> bytes:
+    image = QImage(width, height, QImage.Format.Format_RGB888)
+    image.fill(QColor(color))
+    data = QByteArray()
+    buffer = QBuffer(data)
+    buffer.open(QIODevice.OpenModeFlag.WriteOnly)
+    image.save(buffer, "JPEG")
+    return bytes(data)
+
+
+class ChunkedStream:
+    """A stream returning at most size bytes per read1(), like a slow socket."""
+    def __init__(self, data: bytes, size: int) -> None:
+        self.data = data
+        self.size = size
+
+    def read1(self, _: int) -> bytes:
+        chunk, self.data = self.data[:self.size], self.data[self.size:]
+        return chunk
+
+
+def test_slot_keeps_the_newest_frame():
+    slot = FrameSlot()
+    first, second = (Frame(QImage(), None, number, 0.0) for number in (1, 2))
+
+    assert slot.put(first)
+    assert not slot.put(second)
+    assert slot.dropped == 1
+    assert slot.take().number == 2
+    assert slot.take() is None
+    assert slot.put(first)
+
+
+def test_mjpeg_images_between_other_bytes(tmp_path):
+    path = tmp_path / "stream.mjpeg"
+    boundary = b"\r\n--frame\r\nContent-Type: image/jpeg\r\n\r\n"
+    path.write_bytes(b"garbage" + boundary + jpeg("red") + boundary + jpeg("blue", 32, 4) + b"\xff")
+
+    with open(path, "rb") as stream:
+        images = [image for image, buffer in MjpegDecoder(newest_only=False).frames(stream)]
+    assert [(image.width(), image.height()) for image in images] == [(16, 8), (32, 4)]
+    assert images[0].pixelColor(8, 4).red() > 200
+    assert images[1].pixelColor(8, 2).blue() > 200
+
+
+def test_mjpeg_decodes_only_the_newest_image_of_a_read(tmp_path):
+    path = tmp_path / "stream.mjpeg"
+    path.write_bytes(jpeg("red") + jpeg("green") + jpeg("blue"))
+
+    with open(path, "rb") as stream:
+        images = [image for image, _ in MjpegDecoder().frames(stream)]
+    assert len(images) == 1
+    assert images[0].pixelColor(8, 4).blue() > 200
+
+
+def test_mjpeg_image_split_between_reads():
+    data = jpeg("red") + jpeg("blue")
+    images = [image for image, _ in MjpegDecoder().frames(ChunkedStream(data, 7))]
+    assert len(images) == 2
+
+
+def test_raw_frames_share_their_buffers(tmp_path):
+    path = tmp_path / "stream.gray"
+    path.write_bytes(bytes(range(12)) + bytes([200] * 12) + bytes(5))
+
+    with open(path, "rb") as stream:
+        frames = list(RawDecoder(4, 3, "gray").frames(stream))
+    assert len(frames) == 2  # The incomplete frame at the end is dropped
+    image, buffer = frames[0]
+    assert buffer == bytearray(range(12))
+    assert image.pixelColor(1, 2).red() == 9
+    assert frames[1][0].pixelColor(3, 2).red() == 200
@@ -0,0 +1,106 @@
+"""Tests of model.watchdog, checked at given times with counters the tests advance themselves."""
+
+from types import SimpleNamespace
+
+import pytest
+
+from model import watchdog as watchdog_module
+from model.tank import Tank
+from model.watchdog import Watchdog
+
+
+class Counter:
+    """A stage counter advanced by the test."""
+    def __init__(self) -> None:
+        self.value = 0
+
+    def __call__(self) -> int:
+        return self.value
+
+    def advance(self) -> None:
+        self.value += 1
+
+
+@pytest.fixture(autouse=True)
+def fixture_clock(monkeypatch):
+    """Watch the stages from time 0, the checks get their time explicitly."""
+    monkeypatch.setattr(watchdog_module, "time", SimpleNamespace(monotonic=lambda: 0.0))
+
+
+@pytest.fixture(name="tank")
+def fixture_tank():
+    tank = Tank()
+    tank.update(left=0.8, right=-0.4, water=1)
+    return tank
+
+
+def make_watchdog(tank, statuses=None):
+    watchdog = Watchdog([tank], ramp=0.2, on_status=None if statuses is None else statuses.append)
+    gamepad, serial = Counter(), Counter()
+    watchdog.watch("gamepad", gamepad, timeout=0.3)
+    watchdog.watch("serial", serial, timeout=0.3, trips=False)
+    return watchdog, gamepad, serial
+
+
+def test_progress_keeps_it_released(tank):
+    watchdog, gamepad, _ = make_watchdog(tank)
+    for step in range(1, 10):
+        gamepad.advance()
+        watchdog.check(now=step * 0.1)
+    assert watchdog.tripped is None
+    assert (tank.left, tank.right, tank.water) == (0.8, -0.4, 1)
+
+
+def test_stall_trips_and_ramps_down(tank):
+    statuses = []
+    watchdog, _, _ = make_watchdog(tank, statuses)
+
+    watchdog.check(now=0.3)
+    assert watchdog.tripped is None  # Stalled only after more than the timeout
+
+    watchdog.check(now=0.35)
+    assert watchdog.tripped == "gamepad"
+    assert watchdog.trips == 1
+    assert tank.water == 0
+    assert statuses == ["failsafe: gamepad stalled, stopping"]
+    assert (tank.left, tank.right) == (0.8, -0.4)
+
+    watchdog.check(now=0.45)
+    assert tank.left == pytest.approx(0.4)
+    assert tank.right == pytest.approx(-0.2)
+
+    watchdog.check(now=0.6)
+    assert (tank.left, tank.right) == (0.0, 0.0)
+    tank.update(left=0.5)
+    watchdog.check(now=0.7)
+    assert tank.left == 0.5  # Still tripped, but the ramp is over
+
+
+def test_release_completes_the_ramp(tank):
+    statuses = []
+    watchdog, gamepad, _ = make_watchdog(tank, statuses)
+    watchdog.check(now=0.35)
+
+    gamepad.advance()
+    watchdog.check(now=0.45)
+    assert watchdog.tripped is None
+    assert statuses[-1] == "failsafe ok, 1 trip"
+    assert tank.left == pytest.approx(0.4)
+
+    watchdog.check(now=0.55)
+    assert (tank.left, tank.right) == (0.0, 0.0)
+    assert watchdog.stats() == {"trips": 1, "gamepad_stalls": 1, "serial_stalls": 0}
+
+
+def test_stages_that_do_not_trip_are_only_counted(tank):
+    watchdog, gamepad, serial = make_watchdog(tank)
+    gamepad.advance()
+    watchdog.check(now=0.2)
+    gamepad.advance()
+    watchdog.check(now=0.4)
+    assert watchdog.tripped is None
+
+    serial.advance()
+    watchdog.check(now=0.5)
+    assert watchdog.stats()["serial_stalls"] == 1
+    assert tank.left == 0.8
@@ -0,0 +1,117 @@
+"""Cache for the pre-rendered layers of custom widgets.
+
+The static parts of a widget, e.g. the boundary circle of a joystick, are
+painted once into a pixmap at the device pixel ratio of the screen. The
+pixmap is painted again only when the size of the widget, its device pixel
+ratio or the given parameters change, so a paintEvent only copies it and
+draws the moving parts on top. The moving handles are antialiased sprites
+rendered once per size and color, which are cheaper to copy than to draw.
+
+Example usage:
+    self.background = BackgroundCache(self._paint_background)
+    ...
+    painter.drawPixmap(0, 0, self.background.pixmap(self, self.radius))
+    painter.drawPixmap(top_left, circle_sprite(20, color.rgba(), self.devicePixelRatioF()))
+"""
+
+from functools import lru_cache
+from typing import Callable, Optional, Tuple
+
+from PySide6.QtCore import QEvent, QPointF, QRectF, Qt
+from PySide6.QtGui import QColor, QPainter, QPixmap
+from PySide6.QtWidgets import QWidget
+
+
+class BackgroundCache:
+    """Pixmap of the static layers of a widget, painted again only when needed.
+
+    Attributes:
+        paint: The function painting the static layers with an antialiased QPainter.
+    """
+    def __init__(self, paint: Callable[[QPainter], None]) -> None:
+        """Initializes an empty cache.
+
+        Args:
+            paint (Callable[[QPainter], None]): The function painting the static layers
+                in the coordinates of the widget.
+        """
+        self.paint = paint
+        self._pixmap: Optional[QPixmap] = None
+        self._key: Optional[Tuple] = None
+
+    def invalidate(self) -> None:
+        """Paint the static layers again at the next use, e.g. after the palette changed."""
+        self._key = None
+
+    def change_event(self, event: QEvent) -> None:
+        """Invalidate the cache if the event of the widget changed its palette or style.
+
+        Args:
+            event (QEvent): The event passed to changeEvent() of the widget.
+        """
+        if event.type() in (QEvent.Type.PaletteChange, QEvent.Type.StyleChange):
+            self.invalidate()
+
+    def pixmap(self, widget: QWidget, *parameters) -> QPixmap:
+        """Get the pixmap of the static layers.
+
+        Args:
+            widget (QWidget): The widget the layers belong to.
+            *parameters: Values the layers depend on besides the size of the widget.
+
+        Returns:
+            QPixmap: The pixmap of the size of the widget.
+        """
+        ratio = widget.devicePixelRatioF()
+        key = (widget.width(), widget.height(), ratio) + parameters
+        if key != self._key:
+            pixmap = QPixmap(round(widget.width() * ratio), round(widget.height() * ratio))
+            pixmap.setDevicePixelRatio(ratio)
+            # An opaque pixmap is copied without blending
+            pixmap.fill(widget.palette().window().color())
+            painter = QPainter(pixmap)
+            painter.setRenderHint(QPainter.RenderHint.Antialiasing, True)
+            self.paint(painter)
+            painter.end()
+            self._pixmap = pixmap
+            self._key = key
+        return self._pixmap
+
+
+def paint_boundary(painter: QPainter, center: QPointF, radius: float) -> None:
+    """Draw the boundary circle of a joystick widget.
+
+    Args:
+        painter (QPainter): The painter of the background.
+        center (QPointF): The center of the circle.
+        radius (float): The radius of the circle.
+    """
+    painter.drawEllipse(QRectF(-radius, -radius, radius * 2, radius * 2).translated(center))
+
+
+# Margin around a sprite for the outline drawn centered on the edge of the circle
+SPRITE_MARGIN = 1
+
+
+@lru_cache(maxsize=16)
+def circle_sprite(radius: float, rgba: int, ratio: float) -> QPixmap:
+    """Render an antialiased circle with the default outline and the given fill.
+
+    Args:
+        radius (float): The radius of the circle.
+        rgba (int): The fill color as returned by QColor.rgba().
+        ratio (float): The device pixel ratio of the screen.
+
+    Returns:
+        QPixmap: The transparent sprite, the circle starts SPRITE_MARGIN from its top left corner.
+    """
+    size = 2 * (radius + SPRITE_MARGIN)
+    pixmap = QPixmap(round(size * ratio), round(size * ratio))
+    pixmap.setDevicePixelRatio(ratio)
+    pixmap.fill(Qt.GlobalColor.transparent)
+    painter = QPainter(pixmap)
+    painter.setRenderHint(QPainter.RenderHint.Antialiasing, True)
+    painter.setBrush(QColor.fromRgba(rgba))
+    painter.drawEllipse(QRectF(SPRITE_MARGIN, SPRITE_MARGIN, 2 * radius, 2 * radius))
+    painter.end()
+    return pixmap
@@ -16,6 +16,10 @@ from PySide6.QtCore import QPointF, QRectF
 from PySide6.QtWidgets import QWidget
 from PySide6.QtGui import QColor
 
+from view.background_cache import SPRITE_MARGIN, BackgroundCache, circle_sprite, paint_boundary
+
+HANDLE_COLOR = QColor(255, 0, 0, 127)
+
 
 class QJoystick(QWidget):
     """Custom Qt Widget for Joystick Control.
@@ -28,6 +32,7 @@ class QJoystick(QWidget):
         handle_x (int): represents the x-coordinate of the joystick handle.
         handle_y (int): represents the y-coordinate of the joystick handle.
         handle_coords (QPointF): represents the coordinates of the joystick handle.
+        background (BackgroundCache): caches the boundary of the joystick.
     """
     def __init__(self, parent: Optional[QWidget] = None) -> None:
         """Initializes the QJoystick widget.
@@ -46,14 +51,22 @@ class QJoystick(QWidget):
 
         self.handle_coords = QPointF(0, 0)
 
+        self.background = BackgroundCache(self._paint_background)
+
     def paintEvent(self, event) -> None:  # pylint: disable=unused-argument
         """Paint event handler to draw the joystick widget."""
         painter = QPainter(self)
-        bounds = QRectF(-self.radius, -self.radius, self.radius * 2,
-                        self.radius * 2).translated(self._center())
-        painter.drawEllipse(bounds)
-        painter.setBrush(QColor(255, 0, 0, 127))
-        painter.drawEllipse(self.handle())
+        painter.drawPixmap(0, 0, self.background.pixmap(self, self.radius))
+        sprite = circle_sprite(self.handle_radius, HANDLE_COLOR.rgba(), self.devicePixelRatioF())
+        painter.drawPixmap(self.handle().topLeft() - QPointF(SPRITE_MARGIN, SPRITE_MARGIN), sprite)
+
+    def changeEvent(self, event) -> None:  # pylint: disable=missing-function-docstring
+        self.background.change_event(event)
+        super().changeEvent(event)
+
+    def _paint_background(self, painter: QPainter) -> None:
+        """Draw the static boundary circle."""
+        paint_boundary(painter, self._center(), self.radius)
 
     def get_distance(self) -> QPointF:
         """Calculate the distance between the handle and the center.
@@ -17,6 +17,10 @@ from PySide6.QtCore import QRectF, QPointF
 from PySide6.QtWidgets import QWidget
 from PySide6.QtGui import QColor
 
+from view.background_cache import SPRITE_MARGIN, BackgroundCache, circle_sprite, paint_boundary
+
+HANDLE_COLOR = QColor(255, 0, 0, 127)
+
 
 def cartesian_to_polar(x: float, y: float) -> Tuple[float, float]:
     """Convert Cartesian coordinates to polar coordinates.
@@ -58,6 +62,7 @@ class RotationWidget(QWidget):
         joystick_y: An int representing the y-coordinate of the joystick.
         radius: An int representing the radius of the rotation control area.
         pointer_radius: An int representing the radius of the rotation control pointer.
+        background: A BackgroundCache of the boundary circle.
     """
 
     def __init__(self, parent: Optional[QWidget] = None) -> None:
@@ -73,17 +78,26 @@ class RotationWidget(QWidget):
         self.radius = 50
         self.pointer_radius = 10
 
+        # Direction of the pointer from the center as a unit vector in screen coordinates
+        self._direction = QPointF(1, 0)
+
+        self.background = BackgroundCache(self._paint_background)
+
     def paintEvent(self, event) -> None:  # pylint: disable=unused-argument
         """Paint event handler to draw the joystick widget."""
         painter = QPainter(self)
-        painter.setRenderHint(QPainter.Antialiasing, True)
+        painter.drawPixmap(0, 0, self.background.pixmap(self, self.radius))
+
+        sprite = circle_sprite(self.pointer_radius / 2, HANDLE_COLOR.rgba(), self.devicePixelRatioF())
+        painter.drawPixmap(self.pointer().topLeft() - QPointF(SPRITE_MARGIN, SPRITE_MARGIN), sprite)
 
-        bounds = QRectF(-self.radius, -self.radius, self.radius * 2,
-                        self.radius * 2).translated(self._center())
-        painter.drawEllipse(bounds)
+    def changeEvent(self, event) -> None:  # pylint: disable=missing-function-docstring
+        self.background.change_event(event)
+        super().changeEvent(event)
 
-        painter.setBrush(QColor(255, 0, 0, 127))
-        painter.drawEllipse(self.pointer())
+    def _paint_background(self, painter: QPainter) -> None:
+        """Draw the static boundary circle."""
+        paint_boundary(painter, self._center(), self.radius)
 
     def _center(self) -> QPointF:
         """Calculate the center point of the widget.
@@ -99,12 +113,9 @@ class RotationWidget(QWidget):
         Returns:
             QRectF: The area of the rotation control pointer.
         """
-        # Calculate the angle from the joystick position
-        _, theta = cartesian_to_polar(self.joystick_x, self.joystick_y)
-        # Use the angle and y-coordinate to find the position on the circle's edge
-        x, y = polar_to_cartesian(self.radius, theta)
+        center = self._center() + self._direction * self.radius
         return QRectF(-self.pointer_radius / 2, -self.pointer_radius / 2,
-                      self.pointer_radius, self.pointer_radius).translated(self._center() + QPointF(x, -y))
+                      self.pointer_radius, self.pointer_radius).translated(center)
 
     def set_joystick_position(self, x: float, y: float) -> None:
         """Set the position of the joystick pointer.
@@ -115,4 +126,8 @@ class RotationWidget(QWidget):
         """
         self.joystick_x = x
         self.joystick_y = y
+
+        # Unit vector towards the joystick, pointing right when centred like atan2(0, 0) does
+        length = math.hypot(x, y)
+        self._direction = QPointF(x / length, -y / length) if length else QPointF(1, 0)
         self.update()
@@ -0,0 +1,416 @@
+"""Live camera feed shown in the monitor area of the window.
+
+A VideoStream reads a byte stream from a source and decodes it into
+frames in a worker thread, so neither the reading nor the decoding ever
+runs in the GUI thread, which also applies the gamepad inputs:
+
+    tcp://HOST:PORT   a TCP connection, reconnected when it drops
+    PATH              a file or a named pipe, "-" for the standard input
+
+The stream is either MJPEG, JPEG images one after another as sent by most
+cameras (the parts of a multipart HTTP stream are found as well), or raw
+frames of a fixed size, e.g. "rgb24:640x480" as written by
+ffmpeg -f rawvideo -pix_fmt rgb24.
+
+The worker hands the frames over in a FrameSlot that holds the newest frame
+only. A frame that was not shown before the next one arrived is dropped,
+so a slow GUI never makes the video lag behind. The VideoWidget repaints
+only when a new frame arrived. Raw frames are read into their own buffer
+which the QImage uses directly, and of MJPEG only the newest complete
+image in the input is decoded.
+
+Typical usage:
+
+    stream = VideoStream("tcp://camera.local:5000")
+    window.monitor.set_stream(stream)
+    stream.start()
+"""
+
+import os
+import socket
+import sys
+import threading
+import time
+from typing import BinaryIO, Iterator, NamedTuple, Optional, Tuple
+
+from PySide6.QtCore import QObject, QRectF, Qt, Signal
+from PySide6.QtGui import QColor, QImage, QPainter
+from PySide6.QtWidgets import QWidget
+
+VIDEO_FORMAT_MJPEG = "mjpeg"
+RAW_FORMATS = {
+    "rgb24": (QImage.Format.Format_RGB888, 3),
+    "rgba": (QImage.Format.Format_RGBA8888, 4),
+    "gray": (QImage.Format.Format_Grayscale8, 1),
+}
+
+JPEG_START = b"\xff\xd8"
+JPEG_END = b"\xff\xd9"
+READ_SIZE = 1 << 16
+# Longest JPEG image accepted before the input is considered garbage
+MAX_JPEG_SIZE = 1 << 24
+RECONNECT_INTERVAL = 1.0
+
+
+class Frame(NamedTuple):
+    """A decoded video frame.
+
+    Attributes:
+        image: The QImage of the frame.
+        buffer: The buffer the image uses, kept alive together with it, None if the image owns its data.
+        number: The number of the frame in the stream.
+        received: The monotonic time the frame was complete.
+    """
+    image: QImage
+    buffer: Optional[bytearray]
+    number: int
+    received: float
+
+
+class FrameSlot:
+    """Holds the newest frame until the GUI takes it.
+
+    Attributes:
+        dropped: The number of frames replaced before they were taken.
+    """
+    def __init__(self) -> None:
+        """Initializes an empty slot."""
+        self._frame: Optional[Frame] = None
+        self._lock = threading.Lock()
+        self.dropped = 0
+
+    def put(self, frame: Frame) -> bool:
+        """Replace the frame in the slot.
+
+        Args:
+            frame (Frame): The new frame.
+
+        Returns:
+            bool: True if the slot was empty, i.e. the GUI has to be told about the frame.
+        """
+        with self._lock:
+            was_empty = self._frame is None
+            if not was_empty:
+                self.dropped += 1
+            self._frame = frame
+        return was_empty
+
+    def take(self) -> Optional[Frame]:
+        """Remove the frame from the slot.
+
+        Returns:
+            Optional[Frame]: The newest frame, None if there is no new one.
+        """
+        with self._lock:
+            frame = self._frame
+            self._frame = None
+        return frame
+
+
+def parse_video_format(text: str):
+    """Create the decoder of a video format.
+
+    Args:
+        text (str): "mjpeg" or a raw format like "rgb24:640x480", see RAW_FORMATS.
+
+    Returns:
+        MjpegDecoder or RawDecoder: The decoder.
+
+    Raises:
+        ValueError: If the format is unknown.
+    """
+    if text == VIDEO_FORMAT_MJPEG:
+        return MjpegDecoder()
+    pixel_format, _, size = text.partition(":")
+    width, _, height = size.partition("x")
+    if pixel_format not in RAW_FORMATS or not width.isdigit() or not height.isdigit():
+        raise ValueError(f"Unknown video format {text}, use mjpeg or e.g. rgb24:640x480")
+    return RawDecoder(int(width), int(height), pixel_format)
+
+
+class MjpegDecoder:
+    """Splits a byte stream into JPEG images and decodes them.
+
+    Attributes:
+        newest_only: Whether only the newest of the images read at once is decoded.
+    """
+    def __init__(self, newest_only: bool = True) -> None:
+        """Initializes the decoder.
+
+        Args:
+            newest_only (bool): Whether to skip the images followed by a newer one in the same read,
+                which are outdated already when reading a live source.
+        """
+        self.newest_only = newest_only
+
+    def frames(self, stream: BinaryIO) -> Iterator[Tuple[QImage, Optional[bytearray]]]:
+        """Decode the images of a stream.
+
+        Args:
+            stream (BinaryIO): The stream, read with read1() so no more is waited for than available.
+
+        Yields:
+            Tuple[QImage, Optional[bytearray]]: The decoded images and no buffer.
+        """
+        data = bytearray()
+        while True:
+            chunk = stream.read1(READ_SIZE)
+            if not chunk:
+                return
+            data += chunk
+
+            images = []
+            while True:
+                start = data.find(JPEG_START)
+                if start < 0:
+                    del data[:-1]  # Keep a byte in case the marker is split between two reads
+                    break
+                end = data.find(JPEG_END, start + len(JPEG_START))
+                if end < 0:
+                    del data[:start]
+                    if len(data) > MAX_JPEG_SIZE:
+                        data.clear()
+                    break
+                end += len(JPEG_END)
+                images.append(bytes(data[start:end]))
+                del data[:end]
+
+            for jpeg in images[-1:] if self.newest_only else images:
+                image = QImage.fromData(jpeg, "JPEG")
+                if not image.isNull():
+                    yield image, None
+
+
+class RawDecoder:
+    """Reads raw frames of a fixed size into QImages sharing their buffers.
+
+    Attributes:
+        width: The width of the frames in pixels.
+        height: The height of the frames in pixels.
+        image_format: The QImage.Format of the pixels.
+        frame_size: The number of bytes of a frame.
+    """
+    def __init__(self, width: int, height: int, pixel_format: str = "rgb24") -> None:
+        """Initializes the decoder.
+
+        Args:
+            width (int): The width of the frames in pixels.
+            height (int): The height of the frames in pixels.
+            pixel_format (str): The name of the pixel format, see RAW_FORMATS.
+        """
+        self.width = width
+        self.height = height
+        self.image_format, self._bytes_per_pixel = RAW_FORMATS[pixel_format]
+        self.frame_size = width * height * self._bytes_per_pixel
+
+    def frames(self, stream: BinaryIO) -> Iterator[Tuple[QImage, Optional[bytearray]]]:
+        """Read the frames of a stream.
+
+        Args:
+            stream (BinaryIO): The stream.
+
+        Yields:
+            Tuple[QImage, Optional[bytearray]]: Every frame and the buffer its image uses.
+        """
+        while True:
+            # A new buffer per frame, the previous one may still be shown
+            buffer = bytearray(self.frame_size)
+            view = memoryview(buffer)
+            filled = 0
+            while filled < self.frame_size:
+                count = stream.readinto(view[filled:])
+                if not count:
+                    return
+                filled += count
+            view.release()
+            yield QImage(buffer, self.width, self.height, self.width * self._bytes_per_pixel,
+                         self.image_format), buffer
+
+
+class VideoStream(QObject):
+    """Reads and decodes a video source in a worker thread.
+
+    Attributes:
+        frameReady: A signal emitted when the slot received a frame while it was empty.
+        statusChanged: A signal emitted with a description of the state of the stream.
+        source: The source, see the module description.
+        decoder: The MjpegDecoder or RawDecoder of the stream.
+        rate: The maximum number of frames per second read, used to play files in real time.
+        slot: The FrameSlot the frames are handed over in.
+        frames: The number of frames decoded.
+    """
+    frameReady = Signal()
+    statusChanged = Signal(str)
+
+    def __init__(self, source: str, video_format: str = VIDEO_FORMAT_MJPEG, rate: Optional[float] = None) -> None:
+        """Initializes the stream, reading is started by start().
+
+        Args:
+            source (str): The source, e.g. "tcp://127.0.0.1:5000" or a path.
+            video_format (str): The format of the stream, see parse_video_format().
+            rate (Optional[float]): The maximum frame rate, None to read as fast as the source delivers.
+
+        Raises:
+            ValueError: If the format is unknown.
+        """
+        super().__init__()
+        self.source = source
+        self.decoder = parse_video_format(video_format)
+        self.rate = rate
+        if isinstance(self.decoder, MjpegDecoder):
+            # A paced source, e.g. a file, is read ahead of time, so its images are not outdated
+            self.decoder.newest_only = rate is None
+        self.slot = FrameSlot()
+        self.frames = 0
+        self._stopped = threading.Event()
+        self._socket: Optional[socket.socket] = None
+        self._thread = threading.Thread(target=self._run, name="video", daemon=True)
+
+    def start(self) -> None:
+        """Start reading in the worker thread."""
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Stop reading, a blocked TCP read is woken up."""
+        self._stopped.set()
+        connection = self._socket
+        if connection is not None:
+            try:
+                connection.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+    def _open(self) -> BinaryIO:
+        if self.source.startswith("tcp://"):
+            host, _, port = self.source[len("tcp://"):].rpartition(":")
+            self._socket = socket.create_connection((host, int(port)), timeout=RECONNECT_INTERVAL)
+            self._socket.settimeout(None)
+            return self._socket.makefile("rb")
+        if self.source == "-":
+            return os.fdopen(os.dup(sys.stdin.fileno()), "rb")
+        return open(self.source, "rb")  # pylint: disable=consider-using-with
+
+    def _run(self) -> None:
+        """Read the source until it ends, reconnecting TCP sources. Runs inside a thread."""
+        reconnect = self.source.startswith("tcp://")
+        while not self._stopped.is_set():
+            try:
+                stream = self._open()
+            except (OSError, ValueError) as error:
+                self.statusChanged.emit(f"no video: {error}")
+                if not reconnect or self._stopped.wait(RECONNECT_INTERVAL):
+                    return
+                continue
+
+            self.statusChanged.emit(f"video from {self.source}")
+            try:
+                self._read(stream)
+            except OSError as error:
+                self.statusChanged.emit(f"video lost: {error}")
+            finally:
+                stream.close()
+                if self._socket is not None:
+                    self._socket.close()
+                    self._socket = None
+
+            if not reconnect or self._stopped.wait(RECONNECT_INTERVAL):
+                break
+        self.statusChanged.emit("video ended")
+
+    def _read(self, stream: BinaryIO) -> None:
+        min_interval = 1 / self.rate if self.rate else 0.0
+        last_frame = -min_interval
+        for image, buffer in self.decoder.frames(stream):
+            if self._stopped.is_set():
+                return
+            delay = last_frame + min_interval - time.monotonic()
+            if delay > 0 and self._stopped.wait(delay):
+                return
+            last_frame = time.monotonic()
+            self.frames += 1
+            if self.slot.put(Frame(image, buffer, self.frames, last_frame)):
+                self.frameReady.emit()
+
+
+class VideoWidget(QWidget):
+    """Shows the newest frame of a VideoStream, keeping its aspect ratio.
+
+    Attributes:
+        stream: The shown VideoStream, None before set_stream().
+        frame: The frame currently shown.
+        shown: The number of frames painted.
+        status: The text shown while there is no frame.
+    """
+    def __init__(self, parent: Optional[QWidget] = None) -> None:
+        """Initializes the widget without a stream.
+
+        Args:
+            parent (Optional[QWidget]): The parent widget.
+        """
+        super().__init__(parent)
+        self.stream: Optional[VideoStream] = None
+        self.frame: Optional[Frame] = None
+        self.shown = 0
+        self.status = "no video"
+        # Every pixel is painted, so Qt does not need to clear the background first
+        self.setAttribute(Qt.WidgetAttribute.WA_OpaquePaintEvent)
+
+    def set_stream(self, stream: VideoStream) -> None:
+        """Show the frames of a stream.
+
+        Args:
+            stream (VideoStream): The stream, its signals are delivered to the GUI thread.
+        """
+        self.stream = stream
+        # Queued, the worker only posts the event and never waits for the GUI
+        stream.frameReady.connect(self.update, Qt.ConnectionType.QueuedConnection)
+        stream.statusChanged.connect(self.set_status, Qt.ConnectionType.QueuedConnection)
+
+    def set_status(self, text: str) -> None:
+        """Show a text while there is no frame, e.g. why the video is missing.
+
+        Args:
+            text (str): The text.
+        """
+        self.status = text
+        if self.frame is None:
+            self.update()
+
+    def dropped(self) -> int:
+        """Get the number of frames that were never shown.
+
+        Returns:
+            int: The frames replaced in the slot of the stream before they were painted.
+        """
+        return self.stream.slot.dropped if self.stream is not None else 0
+
+    def status_line(self) -> str:
+        """Get a one line summary of the video for the status bar.
+
+        Returns:
+            str: The frames shown and dropped, empty without a stream.
+        """
+        if self.stream is None:
+            return ""
+        return f"video {self.shown} shown, {self.dropped()} dropped"
+
+    def paintEvent(self, event) -> None:  # pylint: disable=unused-argument
+        """Paint the newest frame, or the status text if there is none."""
+        if self.stream is not None:
+            frame = self.stream.slot.take()
+            if frame is not None:
+                self.frame = frame
+                self.shown += 1
+
+        painter = QPainter(self)
+        painter.fillRect(self.rect(), QColor(Qt.GlobalColor.black))
+        if self.frame is None:
+            painter.setPen(QColor(Qt.GlobalColor.lightGray))
+            painter.drawText(self.rect(), Qt.AlignmentFlag.AlignCenter, self.status)
+            return
+
+        image = self.frame.image
+        scale = min(self.width() / image.width(), self.height() / image.height())
+        width = image.width() * scale
+        height = image.height() * scale
+        painter.drawImage(QRectF((self.width() - width) / 2, (self.height() - height) / 2, width, height), image)
@@ -0,0 +1,35 @@
+"""Immutable snapshot of everything the window shows.
+
+The controller builds a new ViewState whenever an input changes and hands
+it to the Window, which compares it with the last rendered one at its next
+refresh and updates only the widgets whose values differ.
+
+Typical usage:
+
+    state = ViewState()
+    state = state._replace(drive=(x, y))
+    window.show_state(state)
+"""
+
+from typing import NamedTuple, Tuple
+
+from model.link import LINK_DISCONNECTED
+
+
+class ViewState(NamedTuple):
+    """State shown by the window.
+
+    Attributes:
+        drive: The position (x, y) of the driving stick, each in [-1, 1].
+        tower: The position (x, y) of the tower stick, each in [-1, 1].
+        water: Whether water is being shot.
+        light: Whether the light is on.
+        link: The status of the connection to the antenna.
+        vehicle: The address of the tank driven by the gamepad.
+    """
+    drive: Tuple[float, float] = (0.0, 0.0)
+    tower: Tuple[float, float] = (0.0, 0.0)
+    water: int = 0
+    light: int = 0
+    link: str = LINK_DISCONNECTED
+    vehicle: int = 0
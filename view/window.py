@@ -4,15 +4,19 @@ Contains the main application window class and related widgets.
 """
 
 from functools import partial
+from typing import List, Optional
 
 from PySide6 import QtCore
-from PySide6.QtCore import Qt
-from PySide6.QtWidgets import QMainWindow, QPushButton, QWidget, QHBoxLayout, QVBoxLayout, QMessageBox
+from PySide6.QtCore import Qt, QTimer
+from PySide6.QtWidgets import (QMainWindow, QPushButton, QWidget, QHBoxLayout, QVBoxLayout, QMessageBox, QLabel,
+                               QComboBox)
 
 from model.communication import SerialMessenger
 from view.custom_dialog import CustomDialog
 from view.joystick import QJoystick
 from view.rotation_widget import RotationWidget
+from view.video import VideoWidget
+from view.view_state import ViewState
 
 
 class Window(QMainWindow):
@@ -22,46 +26,90 @@ class Window(QMainWindow):
     The View in the MVC. Manages all widgets and all GUI operations.
 
     Attributes:
-        monitor: A QWidget representing the monitoring widget.
+        monitor: A VideoWidget showing the camera feed of the tank.
         joystick: A QJoystick instance representing the joystick widget.
         rotation_widget: A RotationWidget instance representing the rotation control widget.
-        button_water: A QPushButton for water control.
-        button_light: A QPushButton for light control.
+        button_water: A checkable QPushButton showing whether water is being shot.
+        button_light: A checkable QPushButton showing whether the light is on.
+        link_label: A QLabel in the status bar showing the status of the connection.
+        tank_selector: A QComboBox in the status bar choosing the tank driven by the gamepad.
         selected_port: The selected port from the dialog for serial communication.
-        controls_functions: A dictionary mapping control signals to corresponding functions.
+        refresh_timer: A QTimer rendering the latest ViewState at the refresh rate.
     """
 
-    def __init__(self) -> None:
-        """Initializes the window instance and all graphic layouts."""
+    DEFAULT_REFRESH_RATE = 60.0
+
+    def __init__(self, refresh_rate: float = DEFAULT_REFRESH_RATE) -> None:
+        """Initializes the window instance and all graphic layouts.
+
+        Args:
+            refresh_rate (float): The maximum number of GUI refreshes per second (default is 60).
+        """
         super().__init__()
         self.setWindowTitle("FKF App")
         self.setFixedSize(600, 400)
 
-        self.monitor = QWidget()
+        self.monitor = VideoWidget()
         self.joystick = QJoystick()
         self.rotation_widget = RotationWidget()
 
         self.button_water = QPushButton()
         self.button_light = QPushButton()
+        self.link_label = QLabel()
+        self.tank_selector = QComboBox()
 
         self._setup_layout()
 
         self.selected_port = None
 
-        self.controls_functions = {
-            "right_joystick": self.rotation_widget.set_joystick_position,
-            "left_joystick": self.joystick.set_joystick_position,
-            "button_water": self.button_water.animateClick,
-            "button_light": self.button_light.animateClick
-        }
+        # Latest state handed over since the last refresh and the state currently shown
+        self._pending: Optional[ViewState] = None
+        self._rendered = ViewState()
+        self.link_label.setText(self._rendered.link)
 
-    def handle_port_selection_dialog(self) -> str:
+        self.refresh_timer = QTimer(self)
+        self.refresh_timer.setTimerType(Qt.TimerType.PreciseTimer)
+        self.refresh_timer.timeout.connect(self.refresh)
+        self.set_refresh_rate(refresh_rate)
+
+    def set_tanks(self, names: List[str]) -> None:
+        """Offer the tanks to choose from, the selector is only shown for more than one.
+
+        Args:
+            names (List[str]): The names of the tanks in the order of their addresses.
+        """
+        self.tank_selector.blockSignals(True)
+        self.tank_selector.clear()
+        self.tank_selector.addItems(names)
+        self.tank_selector.setCurrentIndex(self._rendered.vehicle)
+        self.tank_selector.blockSignals(False)
+        self.tank_selector.setVisible(len(names) > 1)
+
+    def set_refresh_rate(self, refresh_rate: float) -> None:
+        """Set the maximum number of GUI refreshes per second.
+
+        Args:
+            refresh_rate (float): The refresh rate in Hz.
+
+        Raises:
+            ValueError: If the refresh rate is not positive.
+        """
+        if refresh_rate <= 0:
+            raise ValueError("Refresh rate should be positive")
+        self.refresh_timer.setInterval(max(1, round(1000 / refresh_rate)))
+
+    def handle_port_selection_dialog(self, ports: Optional[List[str]] = None) -> str:
         """Handle the port selection dialog.
 
+        Args:
+            ports (Optional[List[str]]): The ports to choose from, all available ports by default.
+
         Returns:
             str: The selected port for serial communication.
         """
-        dlg = CustomDialog([""] + SerialMessenger.all_ports(), self)
+        if ports is None:
+            ports = SerialMessenger.all_ports()
+        dlg = CustomDialog([""] + ports, self)
         dlg.accepted.connect(partial(self.accepted_slot, dlg))
         dlg.rejected.connect(self.rejected_slot)
         dlg.exec()
@@ -82,6 +130,14 @@ class Window(QMainWindow):
             defaultButton=QMessageBox.Ok,
         )
 
+    def show_status(self, text: str) -> None:
+        """Show a message in the status bar of the window.
+
+        Args:
+            text (str): The message to show.
+        """
+        self.statusBar().showMessage(text)
+
     @QtCore.Slot(CustomDialog)
     def accepted_slot(self, dlg):  # pylint: disable=missing-function-docstring
         selected_option = dlg.get_selected_option()
@@ -105,6 +161,10 @@ class Window(QMainWindow):
         full_layout.addLayout(self._setup_monitor_layout())
         full_layout.addLayout(self._setup_controls_layout())
 
+        self.statusBar().addPermanentWidget(self.tank_selector)
+        self.statusBar().addPermanentWidget(self.link_label)
+        self.tank_selector.hide()
+
     def _setup_monitor_layout(self) -> QVBoxLayout:
         """Set up the layout for the monitor widget.
 
@@ -115,7 +175,6 @@ class Window(QMainWindow):
         monitor_layout.setAlignment(Qt.AlignmentFlag.AlignCenter)
 
         self.monitor.setFixedSize(300, 200)  # Set size of rectangular widget
-        self.monitor.setStyleSheet("background-color: gray; border: 1px solid black;")
 
         monitor_layout.addWidget(self.monitor)
 
@@ -149,6 +208,9 @@ class Window(QMainWindow):
         for button_name, width, height in button_data:
             button = QPushButton(button_name)
             button.setFixedSize(width, height)
+            # The buttons show the state of the tank, which is changed by the gamepad only
+            button.setCheckable(True)
+            button.setAttribute(Qt.WidgetAttribute.WA_TransparentForMouseEvents)
             button_grid.addWidget(button)
 
             # Add button as a member of the class
@@ -156,15 +218,44 @@ class Window(QMainWindow):
 
         return button_grid
 
-    def update_gui(self, element: str, x: float = 0, y: float = 0) -> None:
-        """Update the GUI based on the provided element and coordinates.
+    def show_state(self, state: ViewState) -> None:
+        """Hand over the state to show at the next refresh.
+
+        Only the latest state is rendered, the ones handed over in between are dropped.
 
         Args:
-            element (str): The element to update.
-            x (float): The x-coordinate.
-            y (float): The y-coordinate.
+            state (ViewState): The new state.
         """
-        if element in ("left_joystick", "right_joystick"):
-            self.controls_functions[element](x, y)
-        else:
-            self.controls_functions[element]()
+        if self._pending is None and not self.refresh_timer.isActive():
+            self.refresh_timer.start()
+        self._pending = state
+
+    @QtCore.Slot()
+    def refresh(self) -> None:
+        """Update the widgets whose values differ between the pending and the rendered state."""
+        state = self._pending
+        if state is None:
+            # Nothing changed during the last interval, sleep until the next update
+            self.refresh_timer.stop()
+            return
+        self._pending = None
+
+        rendered = self._rendered
+        if state is rendered:
+            return
+        if state.drive != rendered.drive:
+            self.joystick.set_joystick_position(*state.drive)
+        if state.tower != rendered.tower:
+            self.rotation_widget.set_joystick_position(*state.tower)
+        if state.water != rendered.water:
+            self.button_water.setChecked(bool(state.water))
+        if state.light != rendered.light:
+            self.button_light.setChecked(bool(state.light))
+        if state.link != rendered.link:
+            self.link_label.setText(state.link)
+        if state.vehicle != rendered.vehicle:
+            # Changed by the controller, not by the user, so no selection signal is emitted
+            self.tank_selector.blockSignals(True)
+            self.tank_selector.setCurrentIndex(state.vehicle)
+            self.tank_selector.blockSignals(False)
+        self._rendered = state